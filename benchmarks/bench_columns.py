@@ -0,0 +1,98 @@
+"""
+Benchmark the column layout used for the default (multi-column) output.
+
+Compares output.column_layout against the previous brute-force search
+(every column count for every name, summing column widths in the inner loop)
+and shows how both scale with the number of names and the terminal width.
+
+Usage:
+  uv run python benchmarks/bench_columns.py
+  uv run python benchmarks/bench_columns.py --sizes 1000,100000 --widths 80,400
+
+The brute-force version is skipped once n * cols^2 exceeds --naive-budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from pyls.output import column_layout
+
+
+def naive_column_layout(names: list[str], terminal_width: int) -> tuple[int, int, list[int]]:
+    max_cols = min(len(names), max(1, terminal_width // 3))
+    col_widths = {cols: [0] * cols for cols in range(1, max_cols + 1)}
+    valid = {cols: True for cols in range(1, max_cols + 1)}
+
+    for i, name in enumerate(names):
+        name_len = len(name)
+        for cols in range(1, max_cols + 1):
+            if not valid[cols]:
+                continue
+            rows = (len(names) + cols - 1) // cols
+            col = i // rows
+            col_widths[cols][col] = max(col_widths[cols][col], name_len + 2)
+            if sum(col_widths[cols]) - 2 > terminal_width:
+                valid[cols] = False
+
+    cols = max(c for c in range(1, max_cols + 1) if valid[c])
+    rows = (len(names) + cols - 1) // cols
+    return cols, rows, col_widths[cols]
+
+
+def make_names(n: int, seed: int = 0) -> list[str]:
+    """ファイル名っぽい長さ分布 (短い名前が多く、たまに長い名前が混ざる)"""
+    rng = random.Random(seed)
+    names = []
+    for i in range(n):
+        stem_len = min(int(rng.lognormvariate(2.0, 0.5)), 60)
+        names.append(f"{'f' * stem_len}_{i}.{rng.choice(['txt', 'py', 'o', 'json', 'tar.gz'])}")
+    return names
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--widths", default="80,200,400")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--naive-budget", type=float, default=2e8)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    widths = [int(w) for w in args.widths.split(",")]
+
+    print(f"{'n':>9} {'width':>6} {'cols':>5} {'layout ms':>10} {'ns/name':>8} {'naive ms':>10} {'speedup':>8}")
+    for n in sizes:
+        names = make_names(n)
+        for width in widths:
+            cols, _, _ = column_layout(names, width)
+            fast = best_of(lambda: column_layout(names, width), args.repeat)
+
+            max_cols = min(n, width // 3)
+            if n * max_cols * max_cols <= args.naive_budget:
+                assert naive_column_layout(names, width) == column_layout(names, width)
+                naive = best_of(lambda: naive_column_layout(names, width), 1)
+                naive_str = f"{naive * 1e3:10.1f}"
+                speedup = f"{naive / fast:7.0f}x"
+            else:
+                naive_str = f"{'skipped':>10}"
+                speedup = f"{'-':>8}"
+
+            print(f"{n:>9} {width:>6} {cols:>5} {fast * 1e3:10.2f} {fast / n * 1e9:8.0f} {naive_str} {speedup}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
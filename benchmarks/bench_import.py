@@ -0,0 +1,100 @@
+"""
+Benchmark pyls startup: import time of pyls.main and a full run on an empty directory.
+
+Runs `python -X importtime -c "import pyls.main"` in fresh interpreters and
+reports the cumulative import time of pyls.main (median and min over the
+runs), the modules with the largest self time, and the wall time of
+`python -m pyls` listing an empty directory.
+
+Bytecode caching is forced on for the children (PYTHONDONTWRITEBYTECODE is
+cleared), so the numbers match an installed pyls rather than a cold checkout.
+
+Usage:
+  uv run python benchmarks/bench_import.py
+  uv run python benchmarks/bench_import.py --runs 50 --top 15
+  uv run python benchmarks/bench_import.py --max-ms 40
+
+With --max-ms, the exit status is 1 if the median import time of pyls.main
+is above the budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+
+def child_env() -> dict[str, str]:
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def import_times(env: dict[str, str]) -> dict[str, tuple[int, int]]:
+    """-X importtime の出力から {モジュール: (self us, cumulative us)} を作る"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import pyls.main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def run_time(env: dict[str, str], directory: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "pyls", directory], env=env, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--top", type=int, default=10, help="show this many modules by self time")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import time of pyls.main exceeds this")
+    args = parser.parse_args()
+
+    env = child_env()
+    # 1 回目は .pyc を書くので捨てる
+    import_times(env)
+
+    totals = []
+    self_times: dict[str, list[int]] = defaultdict(list)
+    for _ in range(args.runs):
+        times = import_times(env)
+        totals.append(times["pyls.main"][1] / 1000)
+        for name, (self_us, _) in times.items():
+            self_times[name].append(self_us)
+
+    with tempfile.TemporaryDirectory() as empty:
+        runs = [run_time(env, empty) for _ in range(args.runs)]
+
+    median = statistics.median(totals)
+    print(f"import pyls.main : median {median:6.1f} ms, min {min(totals):6.1f} ms ({args.runs} runs)")
+    print(f"pyls <empty dir> : median {statistics.median(runs) * 1e3:6.1f} ms, min {min(runs) * 1e3:6.1f} ms")
+    print(f"\n{'self ms':>8}  module")
+    by_self = sorted(self_times.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, values in by_self[: args.top]:
+        print(f"{statistics.median(values) / 1000:8.2f}  {name}")
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nimport time {median:.1f} ms exceeds the budget of {args.max_ms:.1f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
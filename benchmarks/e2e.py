@@ -0,0 +1,146 @@
+"""
+End-to-end benchmark: time pyls against GNU ls on a directory tree.
+
+Each option set is run --repeat times with both commands. Output goes to a
+temporary file (not a pipe), and resource usage is read with os.wait4, so the
+numbers are for the child process only:
+
+  wall     elapsed time (median of the runs)
+  user/sys CPU time (median)
+  maxrss   peak resident set size (max over the runs)
+
+The first run of each command is also checked for identical output.
+
+Generate trees with tests/generators/file_tree.py, e.g.:
+  SHAPE=wide FILES=1000000 ROOT=/tmp/pyls-wide RESET=1 python tests/generators/file_tree.py
+  SHAPE=balanced ROOT=/tmp/pyls-balanced RESET=1 python tests/generators/file_tree.py
+
+Usage:
+  uv run python benchmarks/e2e.py /tmp/pyls-wide
+  uv run python benchmarks/e2e.py /tmp/pyls-balanced --sets="-R;-lR;-a" --repeat 3 --json e2e.json
+
+Exit status is 1 if any option set produced different output.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DEFAULT_SETS = ";-l;-R;-S;-t;-a;-la;-lR"
+
+
+def run_once(argv: list[str], env: dict[str, str], output) -> dict:
+    """argv を実行し、(wall, user, sys, maxrss, 終了コード) を返す。出力は output に書く"""
+    output.seek(0)
+    output.truncate()
+    start = time.perf_counter()
+    pid = os.posix_spawnp(argv[0], argv, env, file_actions=[(os.POSIX_SPAWN_DUP2, output.fileno(), 1)])
+    _, status, rusage = os.wait4(pid, 0)
+    wall = time.perf_counter() - start
+    return {
+        "wall": wall,
+        "user": rusage.ru_utime,
+        "sys": rusage.ru_stime,
+        # Linux では KiB 単位
+        "maxrss_kib": rusage.ru_maxrss,
+        "exit": os.waitstatus_to_exitcode(status),
+    }
+
+
+def output_digest(output) -> tuple[str, int]:
+    output.flush()
+    output.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := output.read(1 << 20):
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def summarize(runs: list[dict]) -> dict:
+    return {
+        "wall": statistics.median(r["wall"] for r in runs),
+        "user": statistics.median(r["user"] for r in runs),
+        "sys": statistics.median(r["sys"] for r in runs),
+        "maxrss_kib": max(r["maxrss_kib"] for r in runs),
+        "exit": runs[0]["exit"],
+    }
+
+
+def pyls_command(value: str | None) -> list[str]:
+    if value:
+        return value.split()
+    if shutil.which("pyls"):
+        return ["pyls"]
+    return [sys.executable, "-m", "pyls"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path, help="directory to list")
+    parser.add_argument("--sets", default=DEFAULT_SETS, help=f"';'-separated option sets (default: {DEFAULT_SETS!r})")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pyls", help="pyls command line (default: pyls on PATH, else python -m pyls)")
+    parser.add_argument("--ls", default="ls", help="ls command (default: ls)")
+    parser.add_argument("--width", type=int, default=80, help="COLUMNS for both commands (default: 80)")
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    args = parser.parse_args()
+
+    pyls = pyls_command(args.pyls)
+    env = dict(os.environ, COLUMNS=str(args.width))
+    option_sets = [s.split() for s in args.sets.split(";")]
+
+    results = []
+    mismatches = 0
+    print(f"{'options':<8} {'cmd':<5} {'wall s':>8} {'user s':>8} {'sys s':>8} {'maxrss MiB':>11}  output")
+    with tempfile.TemporaryFile() as ls_out, tempfile.TemporaryFile() as pyls_out:
+        for options in option_sets:
+            # pyls と同じく、パイプでも複数列で出すため -C を付ける (-l が後ろにあればそちらが優先される)
+            commands = {
+                "ls": ([args.ls, "-C", *options, str(args.root)], ls_out),
+                "pyls": ([*pyls, *options, str(args.root)], pyls_out),
+            }
+            runs: dict[str, list[dict]] = {"ls": [], "pyls": []}
+            digests = {}
+            for i in range(args.repeat):
+                # 交互に回して、キャッシュの温まり具合を揃える
+                for name, (argv, output) in commands.items():
+                    runs[name].append(run_once(argv, env, output))
+                    if i == 0:
+                        digests[name] = output_digest(output)
+
+            match = digests["ls"][0] == digests["pyls"][0]
+            mismatches += not match
+            label = " ".join(options) or "(none)"
+            for name in ("ls", "pyls"):
+                summary = summarize(runs[name])
+                status = "same" if match else f"DIFF ({digests[name][1]} bytes)"
+                print(
+                    f"{label:<8} {name:<5} {summary['wall']:8.3f} {summary['user']:8.3f} {summary['sys']:8.3f}"
+                    f" {summary['maxrss_kib'] / 1024:11.1f}  {status}"
+                )
+                results.append({"options": options, "command": name, "match": match, **summary})
+            ratio = summarize(runs["pyls"])["wall"] / summarize(runs["ls"])["wall"]
+            print(f"{'':<8} {'':<5} pyls/ls wall: {ratio:.1f}x")
+
+    if args.json:
+        args.json.write_text(json.dumps({"root": str(args.root), "repeat": args.repeat, "results": results}, indent=2))
+
+    if mismatches:
+        print(f"\n{mismatches} option set(s) produced different output", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+"""
+Micro-benchmarks for the pure formatting, filtering and sorting functions.
+
+Each benchmark runs one function over a synthetic list of FileEntry objects
+(realistic name lengths and extensions, numbered names, dotfiles and the
+special characters used by tests/generators/file_tree.py) and reports the
+best time per entry over several repeats.
+
+Usage:
+  uv run python benchmarks/micro.py
+  uv run python benchmarks/micro.py --sizes 1000,1000000 --bench c_escape,sort:version
+  uv run python benchmarks/micro.py --json results.json
+  uv run python benchmarks/micro.py --baseline results.json --threshold 0.15
+
+With --baseline, each result is compared with the stored result for the same
+benchmark and size. The exit status is 1 if any benchmark got slower by more
+than --threshold (a fraction, 0.10 = 10%).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+from collections.abc import Callable
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from pyls.filter import filter_ignored, iter_display_entries, natural_sort_key
+from pyls.format import c_escape, format_time, human_readable_size, mode_string, time_formatter
+from pyls.output import print_columns
+from pyls.types import FileEntry, FileStatus
+
+DEFAULT_SIZES = "1000,10000,100000"
+EXTENSIONS = ["txt", "py", "o", "json", "md", "c", "h", "tar.gz", "log", "tmp", ""]
+# tests/generators/file_tree.py の特殊ファイルと同じ文字 + 非 ASCII
+SPECIAL_CHARS = ["\n", "\t", " ", "\\", '"', "'", "é", "日本"]
+MODES = [0o100644] * 12 + [0o100755] * 3 + [0o040755] * 3 + [0o120777, 0o104755, 0o010644, 0o140755, 0o020620]
+YEAR_SECONDS = 365 * 24 * 60 * 60
+
+
+def make_name(rng: random.Random, i: int) -> str:
+    stem = "".join(rng.choices("abcdefghijklmnopqrstuvwxyz_-", k=max(1, min(int(rng.lognormvariate(2.0, 0.5)), 60))))
+    roll = rng.random()
+    if roll < 0.02:
+        stem = stem[:3] + rng.choice(SPECIAL_CHARS) + stem[3:]
+    elif roll < 0.07:
+        stem = "." + stem
+    elif roll < 0.25:
+        # file9 / file10 のような番号付きの名前 (-v で効く)
+        stem = f"{stem}{rng.randint(0, 200)}"
+    extension = rng.choice(EXTENSIONS)
+    return f"{stem}_{i}.{extension}" if extension else f"{stem}_{i}"
+
+
+def make_entries(n: int, seed: int = 0) -> list[FileEntry]:
+    rng = random.Random(seed)
+    now = time.time()
+    entries = []
+    for i in range(n):
+        name = make_name(rng, i)
+        mode = rng.choice(MODES)
+        size = int(rng.lognormvariate(8.0, 3.0))
+        mtime = now - rng.expovariate(1 / (YEAR_SECONDS / 4))
+        status = FileStatus(
+            mode=mode,
+            nlink=1,
+            uid=rng.choice([0, 1000, 1001]),
+            gid=rng.choice([0, 1000]),
+            size=size,
+            mtime=mtime,
+            atime=mtime,
+            ctime=mtime,
+            blocks=(size + 511) // 512,
+            inode=i,
+        )
+        entries.append(
+            FileEntry(path=Path("/bench") / name, name=name, is_dir=mode & 0o170000 == 0o040000, file_status=status)
+        )
+    return entries
+
+
+def bench_opts(**overrides) -> argparse.Namespace:
+    opts = argparse.Namespace(
+        all=True,
+        almost_all=False,
+        ignore=["*.o", "*~"],
+        hide=["*.tmp"],
+        unsorted=False,
+        reverse=False,
+        sort=None,
+        sort_time=False,
+        sort_size=False,
+        sort_extension=False,
+        sort_version=False,
+    )
+    for key, value in overrides.items():
+        setattr(opts, key, value)
+    return opts
+
+
+def bench_mode_string(entries: list[FileEntry]) -> Callable[[], object]:
+    modes = [e.file_status.mode for e in entries]
+    return lambda: [mode_string(m) for m in modes]
+
+
+def bench_format_time(entries: list[FileEntry]) -> Callable[[], object]:
+    times = [e.file_status.mtime for e in entries]
+    return lambda: [format_time(t) for t in times]
+
+
+def bench_time_formatter(entries: list[FileEntry]) -> Callable[[], object]:
+    # -l が使う経路 (1 回の実行で共有する TimeFormatter)
+    times = [e.file_status.mtime for e in entries]
+    formatter = time_formatter(None)
+    return lambda: [formatter.format(t) for t in times]
+
+
+def bench_c_escape(entries: list[FileEntry]) -> Callable[[], object]:
+    names = [e.name for e in entries]
+    return lambda: [c_escape(n) for n in names]
+
+
+def bench_human_readable_size(entries: list[FileEntry]) -> Callable[[], object]:
+    sizes = [e.file_status.size for e in entries]
+    return lambda: [human_readable_size(s) for s in sizes]
+
+
+def bench_filter_ignored(entries: list[FileEntry]) -> Callable[[], object]:
+    opts = bench_opts()
+    return lambda: filter_ignored(entries, opts)
+
+
+def bench_natural_sort_key(entries: list[FileEntry]) -> Callable[[], object]:
+    names = [e.name for e in entries]
+    return lambda: [natural_sort_key(n) for n in names]
+
+
+def sort_bench(key: str) -> Callable[[list[FileEntry]], Callable[[], object]]:
+    def bench(entries: list[FileEntry]) -> Callable[[], object]:
+        opts = bench_opts(sort=key)
+        return lambda: iter_display_entries(entries, opts)
+
+    return bench
+
+
+def bench_print_columns(entries: list[FileEntry]) -> Callable[[], object]:
+    names = [e.name for e in entries]
+
+    def run() -> None:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            print_columns(names, 200)
+
+    return run
+
+
+# 名前 -> entries を受け取り、計測する関数を返す関数
+BENCHMARKS: dict[str, Callable[[list[FileEntry]], Callable[[], object]]] = {
+    "mode_string": bench_mode_string,
+    "format_time": bench_format_time,
+    "time_formatter": bench_time_formatter,
+    "c_escape": bench_c_escape,
+    "human_readable_size": bench_human_readable_size,
+    "filter_ignored": bench_filter_ignored,
+    "natural_sort_key": bench_natural_sort_key,
+    "sort:name": sort_bench("name"),
+    "sort:time": sort_bench("time"),
+    "sort:size": sort_bench("size"),
+    "sort:extension": sort_bench("extension"),
+    "sort:version": sort_bench("version"),
+    "print_columns": bench_print_columns,
+}
+
+
+def measure(fn: Callable[[], object], repeat: int) -> float:
+    """1 回あたりの最短時間 (秒)。短いものは 0.2 秒以上になるまでまとめて回す"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def compare(result: dict, baseline: dict[tuple[str, int], dict]) -> None:
+    """baseline に同じベンチマーク・同じ件数の結果があれば、result に比率を書き込む"""
+    old = baseline.get((result["bench"], result["n"]))
+    if old is not None:
+        result["baseline_ns_per_entry"] = old["ns_per_entry"]
+        result["ratio"] = result["ns_per_entry"] / old["ns_per_entry"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sizes", default=DEFAULT_SIZES, help=f"comma-separated entry counts (default: {DEFAULT_SIZES})"
+    )
+    parser.add_argument("--bench", default="", help="comma-separated benchmark names (default: all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument("--baseline", type=Path, help="compare with results written by --json")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="allowed slowdown before flagging (default: 0.10)"
+    )
+    parser.add_argument("--list", action="store_true", help="list the benchmark names and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+
+    names = [b for b in args.bench.split(",") if b] or list(BENCHMARKS)
+    unknown = [b for b in names if b not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)} (see --list)")
+    sizes = [int(float(s)) for s in args.sizes.split(",")]
+    baseline = None
+    if args.baseline:
+        baseline = {(r["bench"], r["n"]): r for r in json.loads(args.baseline.read_text())["results"]}
+
+    results: list[dict] = []
+    print(
+        f"{'benchmark':<20} {'n':>9} {'ms':>10} {'ns/entry':>10}"
+        + (f" {'baseline':>10} {'ratio':>7}" if baseline else "")
+    )
+    for n in sizes:
+        entries = make_entries(n, args.seed)
+        for name in names:
+            seconds = measure(BENCHMARKS[name](entries), args.repeat)
+            result = {"bench": name, "n": n, "seconds": seconds, "ns_per_entry": seconds / n * 1e9}
+            results.append(result)
+
+            line = f"{name:<20} {n:>9} {seconds * 1e3:10.2f} {result['ns_per_entry']:10.1f}"
+            if baseline:
+                compare(result, baseline)
+                if "ratio" in result:
+                    flag = "  REGRESSION" if result["ratio"] > 1 + args.threshold else ""
+                    line += f" {result['baseline_ns_per_entry']:10.1f} {result['ratio']:6.2f}x{flag}"
+            print(line, flush=True)
+
+    if args.json:
+        args.json.write_text(
+            json.dumps(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "results": results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+
+    if baseline:
+        regressions = [r for r in results if r.get("ratio", 0) > 1 + args.threshold]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:", file=sys.stderr)
+            for r in regressions:
+                print(f"  {r['bench']} n={r['n']}: {r['ratio']:.2f}x", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+import importlib
+
+# pyls.client など軽いモジュールだけ使うときに一覧表示の処理まで読み込まないよう、使うときに import する
+LAZY_ATTRIBUTES = {
+    "main": ".main",
+    "alist": ".aio",
+}
+
+
+def __getattr__(name: str):
+    module = LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
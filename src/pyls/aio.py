@@ -0,0 +1,157 @@
+import argparse
+import asyncio
+import os
+import threading
+from collections.abc import AsyncIterator, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Protocol
+
+from pyls.cli import build_parser, sort_spec, time_style
+from pyls.core import gobble_dir_entry, required_stat_fields, should_include
+from pyls.filter import filter_ignored, ignore_matcher, iter_display_entries, sort_key_names
+from pyls.types import FileEntry, FileStatus
+
+# 1 回のワーカー呼び出しで読むエントリ数。読んだ分を渡し終わるまで次は 1 バッチしか先読みしない
+BATCH_SIZE = 512
+
+# alist() 全体で同時に使うスレッドの上限。遅い NFS で詰まっても、ほかのリクエストは待つだけで済む
+MAX_WORKERS = 8
+
+# CLI 専用で、alist() には渡せないオプション
+CLI_ONLY_OPTIONS = frozenset(
+    {"paths", "format", "server", "socket", "watch", "listing_cache", "index_to", "from_index", "version"}
+)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="pyls-aio")
+        return _executor
+
+
+def listing_options(**options) -> argparse.Namespace:
+    """キーワード引数から CLI と同じオプションの Namespace を作る。名前は長いオプションの - を _ にしたもの"""
+    opts = build_parser().parse_args([])
+    for name, value in options.items():
+        if name in CLI_ONLY_OPTIONS or not hasattr(opts, name):
+            raise TypeError(f"alist() got an unexpected option {name!r}")
+        try:
+            if name == "sort" and value is not None:
+                value = sort_spec(value)
+            elif name == "time_style" and value is not None:
+                value = time_style(value)
+        except argparse.ArgumentTypeError as e:
+            raise ValueError(f"{name}: {e}") from None
+        setattr(opts, name, value)
+    return opts
+
+
+class ScandirIterator(Iterator[os.DirEntry[str]], Protocol):
+    """os.scandir() の戻り値"""
+
+    def close(self) -> None: ...
+
+
+class DirectoryReader:
+    """1 つのディレクトリを BATCH_SIZE ずつ読む。read_batch() は毎回ワーカースレッドで呼ばれる (同時には呼ばれない)"""
+
+    def __init__(self, path: Path, opts: argparse.Namespace) -> None:
+        self.path = path
+        self.opts = opts
+        self.fields = required_stat_fields(opts)
+        self.matcher = ignore_matcher(opts)
+        self.children: ScandirIterator | None = None
+
+    def open(self) -> list[FileEntry]:
+        """scandir を開き、-a なら . と .. を返す"""
+        self.children = os.scandir(self.path)
+        if not self.opts.all:
+            return []
+        return [
+            FileEntry(self.path, ".", True, FileStatus.from_stat_result(self.path.lstat())),
+            FileEntry(self.path.parent, "..", True, FileStatus.from_stat_result(self.path.parent.lstat())),
+        ]
+
+    def read_batch(self) -> tuple[list[FileEntry], bool]:
+        """(読んだエントリ, 最後まで読んだか)"""
+        entries: list[FileEntry] = []
+        # 途中で消えたエントリは CLI と同じく飛ばす (メッセージは捨てる)
+        messages: list[str] = []
+        if self.children is None:
+            # open() の前か、もう最後まで読んで閉じた後
+            return entries, True
+        for child in self.children:
+            if not should_include(child.name, self.opts):
+                continue
+            if self.matcher and self.matcher.matches(child.name):
+                continue
+            gobble_dir_entry(child, self.path, self.fields, entries, messages)
+            if len(entries) >= BATCH_SIZE:
+                return entries, False
+        self.close()
+        return entries, True
+
+    def close(self) -> None:
+        if self.children is not None:
+            self.children.close()
+            self.children = None
+
+
+async def alist(path: str | os.PathLike, *, executor: Executor | None = None, **options) -> AsyncIterator[FileEntry]:
+    """path の子を CLI と同じ絞り込み・並び順の FileEntry として返す非同期イテレータ
+
+    options は CLI の長いオプションと同じ名前 (all=True, long=True, sort="size", ignore=["*.o"] など)。
+    scandir と lstat はすべて executor (省略時は MAX_WORKERS スレッドの共有プール) で行うので、
+    遅いファイルシステムでもイベントループは止まらない。
+
+    並べ替えない (unsorted=True や sort="none") ときは読んだ分から順に返し、受け取る側が遅ければ
+    1 バッチ先読みしたところで読むのを止める。並べ替えるときは全部読んでから返す。
+    ディレクトリが読めないときは os.scandir と同じ OSError を送出する。
+    """
+    opts = listing_options(**options)
+    loop = asyncio.get_running_loop()
+    executor = executor or shared_executor()
+    reader = DirectoryReader(Path(path), opts)
+    streaming = not sort_key_names(opts)
+
+    pending = None
+    try:
+        # . と .. も CLI と同じく -I / --hide で落とす
+        dots = filter_ignored(await loop.run_in_executor(executor, reader.open), opts)
+        collected = list(dots)
+        if streaming:
+            for entry in dots:
+                yield entry
+
+        done = False
+        while not done:
+            if pending is None:
+                pending = loop.run_in_executor(executor, reader.read_batch)
+            batch, done = await pending
+            pending = None if done else loop.run_in_executor(executor, reader.read_batch)
+            if streaming:
+                for entry in batch:
+                    yield entry
+            else:
+                collected.extend(batch)
+
+        if not streaming:
+            # 大きいディレクトリの並べ替えもイベントループの外で行う
+            ordered = await loop.run_in_executor(executor, sort_entries, collected, opts)
+            for entry in ordered:
+                yield entry
+    finally:
+        if pending is not None:
+            # 先読み中のバッチが終わってから閉じる (scandir を 2 つのスレッドから同時に触らない)
+            await asyncio.wait([pending])
+        await loop.run_in_executor(executor, reader.close)
+
+
+def sort_entries(entries: list[FileEntry], opts: argparse.Namespace) -> list[FileEntry]:
+    return iter_display_entries(filter_ignored(entries, opts), opts)
@@ -1,11 +1,45 @@
 import argparse
+import functools
+import os
+import sys
 
+from pyls.types import OutputFormat, SortKey, TimeStyle
 
+DEFAULT_COLUMNS = 80
+
+
+def terminal_columns() -> int:
+    """shutil.get_terminal_size().columns と同じ結果を、shutil を import せずに返す"""
+    try:
+        columns = int(os.environ["COLUMNS"])
+    except (KeyError, ValueError):
+        columns = 0
+    # pythonw などでは sys.__stdout__ が None
+    stdout = sys.__stdout__
+    if columns <= 0 and stdout is not None:
+        try:
+            columns = os.get_terminal_size(stdout.fileno()).columns
+        except (ValueError, OSError):
+            columns = 0
+    return columns or DEFAULT_COLUMNS
+
+
+class HelpFormatter(argparse.HelpFormatter):
+    # argparse は add_argument のたびに HelpFormatter を作り、そのたびに shutil で端末幅を調べるので、その代わり
+    def __init__(self, prog: str, indent_increment: int = 2, max_help_position: int = 24, width: int | None = None):
+        if width is None:
+            width = terminal_columns() - 2
+        super().__init__(prog, indent_increment, max_help_position, width)
+
+
+# parse_args はパーサーを書き換えないので、1 プロセスで 1 回だけ作って使い回す
+@functools.cache
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         prog="pyls",
         usage="%(prog)s [OPTION]... [FILE]...",
         add_help=False,
+        formatter_class=HelpFormatter,
     )
     p.add_argument("--help", action="help", help="display this help and exit")
     p.add_argument("--version", action="store_true", help="output version information and exit")
@@ -21,6 +55,13 @@ def build_parser() -> argparse.ArgumentParser:
         help="append indicator (one of /=>@|) to entries, but not '*' for executables",
     )
     p.add_argument("-F", "--classify", action="store_true", help="append indicator (one of */=>@|) to entries")
+    p.add_argument(
+        "--format",
+        metavar="WORD",
+        type=output_format,
+        help="long (-l), single-column (-1), vertical (columns, the default), or json / ndjson: "
+        "one JSON object per entry with its raw stat fields, streamed as directories are read",
+    )
     p.add_argument("-g", "--no-owner", action="store_true", help="like -l, but do not list owner information")
     p.add_argument(
         "-h",
@@ -41,6 +82,29 @@ def build_parser() -> argparse.ArgumentParser:
         help="do not list implied entries matching PATTERN",
     )
     p.add_argument("-l", dest="long", action="store_true", help="use a long listing format")
+    p.add_argument(
+        "--index-to",
+        metavar="FILE",
+        help="instead of listing, write every entry (hidden ones too) and its stat fields to the SQLite database FILE "
+        "(use with -R to index a whole tree)",
+    )
+    p.add_argument(
+        "--from-index",
+        metavar="FILE",
+        help="list from a database written by --index-to without touching the filesystem "
+        "(name paths as they were given to --index-to)",
+    )
+    p.add_argument(
+        "--listing-cache",
+        action="store_true",
+        help="reuse directory listings saved on disk while the directory is unchanged "
+        "(in $PYLS_LISTING_CACHE or $XDG_CACHE_HOME/pyls/listing.sqlite)",
+    )
+    p.add_argument(
+        "--no-xattr",
+        action="store_true",
+        help="with -l, do not probe extended attributes (no '@' after the mode)",
+    )
     p.add_argument("-n", "--numeric-uid-gid", action="store_true", help="like -l, but list numeric user and group IDs")
     p.add_argument("-N", "--literal", action="store_true", help="print entry names without quoting or escaping")
     p.add_argument("-o", "--no-group", action="store_true", help="like -l, but do not list group information")
@@ -50,10 +114,29 @@ def build_parser() -> argparse.ArgumentParser:
     )
     p.add_argument("-q", "--hide-control-chars", action="store_true", help="print ? instead of nongraphic characters")
     p.add_argument("-Q", "--quote-name", action="store_true", help="enclose entry names in double quotes")
+    p.add_argument(
+        "--profile",
+        action="store_true",
+        help="at exit, print time and call counts per phase and filesystem calls to stderr (or set PYLS_PROFILE=1)",
+    )
     p.add_argument("-r", "--reverse", action="store_true", help="reverse order while sorting")
     p.add_argument("-R", "--recursive", action="store_true", help="list subdirectories recursively")
+    p.add_argument(
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="with -R, scan up to N directories concurrently (output order is unchanged)",
+    )
     p.add_argument("-s", "--size", action="store_true", help="print the allocated size of each file, in blocks")
-    p.add_argument("--sort", metavar="WORD", action="store", help="store_true")
+    p.add_argument(
+        "--sort",
+        metavar="WORD",
+        type=sort_spec,
+        action="store",
+        help="sort by WORD instead of name: none, name, size, time, extension, version; "
+        "combine keys with commas (e.g. size,name)",
+    )
     p.add_argument("-S", "--sort-size", action="store_true", help="sort by file size, largest first")
     p.add_argument("-t", "--sort-time", action="store_true", help="sort by modification time, newest first")
     p.add_argument(
@@ -62,9 +145,20 @@ def build_parser() -> argparse.ArgumentParser:
         action="store",
         help="with --sort=time, sort by WORD instead of modification time: atime or ctime",
     )
+    p.add_argument(
+        "--time-style",
+        metavar="TIME_STYLE",
+        type=time_style,
+        help="time/date format with -l: full-iso, long-iso, iso, locale, or +FORMAT",
+    )
     p.add_argument(
         "-T", "--tabsize", metavar="COLS", type=int, action="store", help="assume tab stops at each COLS instead of 8"
     )
+    p.add_argument(
+        "--trace-file",
+        metavar="PATH",
+        help="write per-directory spans (scan, stat batch, sort, render) to PATH in Chrome trace format",
+    )
     p.add_argument(
         "-U",
         "--sort-untimed",
@@ -78,5 +172,44 @@ def build_parser() -> argparse.ArgumentParser:
         "-w", "--width", metavar="COLS", type=int, action="store", help="assume screen width instead of current value"
     )
     p.add_argument("-1", "--one-column", action="store_true", help="list one file per line")
+    p.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep listing a single DIR and update it as entries change (Linux inotify)",
+    )
+    p.add_argument(
+        "--server",
+        action="store_true",
+        help="stay resident and serve listings for pyls-client over a Unix socket",
+    )
+    p.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="with --server, listen on PATH (default: $PYLS_SOCKET, $XDG_RUNTIME_DIR/pyls.sock or /tmp/pyls-UID.sock)",
+    )
     p.add_argument("paths", nargs="*")
     return p
+
+
+def time_style(value: str) -> str:
+    if value.startswith(TimeStyle.FORMAT_PREFIX) or value.startswith(TimeStyle.POSIX_PREFIX):
+        return value
+    if value not in TimeStyle.NAMES:
+        raise argparse.ArgumentTypeError(f"invalid argument {value!r} (valid: {', '.join(TimeStyle.NAMES)}, +FORMAT)")
+    return value
+
+
+def output_format(value: str) -> str:
+    if value not in OutputFormat.NAMES:
+        raise argparse.ArgumentTypeError(f"invalid argument {value!r} (valid: {', '.join(OutputFormat.NAMES)})")
+    return value
+
+
+def sort_spec(value: str) -> str:
+    keys = value.split(",")
+    if keys == [SortKey.NONE]:
+        return value
+    for key in keys:
+        if key not in SortKey.NAMES:
+            raise argparse.ArgumentTypeError(f"invalid argument {key!r} (valid: none, {', '.join(SortKey.NAMES)})")
+    return value
@@ -0,0 +1,131 @@
+# pyls-client: 常駐している pyls --server に argv を送り、出力と終了コードを受け取る
+# 起動を速くするため、標準ライブラリしか import しない
+from __future__ import annotations
+
+import os
+import socket
+import struct
+import sys
+
+# フレーム = チャンネル 1 バイト + ペイロード長 (4 バイト, ビッグエンディアン) + ペイロード
+HEADER = struct.Struct(">cI")
+# EXIT のペイロード (符号付き 4 バイト)
+EXIT_STATUS = struct.Struct(">i")
+
+# クライアント → サーバー。ペイロードは encode_request の NUL 区切り
+REQUEST = b"R"
+# サーバー → クライアント。stdout / stderr のバイト列と、最後のフレームの終了コード
+STDOUT = b"1"
+STDERR = b"2"
+EXIT = b"x"
+
+# リクエストの大きさの上限 (argv と cwd しか入らない)
+MAX_REQUEST_SIZE = 1 << 20
+
+# サーバー側で一時的に差し替える環境変数
+FORWARDED_ENV = ("COLUMNS", "TZ")
+
+
+def default_socket_path() -> str:
+    """$PYLS_SOCKET、なければ $XDG_RUNTIME_DIR/pyls.sock、なければ /tmp/pyls-<uid>.sock"""
+    path = os.environ.get("PYLS_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "pyls.sock")
+    return f"/tmp/pyls-{os.getuid()}.sock"
+
+
+def send_frame(sock: socket.socket, channel: bytes, payload: bytes) -> None:
+    sock.sendall(HEADER.pack(channel, len(payload)) + payload)
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError("pyls server closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock: socket.socket) -> tuple[bytes, bytes]:
+    channel, size = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return channel, recv_exact(sock, size)
+
+
+def encode_request(argv: list[str], cwd: str, tty: bool, env: dict[str, str | None]) -> bytes:
+    # cwd, tty ("0"/"1"), 環境変数の数, 環境変数 ("NAME=VALUE"、消すなら "NAME"), argv の順に並べる。
+    # json は re や enum まで読み込んで起動が 10ms 以上遅くなるので、NUL 区切りにする
+    fields = [cwd, "1" if tty else "0", str(len(env))]
+    fields += [name if value is None else f"{name}={value}" for name, value in env.items()]
+    fields += argv
+    # ファイル名のデコードできないバイト列 (サロゲート) は元のバイト列に戻して送る
+    return "\0".join(fields).encode("utf-8", "surrogateescape")
+
+
+def decode_request(payload: bytes) -> tuple[list[str], str, bool, dict[str, str | None]]:
+    fields = payload.decode("utf-8", "surrogateescape").split("\0")
+    cwd, tty, count = fields[0], fields[1] == "1", int(fields[2])
+    env: dict[str, str | None] = {}
+    for entry in fields[3 : 3 + count]:
+        name, sep, value = entry.partition("=")
+        env[name] = value if sep else None
+    return fields[3 + count :], cwd, tty, env
+
+
+def request_env(tty: bool) -> dict[str, str | None]:
+    """サーバーはクライアントの端末を知らないので、幅はここで決めて COLUMNS として渡す"""
+    env: dict[str, str | None] = {name: os.environ.get(name) for name in FORWARDED_ENV}
+    if not env["COLUMNS"] and tty:
+        try:
+            env["COLUMNS"] = str(os.get_terminal_size(sys.stdout.fileno()).columns)
+        except OSError:
+            pass
+    return env
+
+
+def run_remote(argv: list[str], socket_path: str, stdout=None, stderr=None) -> int:
+    """サーバーに argv を送り、出力を stdout / stderr (バイナリ) に書き、終了コードを返す"""
+    stdout = stdout or sys.stdout.buffer
+    stderr = stderr or sys.stderr.buffer
+    tty = sys.stdout.isatty()
+    request = encode_request(argv, os.getcwd(), tty, request_env(tty))
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        send_frame(sock, REQUEST, request)
+        while True:
+            channel, payload = recv_frame(sock)
+            if channel == STDOUT:
+                stdout.write(payload)
+                stdout.flush()
+            elif channel == STDERR:
+                stderr.write(payload)
+                stderr.flush()
+            elif channel == EXIT:
+                return EXIT_STATUS.unpack(payload)[0]
+            else:
+                raise ConnectionError(f"unexpected frame from pyls server: {channel!r}")
+
+
+def main(argv: list[str] | None = None) -> int | None:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    try:
+        return run_remote(argv, default_socket_path())
+    except (FileNotFoundError, ConnectionRefusedError):
+        # サーバーがいなければ普通に実行する
+        from pyls.main import main as run_local
+
+        return run_local(argv)
+    except BrokenPipeError:
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
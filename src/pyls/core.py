@@ -1,23 +1,56 @@
+import os
 import stat
-import sys
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from itertools import batched, islice
 from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
 
-from pyls.filter import iter_display_entries
-from pyls.types import DirectoryIdentifier, DirEntries, ExitStatus, FileEntry, FileStatus
+from pyls.filter import ignore_matcher, iter_display_entries, sort_key_names
+from pyls.table import EntryTable
+from pyls.types import (
+    DIRENT_FIELDS,
+    DirectoryIdentifier,
+    DirEntries,
+    ExitStatus,
+    FileEntry,
+    FileStatus,
+    OutputFormat,
+    StatField,
+    StatResult,
+    dir_entry_mode,
+)
+from pyls.writer import writer
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+# 最初にこれだけ lstat して、1 回あたりの時間を測る
+STAT_PROBE_SIZE = 64
+# 1 回の lstat がこれより遅ければ (NFS や FUSE)、残りはスレッドで並列に lstat する
+SLOW_LSTAT_SECONDS = 100e-6
+STAT_WORKERS = 16
+STAT_BATCH_SIZE = 128
+
+# -R --jobs N で先に走査しておくディレクトリ数は N * READ_AHEAD_PER_JOB まで
+READ_AHEAD_PER_JOB = 2
 
 
 def gobble_file(
     path: Path,
     cwd_entries: list[FileEntry],
+    messages: list[str] | None = None,
+    opts=None,
 ) -> ExitStatus:
     try:
-        st = path.lstat()
+        st = lstat_path(path, opts)
 
     except FileNotFoundError:
-        print(f"pyls: cannot access '{path}': No such file or directory")
+        report(f"pyls: cannot access '{path}': No such file or directory", messages)
         return ExitStatus.ERROR
     except PermissionError:
-        print(f"pyls: cannot access '{path}': Permission denied")
+        report(f"pyls: cannot access '{path}': Permission denied", messages)
         return ExitStatus.ERROR
 
     file_status = FileStatus.from_stat_result(st)
@@ -29,6 +62,104 @@ def gobble_file(
     return ExitStatus.OK
 
 
+def lstat_path(path: Path, opts=None) -> StatResult:
+    """path.lstat()。--from-index なら索引に記録した値を返す"""
+    if opts is not None and opts.from_index:
+        from pyls.index import shared_index
+
+        return shared_index(opts.from_index).lstat(path)
+    return path.lstat()
+
+
+def is_directory(path: Path, opts) -> bool:
+    """path.is_dir()。--from-index なら索引に一覧を記録したディレクトリか"""
+    if opts.from_index:
+        from pyls.index import shared_index
+
+        return shared_index(opts.from_index).is_dir(path)
+    return path.is_dir()
+
+
+def report(message: str, messages: list[str] | None = None) -> None:
+    """エラーメッセージを出力する。messages が渡されたら出力せずに溜める (並列走査用)"""
+    if messages is None:
+        writer.line(message)
+    else:
+        messages.append(message)
+
+
+def gobble_dir_entry(
+    entry: os.DirEntry,
+    dir_path: Path,
+    fields: StatField,
+    cwd_entries: list[FileEntry] | EntryTable,
+    messages: list[str] | None = None,
+) -> ExitStatus:
+    try:
+        st = None
+        mode = None
+        if needs_lstat(entry, fields):
+            st = entry.stat(follow_symlinks=False)
+        else:
+            mode = dir_entry_mode(entry)
+            if mode is None:
+                # FIFO やデバイスなどは d_type から区別できないので lstat する
+                st = entry.stat(follow_symlinks=False)
+
+    except FileNotFoundError:
+        report(f"pyls: cannot access '{dir_path / entry.name}': No such file or directory", messages)
+        return ExitStatus.ERROR
+    except PermissionError:
+        report(f"pyls: cannot access '{dir_path / entry.name}': Permission denied", messages)
+        return ExitStatus.ERROR
+
+    if isinstance(cwd_entries, EntryTable):
+        if st is not None:
+            cwd_entries.append_stat(entry.name, st)
+        elif mode is not None:
+            # lstat しなかったエントリは d_type から種別が分かっている
+            cwd_entries.append_dir_entry(entry.name, mode, entry.inode())
+        return ExitStatus.OK
+
+    if st is not None:
+        file_status = FileStatus.from_stat_result(st)
+    else:
+        file_status = FileStatus.from_dir_entry(entry)
+    is_dir = stat.S_ISDIR(file_status.mode)
+    cwd_entries.append(FileEntry(path=dir_path / entry.name, name=entry.name, is_dir=is_dir, file_status=file_status))
+    return ExitStatus.OK
+
+
+# ソートキーごとに要る FileStatus のフィールド (名前だけで決まるキーは何も要らない)
+SORT_KEY_FIELDS = {"time": StatField.TIME, "size": StatField.SIZE}
+
+
+def required_stat_fields(opts) -> StatField:
+    """オプションから表示・ソートに必要な FileStatus のフィールドを求める"""
+    fields = StatField.TYPE
+
+    if opts.long or opts.numeric_uid_gid or opts.no_owner or opts.format in OutputFormat.MACHINE or opts.index_to:
+        return StatField.ALL
+    if opts.size:
+        fields |= StatField.BLOCKS
+    if opts.inode:
+        fields |= StatField.INODE
+    for key in sort_key_names(opts):
+        fields |= SORT_KEY_FIELDS.get(key, StatField.NONE)
+    if opts.classify:
+        # 実行ファイルの判定にパーミッションビットが要る
+        fields |= StatField.MODE
+
+    return fields
+
+
+def needs_lstat(entry: os.DirEntry, fields: StatField) -> bool:
+    if fields & ~DIRENT_FIELDS:
+        return True
+    # マウントポイントの d_ino はマウント先のルートと一致しないので、ディレクトリだけは lstat する
+    return bool(fields & StatField.INODE) and entry.is_dir(follow_symlinks=False)
+
+
 def classify_paths(paths: list[str], opts) -> tuple[list[Path], list[Path]]:
     files: list[Path] = []
     dirs: list[Path] = []
@@ -36,9 +167,9 @@ def classify_paths(paths: list[str], opts) -> tuple[list[Path], list[Path]]:
     for p in paths:
         path = Path(p)
         if opts.directory:
-            if path.is_dir():
+            if is_directory(path, opts):
                 files.append(path)
-        elif path.is_dir():
+        elif is_directory(path, opts):
             dirs.append(path)
         else:
             files.append(path)
@@ -59,56 +190,248 @@ def should_include(name: str, opts) -> bool:
 def scan_dir_children(
     dir_path: Path,
     opts,
-    entries: list[FileEntry],
+    entries: list[FileEntry] | EntryTable,
+    messages: list[str] | None = None,
 ) -> tuple[DirEntries, ExitStatus]:
-    try:
-        children = list(dir_path.iterdir())
-    except FileNotFoundError:
-        print(f"pyls: cannot access '{dir_path}': No such file or directory")
-        return DirEntries(path=dir_path, entries=[]), ExitStatus.ERROR
-    except PermissionError:
-        print(f"pyls: cannot access '{dir_path}': Permission denied")
+    """dir_path の子を entries に追加し、表示順に並べて返す
+
+    entries に EntryTable を渡すと、エントリを列ごとの配列に詰めて持つ (巨大なディレクトリ向け)。
+    """
+    children = open_dir_or_report(dir_path, opts, messages)
+    if children is None:
         return DirEntries(path=dir_path, entries=[]), ExitStatus.ERROR
 
     if opts.all:
-        dot_status = FileStatus.from_stat_result(dir_path.lstat())
-        dotdot_status = FileStatus.from_stat_result(dir_path.parent.lstat())
-        entries.append(FileEntry(path=dir_path, name=".", is_dir=True, file_status=dot_status))
-        entries.append(FileEntry(path=dir_path.parent, name="..", is_dir=True, file_status=dotdot_status))
+        for entry in dot_entries(dir_path, opts):
+            entries.append(entry)
 
+    fields = required_stat_fields(opts)
     exit_status = ExitStatus.OK
+    with children:
+        for child in prefetch_lstat(included_children(children, opts), fields):
+            exit_status |= int(gobble_dir_entry(child, dir_path, fields, entries, messages))
+
+    sorted_entries = iter_display_entries(entries, opts)
+    return DirEntries(path=dir_path, entries=sorted_entries), ExitStatus(exit_status)
+
+
+def iter_dir_children(dir_path: Path, opts, messages: list[str] | None = None) -> Iterator[FileEntry]:
+    """scan_dir_children と同じエントリを、並べ替えずに読んだ順に 1 つずつ返す
+
+    ディレクトリ全体を持たないので、巨大なディレクトリでもメモリは増えない (-U のストリーミング出力用)。
+    """
+    children = open_dir_or_report(dir_path, opts, messages)
+    if children is None:
+        return
+
+    if opts.all:
+        yield from dot_entries(dir_path, opts)
+
+    fields = required_stat_fields(opts)
+    gobbled: list[FileEntry] = []
+    with children:
+        for child in prefetch_lstat(included_children(children, opts), fields):
+            gobble_dir_entry(child, dir_path, fields, gobbled, messages)
+            if gobbled:
+                yield gobbled.pop()
+
+
+def open_dir_or_report(dir_path: Path, opts, messages: list[str] | None = None):
+    """open_children(dir_path, opts)。開けなければメッセージを出して None を返す"""
+    try:
+        return open_children(dir_path, opts)
+    except FileNotFoundError:
+        report(f"pyls: cannot access '{dir_path}': No such file or directory", messages)
+    except PermissionError:
+        report(f"pyls: cannot access '{dir_path}': Permission denied", messages)
+    return None
+
+
+def dot_entries(dir_path: Path, opts) -> list[FileEntry]:
+    """-a で表示する . と .."""
+    dot_status = FileStatus.from_stat_result(lstat_path(dir_path, opts))
+    dotdot_status = FileStatus.from_stat_result(lstat_path(dir_path.parent, opts))
+    return [
+        FileEntry(path=dir_path, name=".", is_dir=True, file_status=dot_status),
+        FileEntry(path=dir_path.parent, name="..", is_dir=True, file_status=dotdot_status),
+    ]
+
+
+def included_children(children: Iterable[os.DirEntry], opts) -> Iterator[os.DirEntry]:
+    matcher = ignore_matcher(opts)
     for child in children:
         if not should_include(child.name, opts):
             continue
-        exit_status |= int(gobble_file(child, entries))
+        # 無視するエントリは lstat する前に落とす
+        if matcher and matcher.matches(child.name):
+            continue
+        yield child
 
-    sorted_entries = iter_display_entries(entries, opts)
-    return DirEntries(path=dir_path, entries=sorted_entries), ExitStatus(exit_status)
 
+def prefetch_lstat(children: Iterator[os.DirEntry], fields: StatField) -> Iterator[os.DirEntry]:
+    """children を同じ順番で返す。lstat が遅いファイルシステムでは、返す前にスレッドで lstat しておく
 
-def collect_entries(paths: list[Path], opts) -> list[DirEntries]:
-    result: list[DirEntries] = []
-    pending_dirs: list[Path] = list(paths)
-    visited_dirs: set[DirectoryIdentifier] = set()
+    DirEntry は lstat の結果を覚えているので、呼び出し側の entry.stat() はその結果を使う。
+    失敗は覚えないので、呼び出し側でもう一度 lstat して今まで通りのエラーメッセージを出す。
+    最初の STAT_PROBE_SIZE 個を 1 つずつ lstat して測り、大きいディレクトリで遅いときだけスレッドを使う。
+    """
+    if not fields & ~DIRENT_FIELDS:
+        # 全部は lstat しない
+        yield from children
+        return
+
+    probe = list(islice(children, STAT_PROBE_SIZE))
+    start = time.perf_counter()
+    warm_lstat(probe)
+    slow = time.perf_counter() - start >= SLOW_LSTAT_SECONDS * len(probe)
+    yield from probe
+    if len(probe) < STAT_PROBE_SIZE or not slow:
+        yield from children
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=STAT_WORKERS, thread_name_prefix="pyls-lstat") as executor:
+        # 先読みはワーカー数の 2 倍のバッチまで。readdir だけが先に進んでメモリを使い切らないようにする
+        pending: deque = deque()
+        for batch in batched(children, STAT_BATCH_SIZE):
+            pending.append((batch, executor.submit(warm_lstat, batch)))
+            if len(pending) >= STAT_WORKERS * 2:
+                done, future = pending.popleft()
+                future.result()
+                yield from done
+        while pending:
+            done, future = pending.popleft()
+            future.result()
+            yield from done
 
-    while pending_dirs:
-        d = pending_dirs.pop(0)
 
+def warm_lstat(children: Iterable[os.DirEntry]) -> None:
+    for child in children:
         try:
-            stat_info = d.stat()
-            dir_id = DirectoryIdentifier(stat_info.st_dev, stat_info.st_ino)
-            if dir_id in visited_dirs:
-                print(f"pyls: {d}: not listing already-listed directory", file=sys.stderr)
-                continue
-            visited_dirs.add(dir_id)
+            child.stat(follow_symlinks=False)
         except OSError:
             pass
 
-        dir_entries, status = scan_dir_children(d, opts, entries=[])
-        result.append(dir_entries)
 
-        if opts.recursive:
-            subdirs = [entry.path for entry in dir_entries.entries if entry.is_dir and entry.name not in {".", ".."}]
-            pending_dirs = subdirs + pending_dirs  # DFS
+def open_children(dir_path: Path, opts):
+    """os.scandir(dir_path)。--listing-cache なら、ディレクトリが変わっていない限りキャッシュから同じものを返す
+
+    --from-index ならファイルシステムには触らず、索引に記録した一覧を返す。
+    """
+    if opts.from_index:
+        from pyls.index import shared_index
+
+        return shared_index(opts.from_index).scandir(dir_path)
+    if opts.listing_cache:
+        from pyls.listing_cache import shared_cache
+
+        cache = shared_cache()
+        if cache is not None:
+            return cache.scandir(dir_path)
+    return os.scandir(dir_path)
+
+
+class ScannedDir(NamedTuple):
+    dir_id: DirectoryIdentifier | None
+    dir_entries: DirEntries
+    exit_status: ExitStatus
+    messages: list[str]
+
+
+def directory_id(d: Path, opts) -> DirectoryIdentifier | None:
+    """-R でループを検出するためのディレクトリの (st_dev, st_ino)。stat できなければ None"""
+    try:
+        stat_info = lstat_path(d, opts) if opts.from_index else d.stat()
+    except OSError:
+        return None
+    return DirectoryIdentifier(stat_info.st_dev, stat_info.st_ino)
+
+
+def scan_dir(d: Path, opts, dir_id: DirectoryIdentifier | None = None) -> ScannedDir:
+    """1 ディレクトリ分の走査 (--jobs ならワーカースレッドで実行される)。メッセージは出力せずに返す
+
+    dir_id を渡さなければここで stat して求める。
+    """
+    if dir_id is None:
+        dir_id = directory_id(d, opts)
+    messages: list[str] = []
+    dir_entries, status = scan_dir_children(d, opts, entries=EntryTable(d), messages=messages)
+    return ScannedDir(dir_id, dir_entries, status, messages)
+
+
+class PendingDir:
+    """DFS スタック上の未処理ディレクトリ。先読みを始めていれば future を持つ"""
+
+    __slots__ = ("path", "future")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.future: Future[ScannedDir] | None = None
+
+
+def collect_entries(paths: list[Path], opts, on_message: Callable[[str], None] = writer.line) -> Iterator[DirEntries]:
+    """paths 以下を DFS 順に走査し、走査・ソートが終わったディレクトリから順に返す
+
+    保持するのは DFS スタック上の未処理ディレクトリだけなので、メモリは木の深さ x 幅で抑えられる。
+    --jobs N なら N スレッドで、次に返す順に最大 N * READ_AHEAD_PER_JOB ディレクトリまで先読みする。
+    呼び出し側が遅くても、走査済みで持っておくのはその分だけで、返す順番も変わらない。
+    走査中のエラーメッセージは on_message に渡す (省略時は一覧と同じ stdout)。
+    """
+    if opts.jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=opts.jobs, thread_name_prefix="pyls-scan")
+        read_ahead = opts.jobs * READ_AHEAD_PER_JOB
+    else:
+        executor = None
+        read_ahead = 0
+
+    # 末尾が次に処理するディレクトリ
+    pending = [PendingDir(d) for d in reversed(paths)]
+    in_flight = 0
+    visited_dirs: set[DirectoryIdentifier] = set()
+
+    try:
+        while pending:
+            if executor is not None:
+                # 次に処理する順に、先読み中が read_ahead 個になるまで投入する
+                for item in reversed(pending):
+                    if in_flight >= read_ahead:
+                        break
+                    if item.future is None:
+                        item.future = executor.submit(scan_dir, item.path, opts)
+                        in_flight += 1
+
+            item = pending.pop()
+            if item.future is None:
+                # 先読みしていないディレクトリは、読む前に一覧済みかを確かめる (ループを読み直さない)
+                dir_id = directory_id(item.path, opts)
+                if dir_id is not None and dir_id in visited_dirs:
+                    writer.error(f"pyls: {item.path}: not listing already-listed directory")
+                    continue
+                scanned = scan_dir(item.path, opts, dir_id)
+            else:
+                in_flight -= 1
+                scanned = item.future.result()
+                if scanned.dir_id is not None and scanned.dir_id in visited_dirs:
+                    writer.error(f"pyls: {item.path}: not listing already-listed directory")
+                    continue
+
+            if scanned.dir_id is not None:
+                visited_dirs.add(scanned.dir_id)
+
+            if opts.recursive:
+                subdirs = [
+                    entry.path
+                    for entry in scanned.dir_entries.entries
+                    if entry.is_dir and entry.name not in {".", ".."}
+                ]
+                pending.extend(PendingDir(sub) for sub in reversed(subdirs))
 
-    return result
+            for message in scanned.messages:
+                on_message(message)
+            yield scanned.dir_entries
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,58 +1,210 @@
 from __future__ import annotations
 
-import fnmatch
+import functools
 import re
-import sys
 from collections.abc import Iterable
+from typing import overload
 
-from pyls.types import FileEntry
+from pyls.table import EntryTable
+from pyls.types import EntrySequence, EntryView, FileEntry
+
+DIGITS = re.compile(r"(\d+)")
 
 
 def natural_sort_key(name: str) -> list:
-    parts = re.split(r"(\d+)", name.lower())
+    parts = DIGITS.split(name.lower())
     return [int(p) if p.isdigit() else p for p in parts]
 
 
-def should_ignore(name: str, patterns: list[str]) -> bool:
-    return any(fnmatch.fnmatch(name, pat) for pat in patterns)
+GLOB_MAGIC = frozenset("*?[")
+
+
+class IgnoreMatcher:
+    """-I / --hide のパターンをまとめてコンパイルしたもの
+
+    ワイルドカードを含まない名前はハッシュ集合、`*.o` のような接尾辞パターンと `build*` のような
+    接頭辞パターンは長さごとの集合に入れ、それ以外だけを 1 本の正規表現にまとめる。
+    集合で引けるパターンはいくつあっても 1 エントリあたりの判定コストは変わらない。
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.literals: set[str] = set()
+        self.suffixes: dict[int, set[str]] = {}
+        self.prefixes: dict[int, set[str]] = {}
+        globs: list[str] = []
+
+        for pat in patterns:
+            if not GLOB_MAGIC.intersection(pat):
+                self.literals.add(pat)
+            elif len(pat) > 1 and pat[0] == "*" and not GLOB_MAGIC.intersection(pat[1:]):
+                self.suffixes.setdefault(len(pat) - 1, set()).add(pat[1:])
+            elif len(pat) > 1 and pat[-1] == "*" and not GLOB_MAGIC.intersection(pat[:-1]):
+                self.prefixes.setdefault(len(pat) - 1, set()).add(pat[:-1])
+            else:
+                globs.append(pat)
+
+        if globs:
+            import fnmatch
+
+            self.regex = re.compile("|".join(fnmatch.translate(pat) for pat in globs))
+        else:
+            self.regex = None
+        self.empty = not (self.literals or self.suffixes or self.prefixes or globs)
 
+    def __bool__(self) -> bool:
+        return not self.empty
 
-def filter_ignored(entries: Iterable[FileEntry], opts) -> list[FileEntry]:
+    def matches(self, name: str) -> bool:
+        if name in self.literals:
+            return True
+        for length, suffixes in self.suffixes.items():
+            if name[-length:] in suffixes:
+                return True
+        for length, prefixes in self.prefixes.items():
+            if name[:length] in prefixes:
+                return True
+        return self.regex is not None and self.regex.match(name) is not None
+
+
+@functools.lru_cache(maxsize=32)
+def compile_ignore_patterns(patterns: tuple[str, ...]) -> IgnoreMatcher:
+    return IgnoreMatcher(patterns)
+
+
+def ignore_matcher(opts) -> IgnoreMatcher:
+    """opts の -I / --hide から IgnoreMatcher を返す (同じパターンならコンパイルは 1 回だけ)"""
     patterns = list(opts.ignore)
 
     if not (opts.all or opts.almost_all):
         if opts.hide:
             patterns.extend(opts.hide)
 
-    print(f"DEBUG: patterns={patterns}", file=sys.stderr)
-    if not patterns:
+    return compile_ignore_patterns(tuple(patterns))
+
+
+def should_ignore(name: str, patterns: list[str]) -> bool:
+    return compile_ignore_patterns(tuple(patterns)).matches(name)
+
+
+@overload
+def filter_ignored(entries: list[FileEntry], opts) -> list[FileEntry]: ...
+@overload
+def filter_ignored(entries: EntrySequence, opts) -> EntrySequence: ...
+def filter_ignored(entries: EntrySequence, opts) -> EntrySequence:
+    matcher = ignore_matcher(opts)
+
+    if isinstance(entries, EntryTable):
+        if not matcher:
+            return entries
+        keep = [i for i, name in enumerate(entries.names) if not matcher.matches(name)]
+        return entries if len(keep) == len(entries) else entries.take(keep)
+
+    if not matcher:
         return list(entries)
-    return [e for e in entries if not should_ignore(e.name, patterns)]
+    return [e for e in entries if not matcher.matches(e.name)]
+
+
+def name_key(e: EntryView) -> str:
+    return e.name.lower()
+
+
+def time_key(e: EntryView) -> float:
+    # 新しい順なので符号を反転して昇順に揃える
+    return -e.file_status.mtime
+
+
+def size_key(e: EntryView) -> int:
+    # 大きい順なので符号を反転して昇順に揃える
+    return -e.file_status.size
+
+
+def ext_key(e: EntryView) -> tuple[str, str]:
+    return extension_sort_key(e.name)
+
 
+def extension_sort_key(name: str) -> tuple[str, str]:
+    if "." in name:
+        extension = name.rsplit(".", 1)[1].lower()
+    else:
+        extension = ""
+    return extension, name.lower()
 
-def iter_display_entries(entries: list[FileEntry], opts) -> list[FileEntry]:
+
+def version_key(e: EntryView) -> list:
+    return natural_sort_key(e.name)
+
+
+# --sort に指定できるキー。どれも昇順で並べれば ls の既定の向きになる
+SORT_KEYS = {
+    "name": name_key,
+    "time": time_key,
+    "size": size_key,
+    "extension": ext_key,
+    "version": version_key,
+}
+
+
+# EntryTable 用。行ビューを作らずに列からまとめてキーを作る
+TABLE_SORT_KEYS = {
+    "name": lambda t: [name.lower() for name in t.names],
+    "time": lambda t: [-ns for ns in t.mtime_ns],
+    "size": lambda t: [-size for size in t.size],
+    "extension": lambda t: [extension_sort_key(name) for name in t.names],
+    "version": lambda t: [natural_sort_key(name) for name in t.names],
+}
+
+
+def sort_key_names(opts) -> list[str]:
+    """opts から使うソートキーを優先順に返す。空ならソートしない"""
     if opts.unsorted or opts.sort == "none":
+        return []
+
+    spec = opts.sort.split(",") if opts.sort else []
+    for name, flag in (
+        ("time", opts.sort_time),
+        ("size", opts.sort_size),
+        ("extension", opts.sort_extension),
+        ("version", opts.sort_version),
+    ):
+        if flag or spec == [name]:
+            return [name]
+
+    return spec or ["name"]
+
+
+@overload
+def iter_display_entries(entries: list[FileEntry], opts) -> list[FileEntry]: ...
+@overload
+def iter_display_entries(entries: EntrySequence, opts) -> EntrySequence: ...
+def iter_display_entries(entries: EntrySequence, opts) -> EntrySequence:
+    """entries を表示順に並べる
+
+    キーはエントリごとに 1 回だけ計算し、1 回の sorted で並べる。
+    --sort=size,name のように複数指定したときはキーのタプルで比較する。
+    """
+    names = sort_key_names(opts)
+    if isinstance(entries, EntryTable):
+        return sort_table(entries, names, opts.reverse)
+    if not names:
         return list(entries)
 
-    if opts.sort_time or opts.sort == "time":
-        return sorted(entries, key=lambda e: e.file_status.mtime, reverse=not opts.reverse)
+    if len(names) == 1:
+        key = SORT_KEYS[names[0]]
+    else:
+        funcs = [SORT_KEYS[name] for name in names]
 
-    if opts.sort_size or opts.sort == "size":
-        return sorted(entries, key=lambda e: e.file_status.size, reverse=not opts.reverse)
+        def key(e: EntryView) -> tuple:
+            return tuple(f(e) for f in funcs)
 
-    if opts.sort_extension or opts.sort == "extension":
-
-        def ext_key(e: FileEntry) -> tuple[str, str]:
-            name = e.name
-            if "." in name:
-                extension = name.rsplit(".", 1)[1].lower()
-            else:
-                extension = ""
-            return extension, name.lower()
+    return sorted(entries, key=key, reverse=opts.reverse)
 
-        return sorted(entries, key=ext_key, reverse=opts.reverse)
 
-    if opts.sort_version or opts.sort == "version":
-        return sorted(entries, key=lambda e: natural_sort_key(e.name), reverse=opts.reverse)
+def sort_table(table: EntryTable, names: list[str], reverse: bool) -> EntryTable:
+    """EntryTable を並べ替える。キーの列を作って添字をソートし、最後に 1 回だけ行を並べ替える"""
+    if not names:
+        return table
 
-    return sorted(entries, key=lambda e: e.name.lower(), reverse=opts.reverse)
+    columns = [TABLE_SORT_KEYS[name](table) for name in names]
+    keys = columns[0] if len(columns) == 1 else list(zip(*columns))
+    order = sorted(range(len(keys)), key=lambda i: keys[i], reverse=reverse)
+    return table.take(order)
@@ -1,59 +1,86 @@
-import grp
-import pwd
+import errno
+import functools
+import math
 import stat
-from datetime import datetime, timedelta
+import time
+from collections.abc import Iterable
 from pathlib import Path
 
-import xattr
-
+from pyls.table import NS_PER_SECOND, EntryTable
 from pyls.types import (
+    EntrySequence,
+    EntryView,
     EscapeSeq,
-    FileEntry,
     FileTypeChar,
     Format,
     IndicatorChar,
     LongFormatLine,
     PermChar,
     SizeUnit,
+    TimeStyle,
     XattrChar,
 )
 
 
-def calculate_total_blocks(entries: list[FileEntry]) -> int:
+def calculate_total_blocks(entries: EntrySequence) -> int:
+    if isinstance(entries, EntryTable):
+        return sum(entries.blocks)
     return sum(e.file_status.blocks for e in entries)
 
 
+FILETYPE_CHARS = {
+    stat.S_IFDIR: FileTypeChar.DIR,
+    stat.S_IFLNK: FileTypeChar.LINK,
+    stat.S_IFREG: FileTypeChar.REGULAR,
+    stat.S_IFBLK: FileTypeChar.BLOCK,
+    stat.S_IFCHR: FileTypeChar.CHAR,
+    stat.S_IFIFO: FileTypeChar.FIFO,
+    stat.S_IFSOCK: FileTypeChar.SOCKET,
+}
+
+
+def build_permission_table() -> tuple[str, ...]:
+    """st_mode の下位 12 ビット (特殊ビット + rwx) 全 4096 通りの rwx 文字列を作る"""
+
+    def triplets(set_exec: str, set_noexec: str) -> tuple[list[str], list[str]]:
+        # (特殊ビットなし, あり) それぞれ rwx の 8 通り
+        rows: tuple[list[str], list[str]] = ([], [])
+        for special in (0, 1):
+            for bits in range(8):
+                r = PermChar.READ if bits & 4 else PermChar.NONE
+                w = PermChar.WRITE if bits & 2 else PermChar.NONE
+                if special:
+                    x = set_exec if bits & 1 else set_noexec
+                else:
+                    x = PermChar.EXEC if bits & 1 else PermChar.NONE
+                rows[special].append(r + w + x)
+        return rows
+
+    user = triplets(PermChar.SETID_EXEC, PermChar.SETID)
+    group = triplets(PermChar.SETID_EXEC, PermChar.SETID)
+    other = triplets(PermChar.STICKY_EXEC, PermChar.STICKY)
+
+    # mode の順 (setuid setgid sticky | user | group | other) に並ぶようにループを入れ子にする
+    return tuple(
+        u + g + o
+        for special in range(8)
+        for u in user[special >> 2 & 1]
+        for g in group[special >> 1 & 1]
+        for o in other[special & 1]
+    )
+
+
+PERMISSION_TABLE = build_permission_table()
+FILETYPE_MASK = 0o170000
+PERMISSION_MASK = 0o7777
+
+
 def filetype_char(st_mode: int) -> str:
-    if stat.S_ISDIR(st_mode):
-        return FileTypeChar.DIR
-    if stat.S_ISLNK(st_mode):
-        return FileTypeChar.LINK
-    return FileTypeChar.REGULAR
+    return FILETYPE_CHARS.get(stat.S_IFMT(st_mode), FileTypeChar.UNKNOWN)
 
 
 def permission_string(st_mode: int) -> str:
-    permission = []
-    for who in (
-        stat.S_IRUSR,
-        stat.S_IWUSR,
-        stat.S_IXUSR,
-        stat.S_IRGRP,
-        stat.S_IWGRP,
-        stat.S_IXGRP,
-        stat.S_IROTH,
-        stat.S_IWOTH,
-        stat.S_IXOTH,
-    ):
-        if st_mode & who:
-            if who in (stat.S_IWUSR, stat.S_IWGRP, stat.S_IWOTH):
-                permission.append(PermChar.WRITE)
-            elif who in (stat.S_IRUSR, stat.S_IRGRP, stat.S_IROTH):
-                permission.append(PermChar.READ)
-            else:
-                permission.append(PermChar.EXEC)
-        else:
-            permission.append(PermChar.NONE)
-    return "".join(permission)
+    return PERMISSION_TABLE[st_mode & PERMISSION_MASK]
 
 
 def max_width(lines: list[LongFormatLine], key) -> int:
@@ -68,7 +95,7 @@ def pad_value(value, width: int, right: bool = True) -> str:
         return str(value).ljust(width)
 
 
-def format_prefix(entry: FileEntry, opts) -> str:
+def format_prefix(entry: EntryView, opts) -> str:
     prefix = ""
     if opts.inode:
         prefix += f"{entry.file_status.inode} "
@@ -77,7 +104,7 @@ def format_prefix(entry: FileEntry, opts) -> str:
     return prefix
 
 
-def format_line_with_widths(line: LongFormatLine, widths: dict[str, int], opts, entry: FileEntry | None = None) -> str:
+def format_line_with_widths(line: LongFormatLine, widths: dict[str, int], opts, entry: EntryView | None = None) -> str:
     prefix = format_prefix(entry, opts) if entry else ""
     parts = [line.mode, pad_value(line.nlink, widths["nlink"])]
 
@@ -94,41 +121,228 @@ def format_line_with_widths(line: LongFormatLine, widths: dict[str, int], opts,
     return prefix + " ".join(parts)
 
 
-def extended_attribute_char(path: Path) -> str:
+# listxattr が ENOTSUP を返したファイルシステム (st_dev)。以降そのデバイスでは問い合わせない
+_xattr_unsupported_devices: set[int] = set()
+
+# これ以上のエントリ数なら listxattr をスレッドで並行に発行する
+XATTR_BATCH_MIN = 256
+XATTR_BATCH_WORKERS = 8
+
+
+def extended_attribute_char(path: Path, dev: int | None = None) -> str:
+    if dev in _xattr_unsupported_devices:
+        return ""
+    # xattr (cffi) の import は 5ms 近くかかるので、-l で初めて使うときに読み込む
+    import xattr
+
     try:
         attrs = xattr.listxattr(str(path))
         return XattrChar.PRESENT if attrs else ""
-    except OSError:
+    except OSError as e:
+        if dev is not None and e.errno in (errno.ENOTSUP, errno.EOPNOTSUPP):
+            _xattr_unsupported_devices.add(dev)
         return ""
 
 
+def extended_attribute_chars(entries: EntrySequence, opts) -> list[str]:
+    """entries の xattr 表示文字をまとめて求める
+
+    デバイスごとに最初の 1 件だけ先に問い合わせて対応有無を確かめ、
+    非対応のデバイスは listxattr を発行しない。件数が多いときは残りをスレッドで並行に問い合わせる。
+    """
+    chars = [""] * len(entries)
+    if opts.no_xattr:
+        return chars
+
+    seen_devices: set[int] = set()
+    pending: list[int] = []
+    for i, e in enumerate(entries):
+        dev = e.file_status.dev
+        if dev in seen_devices:
+            pending.append(i)
+            continue
+        seen_devices.add(dev)
+        chars[i] = extended_attribute_char(e.path, dev)
+
+    pending = [i for i in pending if entries[i].file_status.dev not in _xattr_unsupported_devices]
+
+    if len(pending) < XATTR_BATCH_MIN:
+        for i in pending:
+            chars[i] = extended_attribute_char(entries[i].path, entries[i].file_status.dev)
+        return chars
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=XATTR_BATCH_WORKERS, thread_name_prefix="pyls-xattr") as executor:
+        results = executor.map(lambda i: extended_attribute_char(entries[i].path, entries[i].file_status.dev), pending)
+        for i, char in zip(pending, results):
+            chars[i] = char
+    return chars
+
+
+def clear_xattr_support_cache() -> None:
+    _xattr_unsupported_devices.clear()
+
+
 def user_name(uid: int, numeric: bool) -> str:
     if numeric:
         return str(uid)
+    return lookup_user_name(uid)
+
+
+def group_name(gid: int, numeric: bool) -> str:
+    if numeric:
+        return str(gid)
+    return lookup_group_name(gid)
+
+
+# NSS (LDAP/SSSD など) の問い合わせは 1 回数ミリ秒かかることがあるので、
+# 解決できなかった ID も含めて実行中はずっとキャッシュする (-R の全ディレクトリで共有)
+@functools.cache
+def lookup_user_name(uid: int) -> str:
+    import pwd
+
     try:
         return pwd.getpwuid(uid).pw_name
     except KeyError:
         return str(uid)
 
 
-def group_name(gid: int, numeric: bool) -> str:
-    if numeric:
-        return str(gid)
+@functools.cache
+def lookup_group_name(gid: int) -> str:
+    import grp
+
     try:
         return grp.getgrgid(gid).gr_name
     except KeyError:
         return str(gid)
 
 
-def format_time(timestamp: float) -> str:
-    file_datetime = datetime.fromtimestamp(timestamp)
-    now = datetime.now()
-    six_months_ago = now - timedelta(days=180)
+def prefetch_owner_names(entries: Iterable[EntryView], opts) -> None:
+    """ディレクトリ内の uid/gid を重複なく集めて、それぞれ 1 回だけ名前解決しておく"""
+    if opts.numeric_uid_gid:
+        return
 
-    if file_datetime < six_months_ago or file_datetime > now:
-        return file_datetime.strftime(Format.DAY_WITH_YEAR)
+    if isinstance(entries, EntryTable):
+        uids = set(entries.uid)
+        gids = set(entries.gid)
     else:
-        return file_datetime.strftime(Format.DAY_WITH_TIME)
+        uids = set()
+        gids = set()
+        for e in entries:
+            uids.add(e.file_status.uid)
+            gids.add(e.file_status.gid)
+
+    if not opts.no_owner:
+        for uid in uids:
+            lookup_user_name(uid)
+    if not opts.no_group:
+        for gid in gids:
+            lookup_group_name(gid)
+
+
+def clear_owner_name_cache() -> None:
+    lookup_user_name.cache_clear()
+    lookup_group_name.cache_clear()
+
+
+SIX_MONTHS_SECONDS = 180 * 24 * 60 * 60
+
+# 秒以下を含む strftime 指定子。これを含む +FORMAT は秒単位でキャッシュする
+SUBMINUTE_DIRECTIVES = ("%S", "%s", "%T", "%c", "%X", "%r", "%+")
+
+
+class TimeFormatter:
+    """--time-style に従って時刻を整形する
+
+    "今" と 6 か月前の境界は生成時に固定し、整形結果は分 (秒を含む書式なら秒) 単位でキャッシュする。
+    同じディレクトリのファイルはたいてい数個のバケットに収まるので、strftime はほとんど呼ばれない。
+    """
+
+    def __init__(self, style: str | None = None) -> None:
+        self.now = time.time()
+        self.six_months_ago = self.now - SIX_MONTHS_SECONDS
+        self.full_iso = style == TimeStyle.FULL_ISO
+        self.old_format, self.recent_format = time_style_formats(style)
+        subminute = self.full_iso or any(d in self.old_format + self.recent_format for d in SUBMINUTE_DIRECTIVES)
+        self.bucket_seconds = 1 if subminute else 60
+        self._cache: dict[tuple[int, bool], str] = {}
+
+    def format(self, timestamp: float, nanoseconds: int | None = None) -> str:
+        """nanoseconds は同じ時刻の st_*_ns。full-iso ではこれがあれば秒以下の桁を正確に出す"""
+        recent = self.six_months_ago <= timestamp <= self.now
+        if self.full_iso:
+            return self._format_full_iso(timestamp, nanoseconds, recent)
+
+        # 1970 年より前 (負の時刻) は地方平均時などでオフセットが分単位とは限らないのでキャッシュしない
+        if timestamp < 0:
+            return self._render(timestamp, recent)
+        return self.format_bucket(int(timestamp // self.bucket_seconds), recent)
+
+    def format_bucket(self, bucket: int, recent: bool) -> str:
+        """bucket = timestamp // bucket_seconds の整形結果 (full-iso ではナノ秒を付ける前のもの)"""
+        key = (bucket, recent)
+        text = self._cache.get(key)
+        if text is None:
+            text = self._cache[key] = self._render(bucket * self.bucket_seconds, recent)
+        return text
+
+    def _render(self, timestamp: float, recent: bool) -> str:
+        from datetime import datetime
+
+        dt = datetime.fromtimestamp(timestamp).astimezone()
+        if self.full_iso:
+            return dt.strftime(self.old_format) + "\0" + dt.strftime("%z")
+        return dt.strftime(self.recent_format if recent else self.old_format)
+
+    def _format_full_iso(self, timestamp: float, nanoseconds: int | None, recent: bool) -> str:
+        if nanoseconds is None:
+            # float の時刻しかなければ、ナノ秒の下位桁は丸め誤差を含む
+            seconds = math.floor(timestamp)
+            fraction = min(round((timestamp - seconds) * NS_PER_SECOND), NS_PER_SECOND - 1)
+        else:
+            # 秒と秒以下を同じ整数から求め、float の丸めで秒が繰り上がらないようにする
+            seconds, fraction = divmod(nanoseconds, NS_PER_SECOND)
+        text = self._render(seconds, recent) if seconds < 0 else self.format_bucket(seconds, recent)
+        seconds_text, offset = text.split("\0")
+        return f"{seconds_text}.{fraction:09d} {offset}"
+
+
+def time_style_formats(style: str | None) -> tuple[str, str]:
+    """--time-style から (6 か月以上前・未来の書式, 最近の書式) を返す"""
+    if style is None or style == TimeStyle.LOCALE or style.startswith(TimeStyle.POSIX_PREFIX):
+        return Format.DAY_WITH_YEAR, Format.DAY_WITH_TIME
+    if style == TimeStyle.FULL_ISO:
+        return Format.FULL_ISO, Format.FULL_ISO
+    if style == TimeStyle.LONG_ISO:
+        return Format.LONG_ISO, Format.LONG_ISO
+    if style == TimeStyle.ISO:
+        return Format.ISO_WITH_YEAR, Format.ISO_WITH_TIME
+    if style.startswith(TimeStyle.FORMAT_PREFIX):
+        # GNU ls と同じく、改行があれば 1 行目が古いファイル用、2 行目が最近のファイル用
+        old_format, _, recent_format = style[1:].partition("\n")
+        return old_format, recent_format or old_format
+    raise ValueError(f"invalid time style format: {style!r}")
+
+
+# 1 回の実行で共有する TimeFormatter (style ごと)
+_time_formatters: dict[str | None, TimeFormatter] = {}
+
+
+def time_formatter(style: str | None) -> TimeFormatter:
+    formatter = _time_formatters.get(style)
+    if formatter is None:
+        formatter = _time_formatters[style] = TimeFormatter(style)
+    return formatter
+
+
+def reset_time_formatters() -> None:
+    """実行の開始時に呼び、"今" を取り直す"""
+    _time_formatters.clear()
+
+
+def format_time(timestamp: float, style: str | None = None) -> str:
+    return TimeFormatter(style).format(timestamp)
 
 
 def human_readable_size(size: int) -> str:
@@ -143,35 +357,47 @@ def human_readable_size(size: int) -> str:
     return f" {fsize:.1f}P"
 
 
-def format_long_line(entry: FileEntry, opts) -> LongFormatLine:
+def format_long_line(entry: EntryView, opts, xattr_char: str | None = None) -> LongFormatLine:
     status = entry.file_status
 
+    if xattr_char is None:
+        xattr_char = "" if opts.no_xattr else extended_attribute_char(entry.path, status.dev)
+
     if opts.human_readable:
         size = human_readable_size(status.size)
     else:
         size = str(status.size)
 
-    time_value = opts.time
-    if time_value == "atime" or time_value == "access":
-        display_time = status.atime
-    elif time_value == "ctime" or time_value == "status":
-        display_time = status.ctime
-    else:
-        display_time = status.mtime
+    time_field = display_time_field(opts)
+    display_time = getattr(status, time_field)
+    display_time_ns = getattr(status, time_field + "_ns", None)
 
     return LongFormatLine(
-        mode=mode_string(status.mode) + extended_attribute_char(entry.path),
+        mode=mode_string(status.mode) + xattr_char,
         nlink=status.nlink,
-        owner=user_name(status.uid, numeric=opts.numeric_uid_gid),
-        group=group_name(status.gid, numeric=opts.numeric_uid_gid),
+        # 表示しない列は名前解決しない
+        owner="" if opts.no_owner else user_name(status.uid, numeric=opts.numeric_uid_gid),
+        group="" if opts.no_group else group_name(status.gid, numeric=opts.numeric_uid_gid),
         size=size,
-        time=format_time(display_time),
+        time=time_formatter(opts.time_style).format(display_time, display_time_ns),
         name=format_entry_name(entry, opts),
     )
 
 
+def display_time_field(opts) -> str:
+    """--time で選ばれた FileStatus の時刻フィールド名"""
+    time_value = opts.time
+    if time_value == "atime" or time_value == "access":
+        return "atime"
+    if time_value == "ctime" or time_value == "status":
+        return "ctime"
+    return "mtime"
+
+
 def mode_string(st_mode: int) -> str:
-    return filetype_char(st_mode) + permission_string(st_mode)
+    return (
+        FILETYPE_CHARS.get(st_mode & FILETYPE_MASK, FileTypeChar.UNKNOWN) + PERMISSION_TABLE[st_mode & PERMISSION_MASK]
+    )
 
 
 def c_escape(s: str) -> str:
@@ -206,7 +432,7 @@ def quote_double(s: str) -> str:
     return f'"{s}"'
 
 
-def file_type_indicator(entry: FileEntry, opts) -> str:
+def file_type_indicator(entry: EntryView, opts) -> str:
     if opts.classify or opts.p or opts.file_type:
         if entry.is_dir:
             return IndicatorChar.DIR
@@ -234,7 +460,7 @@ BLUE = "\033[1;34m"
 RESET = "\033[0m"
 
 
-def format_entry_name(entry: FileEntry, opts) -> str:
+def format_entry_name(entry: EntryView, opts) -> str:
     if opts.literal:
         return entry.name
 
@@ -0,0 +1,385 @@
+import argparse
+import errno
+import os
+import sqlite3
+import stat
+import threading
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from urllib.parse import quote
+
+from pyls.core import classify_paths, collect_entries, gobble_file
+from pyls.sqlite_util import python_int, sqlite_int
+from pyls.table import EntryTable, ns_to_seconds
+from pyls.types import EntrySequence, FileEntry, StatResult
+from pyls.writer import writer
+
+# 形式を変えたら上げる。違う値の索引は開かない
+INDEX_VERSION = 1
+
+# この行数ごとに 1 トランザクションで書き込む
+BATCH_ROWS = 100_000
+
+STAT_COLUMNS = ("mode", "nlink", "uid", "gid", "size", "mtime_ns", "atime_ns", "ctime_ns", "blocks", "inode", "dev")
+
+# 名前とパスは TEXT (デコードできないバイトを含むものだけ元のバイト列の BLOB) なので、
+# sqlite3 からもそのまま問い合わせられる。
+# 例: SELECT path, size FROM entries ORDER BY size DESC LIMIT 100
+SCHEMA = f"""
+CREATE TABLE entries (
+    directory,
+    name NOT NULL,
+    path NOT NULL,
+    is_dir INTEGER NOT NULL,
+    {", ".join(f"{column} INTEGER NOT NULL" for column in STAT_COLUMNS)}
+);
+CREATE TABLE directories (
+    path PRIMARY KEY,
+    listed INTEGER NOT NULL,
+    {", ".join(f"{column} INTEGER NOT NULL" for column in STAT_COLUMNS)}
+);
+"""
+
+# 書き終わってから作る (1 行ずつ索引を更新するより速い)
+INDEXES = """
+CREATE INDEX entries_directory ON entries (directory);
+CREATE INDEX entries_path ON entries (path);
+"""
+
+
+def sqlite_text(value: str) -> str | bytes:
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError:
+        return os.fsencode(value)
+    return value
+
+
+def python_text(value: str | bytes) -> str:
+    return os.fsdecode(value) if isinstance(value, bytes) else value
+
+
+def stat_row(st: StatResult) -> tuple[int, ...]:
+    return (
+        st.st_mode,
+        st.st_nlink,
+        st.st_uid,
+        st.st_gid,
+        st.st_size,
+        st.st_mtime_ns,
+        st.st_atime_ns,
+        st.st_ctime_ns,
+        st.st_blocks,
+        sqlite_int(st.st_ino),
+        sqlite_int(st.st_dev),
+    )
+
+
+class IndexedStat:
+    """索引に記録した lstat の結果。os.stat_result と同じ名前の属性で読める"""
+
+    __slots__ = (
+        "st_mode",
+        "st_nlink",
+        "st_uid",
+        "st_gid",
+        "st_size",
+        "st_mtime_ns",
+        "st_atime_ns",
+        "st_ctime_ns",
+        "st_blocks",
+        "st_ino",
+        "st_dev",
+    )
+    # __init__ で __slots__ の順に埋める
+    st_mode: int
+    st_nlink: int
+    st_uid: int
+    st_gid: int
+    st_size: int
+    st_mtime_ns: int
+    st_atime_ns: int
+    st_ctime_ns: int
+    st_blocks: int
+    st_ino: int
+    st_dev: int
+
+    def __init__(self, row: Iterable[int]) -> None:
+        for slot, value in zip(self.__slots__, row):
+            setattr(self, slot, value)
+        self.st_ino = python_int(self.st_ino)
+        self.st_dev = python_int(self.st_dev)
+
+    @property
+    def st_mtime(self) -> float:
+        return ns_to_seconds(self.st_mtime_ns)
+
+    @property
+    def st_atime(self) -> float:
+        return ns_to_seconds(self.st_atime_ns)
+
+    @property
+    def st_ctime(self) -> float:
+        return ns_to_seconds(self.st_ctime_ns)
+
+
+class IndexedDirEntry:
+    """索引に記録した一覧の 1 エントリ。os.DirEntry と同じように使えるが、ファイルシステムには触らない
+
+    シンボリックリンクの先は記録していないので、follow_symlinks=True でもリンク自体の情報を返す。
+    """
+
+    __slots__ = ("name", "path", "_stat")
+
+    def __init__(self, dir_path: str, name: str, st: IndexedStat) -> None:
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+        self._stat = st
+
+    def inode(self) -> int:
+        return self._stat.st_ino
+
+    def stat(self, *, follow_symlinks: bool = True) -> IndexedStat:
+        return self._stat
+
+    def is_dir(self, *, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISDIR(self._stat.st_mode)
+
+    def is_file(self, *, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISREG(self._stat.st_mode)
+
+    def is_symlink(self) -> bool:
+        return stat.S_ISLNK(self._stat.st_mode)
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __repr__(self) -> str:
+        return f"<IndexedDirEntry {self.name!r}>"
+
+
+class IndexedScandir:
+    """索引から作った os.scandir() の代わり"""
+
+    def __init__(self, entries: list[IndexedDirEntry]) -> None:
+        self.entries = entries
+
+    def __enter__(self) -> "IndexedScandir":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def __iter__(self) -> Iterator[IndexedDirEntry]:
+        return iter(self.entries)
+
+
+class IndexWriter:
+    """--index-to の書き込み。一時ファイルに書いて、最後まで書けたら置き換える (途中で止まっても前の索引は残る)"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.temp_path = f"{path}.tmp-{os.getpid()}"
+        if os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+        self._db = sqlite3.connect(self.temp_path)
+        # 失敗したら捨てるファイルなので、ジャーナルも fsync も要らない
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.executescript(SCHEMA)
+        self._db.execute(f"PRAGMA user_version={INDEX_VERSION}")
+        self._rows: list[tuple] = []
+
+    def add_entries(self, directory: Path | None, entries: EntrySequence) -> None:
+        """directory の一覧 (引数で渡したファイルなら None) を書き込む"""
+        if isinstance(entries, EntryTable):
+            table = entries
+        else:
+            table = EntryTable(directory)
+            table.extend(entries)
+
+        directory_text = None if directory is None else sqlite_text(str(directory))
+        inodes = map(sqlite_int, table.inode)
+        devs = map(sqlite_int, table.dev)
+        columns = zip(
+            table.names,
+            table.is_dir,
+            table.mode,
+            table.nlink,
+            table.uid,
+            table.gid,
+            table.size,
+            table.mtime_ns,
+            table.atime_ns,
+            table.ctime_ns,
+            table.blocks,
+            inodes,
+            devs,
+        )
+        for i, (name, *row) in enumerate(columns):
+            self._rows.append((directory_text, sqlite_text(name), sqlite_text(str(table.path(i))), *row))
+            if len(self._rows) >= BATCH_ROWS:
+                self._write_rows()
+
+    def add_directory(self, path: Path, listed: bool = True) -> None:
+        """path 自体の lstat を記録する。listed なら一覧も記録したディレクトリ、そうでなければ .. 用"""
+        try:
+            st = path.lstat()
+        except OSError:
+            return
+        verb = "REPLACE" if listed else "IGNORE"
+        placeholders = ", ".join("?" * (2 + len(STAT_COLUMNS)))
+        with self._db:
+            self._db.execute(
+                f"INSERT OR {verb} INTO directories VALUES ({placeholders})",
+                (sqlite_text(str(path)), listed, *stat_row(st)),
+            )
+
+    def _write_rows(self) -> None:
+        placeholders = ", ".join("?" * (4 + len(STAT_COLUMNS)))
+        with self._db:
+            self._db.executemany(f"INSERT INTO entries VALUES ({placeholders})", self._rows)
+        self._rows.clear()
+
+    def commit(self) -> None:
+        self._write_rows()
+        self._db.executescript(INDEXES)
+        self._db.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self) -> None:
+        self._db.close()
+        try:
+            os.unlink(self.temp_path)
+        except OSError:
+            pass
+
+
+def write_index(args: argparse.Namespace) -> int:
+    """--index-to: 一覧を表示する代わりに、エントリと stat をすべて SQLite に書き込む
+
+    -I で無視したもの以外は隠しファイルも書き込む。
+    """
+    try:
+        index = IndexWriter(args.index_to)
+    except (OSError, sqlite3.Error) as e:
+        writer.error(f"pyls: cannot write index '{args.index_to}': {e}")
+        return 2
+
+    try:
+        files, dirs = classify_paths(args.paths or ["."], args)
+        entries: list[FileEntry] = []
+        for f in files:
+            gobble_file(f, entries)
+        index.add_entries(None, entries)
+
+        # 並べ替えは --from-index で読むときに行う
+        scan_opts = argparse.Namespace(**vars(args))
+        scan_opts.unsorted = True
+        # 隠しファイルも記録し、-a / -A / --hide は読むときに効かせる。
+        # . と .. は読むときに索引のディレクトリの stat から作るので、一覧には入れない
+        scan_opts.all = False
+        scan_opts.almost_all = True
+        for dir_entries in collect_entries(dirs, scan_opts):
+            index.add_directory(dir_entries.path)
+            index.add_entries(dir_entries.path, dir_entries.entries)
+        for d in dirs:
+            index.add_directory(d.parent, listed=False)
+        index.commit()
+    except (OSError, sqlite3.Error) as e:
+        index.abort()
+        writer.error(f"pyls: cannot write index '{args.index_to}': {e}")
+        return 2
+    except BaseException:
+        index.abort()
+        raise
+    return 0
+
+
+class IndexReader:
+    """--from-index: IndexWriter が書いた索引から、ファイルシステムの代わりに lstat と一覧を返す"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # 書き直された索引に気づけるように、開いたファイルを覚えておく
+        st = os.stat(path)
+        self.identity = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        # --jobs のワーカースレッドからも使うので、接続を 1 つにしてロックで守る
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True, check_same_thread=False)
+        (version,) = self._db.execute("PRAGMA user_version").fetchone()
+        if version != INDEX_VERSION:
+            self._db.close()
+            raise sqlite3.DatabaseError("not a pyls index")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def is_dir(self, path: Path) -> bool:
+        """一覧を記録したディレクトリか"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM directories WHERE path = ? AND listed", (sqlite_text(str(path)),)
+            ).fetchone()
+        return row is not None
+
+    def lstat(self, path: Path) -> IndexedStat:
+        key = (sqlite_text(str(path)),)
+        columns = ", ".join(STAT_COLUMNS)
+        with self._lock:
+            row = self._db.execute(f"SELECT {columns} FROM directories WHERE path = ?", key).fetchone()
+            if row is None:
+                row = self._db.execute(f"SELECT {columns} FROM entries WHERE path = ? LIMIT 1", key).fetchone()
+        if row is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
+        return IndexedStat(row)
+
+    def scandir(self, dir_path: Path | str) -> IndexedScandir:
+        """os.scandir(dir_path) と同じように使えるイテレータ。一覧を記録していなければ FileNotFoundError"""
+        dir_path = os.fspath(dir_path)
+        if not self.is_dir(Path(dir_path)):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), dir_path)
+        columns = ", ".join(STAT_COLUMNS)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT name, {columns} FROM entries WHERE directory = ? ORDER BY rowid",
+                (sqlite_text(str(Path(dir_path))),),
+            ).fetchall()
+        return IndexedScandir([IndexedDirEntry(dir_path, python_text(name), IndexedStat(row)) for name, *row in rows])
+
+
+_indexes: dict[str, IndexReader] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(path: str) -> IndexReader | None:
+    """一覧を始めるときに呼ぶ。path の索引を開き、開けなければエラーを出して None
+
+    前に開いた索引が書き直されていれば開き直す (--server で使い続けるとき)。
+    """
+    with _indexes_lock:
+        reader = _indexes.get(path)
+        try:
+            if reader is not None:
+                st = os.stat(path)
+                if reader.identity == (st.st_dev, st.st_ino, st.st_mtime_ns):
+                    return reader
+                reader.close()
+                del _indexes[path]
+            reader = _indexes[path] = IndexReader(path)
+        except (OSError, sqlite3.Error) as e:
+            writer.error(f"pyls: cannot open index '{path}': {e}")
+            return None
+        return reader
+
+
+def shared_index(path: str) -> IndexReader:
+    """一覧の途中で使う。open_index で開いた索引を返す"""
+    with _indexes_lock:
+        reader = _indexes.get(path)
+    if reader is None:
+        reader = open_index(path)
+        if reader is None:
+            raise FileNotFoundError(errno.ENOENT, "cannot open index", path)
+    return reader
@@ -0,0 +1,371 @@
+import functools
+import grp
+import os
+import pwd
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+
+from pyls import core, output
+from pyls import format as pyls_format
+from pyls.writer import writer
+
+# 表示する順番
+PHASES = ("opendir", "readdir", "lstat", "stat", "xattr", "nss", "filter", "sort", "format", "write")
+
+# ファイルシステムと NSS への問い合わせとして回数を出すフェーズ
+SYSCALL_LABELS = {"opendir": "opendir", "lstat": "lstat", "stat": "stat", "xattr": "listxattr", "nss": "NSS lookups"}
+
+
+class Patches:
+    """モジュールやオブジェクトの属性を差し替え、restore() で差し替えた逆順に元に戻す"""
+
+    def __init__(self) -> None:
+        self._saved: list[tuple[object, str, object, bool]] = []
+
+    def patch(self, obj, name: str, wrapper) -> None:
+        # writer.flush のようにクラスから引いていた属性は、戻すときにインスタンスから消す
+        own = name in vars(obj)
+        self._saved.append((obj, name, getattr(obj, name), own))
+        setattr(obj, name, wrapper)
+
+    def restore(self) -> None:
+        while self._saved:
+            obj, name, original, own = self._saved.pop()
+            if own:
+                setattr(obj, name, original)
+            else:
+                delattr(obj, name)
+
+
+class Phase:
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+
+
+class Profile:
+    """フェーズごとの呼び出し回数と時間 (子のフェーズの時間を除いたもの) を集計する
+
+    有効なときだけ計測対象の関数をラッパーに差し替えるので、無効なときの処理には何も足さない。
+    --jobs などのワーカースレッドの時間も足すので、合計は実時間より長くなることがある。
+    差し替えはプロセス全体に効くので、--server では使えない (pyls.main で断る)。
+    """
+
+    def __init__(self) -> None:
+        self.phases = {name: Phase() for name in PHASES}
+        self.entries = 0
+        self.started = time.perf_counter()
+        self.finished: float | None = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # 計測
+
+    def record(self, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            phase = self.phases[name]
+            phase.calls += calls
+            phase.seconds += seconds
+
+    def call(self, name: str, func: Callable, *args, **kwargs):
+        """func を name のフェーズとして計って呼ぶ。中で別のフェーズに入った時間は差し引く"""
+        stack = self._stack()
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self.record(name, elapsed - children)
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        return functools.wraps(func)(functools.partial(self.call, name, func))
+
+    def _stack(self) -> list[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    # 差し替え
+
+    def install(self, patches: Patches) -> None:
+        patches.patch(core, "open_children", self.profiled_open_children(core.open_children))
+        patches.patch(core, "iter_display_entries", self.timed("sort", core.iter_display_entries))
+        patches.patch(output, "iter_display_entries", self.timed("sort", output.iter_display_entries))
+        patches.patch(output, "filter_ignored", self.timed("filter", output.filter_ignored))
+        for name in ("format_long_line", "long_format_lines", "format_line_with_widths", "format_entry_name"):
+            patches.patch(output, name, self.timed("format", getattr(output, name)))
+        patches.patch(output, "print_columns", self.timed("format", output.print_columns))
+        patches.patch(pyls_format, "extended_attribute_char", self.timed("xattr", pyls_format.extended_attribute_char))
+        # 名前はキャッシュしているので、キャッシュに無かったときの問い合わせだけが数えられる
+        patches.patch(pwd, "getpwuid", self.timed("nss", pwd.getpwuid))
+        patches.patch(grp, "getgrgid", self.timed("nss", grp.getgrgid))
+        patches.patch(os, "stat", self.profiled_stat(os.stat))
+        patches.patch(os, "lstat", self.timed("lstat", os.lstat))
+        patches.patch(writer, "flush", self.timed("write", writer.flush))
+
+    def profiled_stat(self, stat: Callable) -> Callable:
+        timed_stat = self.timed("stat", stat)
+        timed_lstat = self.timed("lstat", stat)
+
+        @functools.wraps(stat)
+        def wrapper(path, *args, follow_symlinks: bool = True, **kwargs):
+            func = timed_stat if follow_symlinks else timed_lstat
+            return func(path, *args, follow_symlinks=follow_symlinks, **kwargs)
+
+        return wrapper
+
+    def profiled_open_children(self, open_children: Callable) -> Callable:
+        timed_open = self.timed("opendir", open_children)
+
+        @functools.wraps(open_children)
+        def wrapper(dir_path, opts):
+            return ProfiledChildren(timed_open(dir_path, opts), self)
+
+        return wrapper
+
+    # 出力
+
+    def report(self, file=None) -> None:
+        file = file or sys.stderr
+        wall = (self.finished or time.perf_counter()) - self.started
+        rate = self.entries / wall if wall > 0 else 0.0
+        print(f"pyls profile: {wall * 1e3:.1f} ms wall, {self.entries} entries ({rate:,.0f} entries/s)", file=file)
+        print(f"{'phase':<10}{'calls':>10}{'ms':>12}{'us/call':>10}{'calls/s':>14}", file=file)
+        total = 0.0
+        for name in PHASES:
+            phase = self.phases[name]
+            if not phase.calls:
+                continue
+            total += phase.seconds
+            per_call = phase.seconds / phase.calls * 1e6
+            per_second = phase.calls / phase.seconds if phase.seconds > 0 else 0.0
+            print(
+                f"{name:<10}{phase.calls:>10}{phase.seconds * 1e3:>12.1f}{per_call:>10.1f}{per_second:>14,.0f}",
+                file=file,
+            )
+        print(f"{'other':<10}{'':>10}{max(wall - total, 0.0) * 1e3:>12.1f}", file=file)
+        counts = ", ".join(f"{label} {self.phases[name].calls}" for name, label in SYSCALL_LABELS.items())
+        print(f"filesystem and NSS calls: {counts}", file=file)
+
+
+class Tracer:
+    """ディレクトリごとの処理 (scan, stat batch, sort, render) を Chrome Trace Event 形式のスパンとして記録する
+
+    chrome://tracing や Perfetto で開くと、スレッドごとにどのディレクトリに時間がかかったかが見られる。
+    """
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self.started = time.perf_counter_ns()
+        self._threads: set[int] = set()
+        self._lock = threading.Lock()
+
+    def span(self, name: str, start_ns: int, args: dict) -> None:
+        end_ns = time.perf_counter_ns()
+        tid = threading.get_native_id()
+        event = {
+            "name": name,
+            "cat": "pyls",
+            "ph": "X",
+            "ts": (start_ns - self.started) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": tid,
+            "args": args,
+        }
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self.events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": event["pid"],
+                        "tid": tid,
+                        "args": {"name": threading.current_thread().name},
+                    }
+                )
+            self.events.append(event)
+
+    def traced(self, name: str, func: Callable, describe: Callable) -> Callable:
+        """func を name のスパンとして記録する。describe(引数, 戻り値) がスパンの args を返す"""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            result = func(*args, **kwargs)
+            self.span(name, start, describe(args, result))
+            return result
+
+        return wrapper
+
+    def install(self, patches: Patches) -> None:
+        # -R のディレクトリはワーカースレッドの core.scan_dir で、引数のディレクトリは output から走査する
+        patches.patch(core, "scan_dir", self.traced("scan", core.scan_dir, describe_scanned_dir))
+        patches.patch(output, "scan_dir_children", self.traced("scan", output.scan_dir_children, describe_scan))
+        patches.patch(core, "warm_lstat", self.traced("stat batch", core.warm_lstat, describe_stat_batch))
+        for module in (core, output):
+            patches.patch(
+                module, "iter_display_entries", self.traced("sort", module.iter_display_entries, describe_sort)
+            )
+        patches.patch(output, "print_entries", self.traced("render", output.print_entries, describe_render))
+        patches.patch(output, "collect_entries", self.traced_walk(output.collect_entries))
+
+    def traced_walk(self, collect_entries: Callable) -> Callable:
+        """collect_entries は少しずつ返すジェネレータなので、最後まで読み終わるまでを 1 つのスパンにする"""
+
+        @functools.wraps(collect_entries)
+        def wrapper(paths, opts):
+            start = time.perf_counter_ns()
+            directories = 0
+            try:
+                for dir_entries in collect_entries(paths, opts):
+                    directories += 1
+                    yield dir_entries
+            finally:
+                self.span("walk", start, {"roots": [str(p) for p in paths], "directories": directories})
+
+        return wrapper
+
+    def write(self, path: str) -> None:
+        import json
+
+        trace = {"traceEvents": self.events, "displayTimeUnit": "ms"}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(trace, f)
+        except OSError as e:
+            writer.error(f"pyls: cannot write trace file '{path}': {e.strerror}")
+
+
+def entries_path(entries) -> str | None:
+    path = getattr(entries, "dir_path", None)
+    return None if path is None else str(path)
+
+
+def describe_scanned_dir(args, scanned) -> dict:
+    description = describe_scan(args, (scanned.dir_entries, scanned.exit_status))
+    if scanned.dir_id is not None:
+        description["dev"] = scanned.dir_id.device
+    return description
+
+
+def describe_scan(args, result) -> dict:
+    dir_entries, status = result
+    return {"path": str(dir_entries.path), "entries": len(dir_entries.entries), "status": int(status)}
+
+
+def describe_stat_batch(args, result) -> dict:
+    children = args[0]
+    description = {"entries": len(children)}
+    if children:
+        description["path"] = os.path.dirname(children[0].path)
+    return description
+
+
+def describe_sort(args, result) -> dict:
+    return {"path": entries_path(args[0]), "entries": len(result)}
+
+
+def describe_render(args, result) -> dict:
+    return {"path": entries_path(args[0]), "entries": len(args[0])}
+
+
+class ProfiledDirEntry:
+    """DirEntry の lstat を計るラッパー。DirEntry は結果を覚えているので、数えるのは最初の 1 回だけ"""
+
+    __slots__ = ("entry", "profile", "name", "path", "_stat_done")
+
+    def __init__(self, entry, profile: Profile) -> None:
+        self.entry = entry
+        self.profile = profile
+        self.name = entry.name
+        self.path = entry.path
+        self._stat_done = False
+
+    def stat(self, *, follow_symlinks: bool = True):
+        if follow_symlinks:
+            return self.profile.call("stat", self.entry.stat)
+        if self._stat_done:
+            return self.entry.stat(follow_symlinks=False)
+        result = self.profile.call("lstat", self.entry.stat, follow_symlinks=False)
+        self._stat_done = True
+        return result
+
+    def inode(self) -> int:
+        return self.entry.inode()
+
+    def is_dir(self, *, follow_symlinks: bool = True) -> bool:
+        return self.entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, *, follow_symlinks: bool = True) -> bool:
+        return self.entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self) -> bool:
+        return self.entry.is_symlink()
+
+    def __fspath__(self) -> str:
+        return self.path
+
+
+class ProfiledChildren:
+    """os.scandir() の結果を包み、1 エントリ読むごとの時間を readdir として数える"""
+
+    def __init__(self, children, profile: Profile) -> None:
+        self.children = children
+        self.profile = profile
+
+    def __enter__(self) -> "ProfiledChildren":
+        self.children.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self.children.__exit__(*exc_info)
+
+    def __iter__(self) -> Iterator[ProfiledDirEntry]:
+        profile = self.profile
+        it = iter(self.children)
+        while True:
+            start = time.perf_counter()
+            try:
+                entry = next(it)
+            except StopIteration:
+                profile.record("readdir", time.perf_counter() - start, calls=0)
+                return
+            profile.record("readdir", time.perf_counter() - start)
+            with profile._lock:
+                profile.entries += 1
+            yield ProfiledDirEntry(entry, profile)
+
+
+def instrumented(func: Callable, *args, profile: bool = False, trace_file: str | None = None):
+    """func(*args) を計測しながら実行する
+
+    profile なら終わったあとに内訳を stderr に出し、trace_file があればスパンを Chrome のトレース形式で書く。
+    """
+    patches = Patches()
+    profiler = Profile() if profile else None
+    tracer = Tracer() if trace_file else None
+    if profiler is not None:
+        profiler.install(patches)
+    if tracer is not None:
+        tracer.install(patches)
+    try:
+        return func(*args)
+    finally:
+        patches.restore()
+        writer.flush()
+        if profiler is not None:
+            profiler.finished = time.perf_counter()
+            profiler.report()
+        if tracer is not None:
+            tracer.write(trace_file)
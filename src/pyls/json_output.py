@@ -0,0 +1,131 @@
+import argparse
+import json
+import stat
+from collections.abc import Iterator
+from pathlib import Path
+
+from pyls.core import classify_paths, collect_entries, directory_id, gobble_file, iter_dir_children
+from pyls.filter import filter_ignored, iter_display_entries, sort_key_names
+from pyls.types import DirectoryIdentifier, EntryView, FileEntry, FileStatus, OutputFormat
+from pyls.writer import buffered, writer
+
+FILE_TYPES = {
+    stat.S_IFREG: "file",
+    stat.S_IFDIR: "directory",
+    stat.S_IFLNK: "symlink",
+    stat.S_IFIFO: "fifo",
+    stat.S_IFSOCK: "socket",
+    stat.S_IFBLK: "block_device",
+    stat.S_IFCHR: "char_device",
+}
+
+# ASCII だけで出す。デコードできなかったバイトは \udcXX になり、os.fsencode で元のバイト列に戻せる
+encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def entry_record(entry: EntryView, directory: Path | None) -> dict:
+    """1 エントリ分の JSON オブジェクト。directory は一覧したディレクトリ (引数で渡したファイルなら None)"""
+    status = entry.file_status
+    record = {
+        "name": entry.name,
+        "path": str(entry.path),
+        "directory": None if directory is None else str(directory),
+        "type": FILE_TYPES.get(stat.S_IFMT(status.mode), "unknown"),
+    }
+    for field in FileStatus._fields:
+        record[field] = getattr(status, field)
+    return record
+
+
+class JsonWriter:
+    """ndjson なら 1 行に 1 エントリ、json ならエントリの配列を 1 つ、書いた順に writer へ出す"""
+
+    def __init__(self, ndjson: bool) -> None:
+        self.ndjson = ndjson
+        self.count = 0
+
+    def start(self) -> None:
+        if not self.ndjson:
+            writer.write("[")
+
+    def entry(self, entry: EntryView, directory: Path | None) -> None:
+        text = encode(entry_record(entry, directory))
+        if self.ndjson:
+            writer.line(text)
+        else:
+            writer.write(("\n" if self.count == 0 else ",\n") + text)
+        self.count += 1
+
+    def finish(self) -> None:
+        if not self.ndjson:
+            writer.line("\n]" if self.count else "]")
+
+
+@buffered
+def print_json_listing(args: argparse.Namespace) -> None:
+    """--format=json / ndjson。LongFormatLine を通さず、FileStatus の値をそのまま出す
+
+    ディレクトリは読んで並べ終わるごとに、-U ならエントリを読むごとに書き出すので、
+    巨大な木でも持つのは 1 ディレクトリ分 (-U ならそれも持たない) だけで済む。
+    エラーメッセージは JSON に混ざらないよう stderr に出す。
+    """
+    out = JsonWriter(args.format == OutputFormat.NDJSON)
+    out.start()
+    files, dirs = classify_paths(args.paths or ["."], args)
+
+    messages: list[str] = []
+    entries: list[FileEntry] = []
+    for f in files:
+        gobble_file(f, entries, messages, args)
+    report_errors(messages)
+    for entry in iter_display_entries(filter_ignored(entries, args), args):
+        out.entry(entry, None)
+
+    if sort_key_names(args):
+        # -R でなければディレクトリごとに別々に走査する (同じディレクトリを 2 回渡しても 2 回出す)
+        groups = [dirs] if args.recursive else [[d] for d in dirs]
+        for group in groups:
+            for dir_entries in collect_entries(group, args, on_message=writer.error):
+                for entry in dir_entries.entries:
+                    out.entry(entry, dir_entries.path)
+                writer.flush()
+    else:
+        for entry, directory in walk_unsorted(dirs, args, messages):
+            out.entry(entry, directory)
+            report_errors(messages)
+
+    report_errors(messages)
+    out.finish()
+
+
+def walk_unsorted(dirs: list[Path], opts, messages: list[str]) -> Iterator[tuple[FileEntry, Path]]:
+    """-U のとき、dirs (と -R ならその下) のエントリを collect_entries と同じ DFS 順に読んだそばから返す
+
+    持つのはまだ読んでいない子ディレクトリのパスだけ。
+    """
+    # 末尾が次に読むディレクトリ
+    pending = list(reversed(dirs))
+    visited_dirs: set[DirectoryIdentifier] = set()
+    while pending:
+        d = pending.pop()
+        if opts.recursive:
+            dir_id = directory_id(d, opts)
+            if dir_id is not None:
+                if dir_id in visited_dirs:
+                    messages.append(f"pyls: {d}: not listing already-listed directory")
+                    continue
+                visited_dirs.add(dir_id)
+
+        subdirs = []
+        for entry in iter_dir_children(d, opts, messages):
+            yield entry, d
+            if opts.recursive and entry.is_dir and entry.name not in {".", ".."}:
+                subdirs.append(entry.path)
+        writer.flush()
+        pending.extend(reversed(subdirs))
+
+
+def report_errors(messages: list[str]) -> None:
+    for message in messages:
+        writer.error(message)
+    messages.clear()
@@ -0,0 +1,263 @@
+import os
+import sqlite3
+import stat
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Iterator
+from pathlib import Path
+
+from pyls.sqlite_util import sqlite_int
+from pyls.types import dir_entry_mode
+from pyls.writer import writer
+
+# 最後に使ったのが古いものから消して、保存する一覧のデータの合計をこれ以下に保つ
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# mtime / ctime がこれより新しいディレクトリは保存しない。タイムスタンプの粒度 (FAT は 2 秒) の中で
+# もう一度変更されると mtime も ctime も変わらず、古い一覧を返してしまうため
+RACY_WINDOW_NS = 2_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    names BLOB NOT NULL,
+    modes BLOB NOT NULL,
+    inodes BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used_at INTEGER NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE INDEX IF NOT EXISTS listings_used_at ON listings (used_at);
+"""
+
+FS_ENCODING = sys.getfilesystemencoding()
+FS_ERRORS = sys.getfilesystemencodeerrors()
+
+
+def default_cache_path() -> str:
+    path = os.environ.get("PYLS_LISTING_CACHE")
+    if path:
+        return path
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "pyls", "listing.sqlite")
+
+
+class CachedDirEntry:
+    """キャッシュした一覧の 1 エントリ。os.DirEntry と同じように使える
+
+    種別は readdir の d_type から分かった分だけ持っていて、分からなかったものや stat() は必要になったときに lstat する。
+    """
+
+    __slots__ = ("name", "path", "_mode", "_inode", "_lstat")
+
+    def __init__(self, dir_path: str, name: str, mode: int, inode: int) -> None:
+        self.name = name
+        self.path = os.path.join(dir_path, name)
+        self._mode = mode
+        self._inode = inode
+        self._lstat: os.stat_result | None = None
+
+    def inode(self) -> int:
+        return self._inode
+
+    def stat(self, *, follow_symlinks: bool = True) -> os.stat_result:
+        if follow_symlinks:
+            return os.stat(self.path)
+        if self._lstat is None:
+            self._lstat = os.lstat(self.path)
+        return self._lstat
+
+    def is_dir(self, *, follow_symlinks: bool = True) -> bool:
+        return self._test(stat.S_ISDIR, follow_symlinks)
+
+    def is_file(self, *, follow_symlinks: bool = True) -> bool:
+        return self._test(stat.S_ISREG, follow_symlinks)
+
+    def is_symlink(self) -> bool:
+        return self._test(stat.S_ISLNK, False)
+
+    def _test(self, predicate, follow_symlinks: bool) -> bool:
+        mode = self._mode
+        if not mode or (follow_symlinks and stat.S_ISLNK(mode)):
+            try:
+                mode = self.stat(follow_symlinks=follow_symlinks).st_mode
+            except FileNotFoundError:
+                return False
+        return predicate(mode)
+
+    def __fspath__(self) -> str:
+        return self.path
+
+    def __repr__(self) -> str:
+        return f"<CachedDirEntry {self.name!r}>"
+
+
+class CachedScandir:
+    """キャッシュから作った os.scandir() の代わり"""
+
+    def __init__(self, dir_path: str, names: list[str], modes: array, inodes: array) -> None:
+        self.dir_path = dir_path
+        self.names = names
+        self.modes = modes
+        self.inodes = inodes
+
+    def __enter__(self) -> "CachedScandir":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def __iter__(self) -> Iterator[CachedDirEntry]:
+        dir_path = self.dir_path
+        for name, mode, inode in zip(self.names, self.modes, self.inodes):
+            yield CachedDirEntry(dir_path, name, mode, inode)
+
+
+class RecordingScandir:
+    """os.scandir() の結果をそのまま返しながら記録し、最後まで読めたらキャッシュに保存する"""
+
+    def __init__(self, cache: "ListingCache", dir_path: str, dir_stat: os.stat_result) -> None:
+        self.cache = cache
+        self.dir_stat = dir_stat
+        self.children = os.scandir(dir_path)
+
+    def __enter__(self) -> "RecordingScandir":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.children.close()
+
+    def __iter__(self) -> Iterator[os.DirEntry]:
+        names: list[str] = []
+        modes = array("I")
+        inodes = array("Q")
+        for entry in self.children:
+            names.append(entry.name)
+            modes.append(dir_entry_mode(entry) or 0)
+            inodes.append(entry.inode())
+            yield entry
+        self.cache.store(self.dir_stat, names, modes, inodes)
+
+
+class ListingCache:
+    """ディレクトリの (st_dev, st_ino) ごとに、子の名前・種別・inode 番号を SQLite に保存する
+
+    ディレクトリの mtime と ctime (ns) が保存したときと同じなら、readdir せずに保存した一覧を返す。
+    子の stat 情報は保存しない (子のサイズや時刻が変わってもディレクトリの mtime は変わらない) ので、
+    -l などで必要なときは今まで通りエントリごとに lstat する。
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        # --jobs のワーカースレッドからも使うので、接続を 1 つにしてロックで守る
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        with self._lock:
+            # WAL なら別の pyls が書いている間も読める
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def scandir(self, dir_path: Path | str) -> CachedScandir | RecordingScandir:
+        """os.scandir(dir_path) と同じように使えるイテレータを返す。エラーも os.scandir と同じ例外になる"""
+        dir_path = os.fspath(dir_path)
+        dir_stat = os.stat(dir_path)
+        cached = self.lookup(dir_path, dir_stat)
+        if cached is not None:
+            return cached
+        return RecordingScandir(self, dir_path, dir_stat)
+
+    def lookup(self, dir_path: str, dir_stat: os.stat_result) -> CachedScandir | None:
+        key = (sqlite_int(dir_stat.st_dev), sqlite_int(dir_stat.st_ino))
+        try:
+            with self._lock, self._db:
+                row = self._db.execute(
+                    "SELECT mtime_ns, ctime_ns, names, modes, inodes FROM listings WHERE dev = ? AND ino = ?", key
+                ).fetchone()
+                if row is None or row[0] != dir_stat.st_mtime_ns or row[1] != dir_stat.st_ctime_ns:
+                    return None
+                self._db.execute("UPDATE listings SET used_at = ? WHERE dev = ? AND ino = ?", (time.time_ns(), *key))
+        except sqlite3.Error:
+            return None
+
+        _, _, names_blob, modes_blob, inodes_blob = row
+        # NUL はファイル名に入らないので、まとめてデコードしてから分ける
+        names = names_blob.decode(FS_ENCODING, FS_ERRORS).split("\0") if names_blob else []
+        modes = array("I")
+        modes.frombytes(modes_blob)
+        inodes = array("Q")
+        inodes.frombytes(inodes_blob)
+        return CachedScandir(dir_path, names, modes, inodes)
+
+    def store(self, dir_stat: os.stat_result, names: list[str], modes: array, inodes: array) -> None:
+        now = time.time_ns()
+        if now - max(dir_stat.st_mtime_ns, dir_stat.st_ctime_ns) < RACY_WINDOW_NS:
+            return
+
+        names_blob = "\0".join(names).encode(FS_ENCODING, FS_ERRORS)
+        modes_blob = modes.tobytes()
+        inodes_blob = inodes.tobytes()
+        size = len(names_blob) + len(modes_blob) + len(inodes_blob)
+        if size > self.max_bytes:
+            return
+
+        row = (
+            sqlite_int(dir_stat.st_dev),
+            sqlite_int(dir_stat.st_ino),
+            dir_stat.st_mtime_ns,
+            dir_stat.st_ctime_ns,
+            names_blob,
+            modes_blob,
+            inodes_blob,
+            size,
+            now,
+        )
+        try:
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self._evict()
+        except sqlite3.Error:
+            pass
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM listings").fetchone()
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for rowid, size in self._db.execute("SELECT rowid, size FROM listings ORDER BY used_at"):
+            stale.append((rowid,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._db.executemany("DELETE FROM listings WHERE rowid = ?", stale)
+
+
+_caches: dict[str, ListingCache | None] = {}
+_caches_lock = threading.Lock()
+
+
+def shared_cache(path: str | None = None) -> ListingCache | None:
+    """path (省略時は default_cache_path()) のキャッシュを開く。開けなければ警告を 1 回だけ出して None"""
+    if path is None:
+        path = default_cache_path()
+    with _caches_lock:
+        if path not in _caches:
+            try:
+                _caches[path] = ListingCache(path)
+            except (OSError, sqlite3.Error) as e:
+                writer.error(f"pyls: cannot open listing cache '{path}': {e}")
+                _caches[path] = None
+        return _caches[path]
@@ -1,19 +1,129 @@
 from __future__ import annotations
 
+import argparse
+import os
 import sys
 from pathlib import Path
 
 from pyls.cli import build_parser
 from pyls.core import classify_paths
-from pyls.output import print_directory, print_files, print_subdirs_recursively
+from pyls.format import reset_time_formatters
+from pyls.output import print_directory, print_files, print_subdirs_recursively, print_watch_frame
+from pyls.types import OutputFormat
+from pyls.writer import buffered, writer
 
 
-def main(argv: list[str] | None = None) -> None:
+def main(argv: list[str] | None = None) -> int | None:
     if argv is None:
         argv = sys.argv[1:]
 
     args = build_parser().parse_args(argv)
+    if args.server:
+        option = instrument_option(args)
+        if option:
+            # 計測はモジュールの関数を差し替えるので、常駐するプロセスでは使わない
+            writer.error(f"pyls: {option} cannot be combined with --server")
+            return 2
+        return run_server(args)
+    if args.watch:
+        return run_watch(args)
+    return run_listing(args)
+
+
+def instrument_option(args: argparse.Namespace) -> str | None:
+    """--profile / --trace-file のうち指定されたもの"""
+    if args.profile:
+        return "--profile"
+    if args.trace_file:
+        return "--trace-file"
+    return None
+
+
+def run_listing(args: argparse.Namespace) -> int | None:
+    profile = args.profile or os.environ.get("PYLS_PROFILE", "") not in ("", "0")
+    if profile or args.trace_file:
+        from pyls.instrument import instrumented
+
+        return instrumented(list_paths, args, profile=profile, trace_file=args.trace_file)
+    return list_paths(args)
+
+
+def run_server(args: argparse.Namespace) -> int:
+    from pyls.client import default_socket_path
+    from pyls.server import serve
+
+    return serve(args.socket or default_socket_path(), handle_request)
+
+
+def run_watch(args: argparse.Namespace) -> int:
+    from pyls.watch import watch
+
+    paths = args.paths if args.paths else ["."]
+    if len(paths) != 1 or args.recursive or args.directory:
+        writer.error("pyls: --watch takes a single directory and cannot be combined with -R or -d")
+        return 2
+    path = Path(paths[0])
+    if not path.is_dir():
+        writer.error(f"pyls: --watch: '{path}' is not a directory")
+        return 2
+
+    args.colorize = sys.stdout.isatty()
+    frames = 0
+
+    def render(entries) -> None:
+        nonlocal frames
+        # 長く動くので、「半年以内か」の基準になる現在時刻を描くたびに取り直す
+        reset_time_formatters()
+        print_watch_frame(entries, args, first=frames == 0)
+        frames += 1
+
+    try:
+        return int(watch(path, args, render))
+    except OSError as e:
+        writer.error(f"pyls: cannot watch '{path}': {e.strerror or e}")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+def handle_request(argv: list[str]) -> int | None:
+    """pyls --server が pyls-client からのリクエストごとに呼ぶ"""
+    args = build_parser().parse_args(argv)
+    # 計測は pwd.getpwuid や os.lstat などプロセス全体の関数を差し替えるので、サーバーでは受け付けない
+    option = "--server" if args.server else "--watch" if args.watch else instrument_option(args)
+    if option:
+        writer.error(f"pyls: {option} cannot be requested through pyls-client")
+        return 2
+    # サーバーの環境に PYLS_PROFILE があっても計測しない
+    return list_paths(args)
+
+
+@buffered
+def list_paths(args: argparse.Namespace) -> int | None:
+    if args.index_to:
+        from pyls.index import write_index
+
+        return write_index(args)
+    if args.from_index:
+        from pyls.index import open_index
+
+        if open_index(args.from_index) is None:
+            return 2
+        # 拡張属性は索引に記録していない
+        args.no_xattr = True
+
+    if args.format in OutputFormat.MACHINE:
+        from pyls.json_output import print_json_listing
+
+        print_json_listing(args)
+        return
+    if args.format in OutputFormat.LONG:
+        args.long = True
+    elif args.format == OutputFormat.SINGLE_COLUMN:
+        args.one_column = True
+
     args.colorize = sys.stdout.isatty()
+    reset_time_formatters()
     paths = args.paths if args.paths else ["."]
     files, dirs = classify_paths(paths, args)
 
@@ -1,51 +1,70 @@
 import argparse
-import shutil
+import sys
 from pathlib import Path
 
+from pyls.cli import terminal_columns
 from pyls.core import collect_entries, gobble_file, scan_dir_children
 from pyls.filter import filter_ignored, iter_display_entries
 from pyls.format import (
     calculate_total_blocks,
+    extended_attribute_chars,
     format_entry_name,
     format_line_with_widths,
     format_long_line,
     format_prefix,
     human_readable_size,
     max_width,
+    prefetch_owner_names,
 )
-from pyls.types import FileEntry
+from pyls.table import EntryTable
+from pyls.types import EntrySequence, FileEntry
+from pyls.vectorized import can_vectorize, long_format_lines
+from pyls.vectorized import total_blocks as vectorized_total_blocks
+from pyls.writer import buffered, writer
 
 
-def print_entries(entries: list[FileEntry], opts) -> None:
+@buffered
+def print_entries(entries: EntrySequence, opts, presorted: bool = False) -> None:
+    """presorted=True なら entries は scan_dir_children で並べ済みなので、もう一度ソートしない"""
     filtered_entries = filter_ignored(entries, opts)
-    display_entries = list(iter_display_entries(filtered_entries, opts))
+    display_entries = filtered_entries if presorted else iter_display_entries(filtered_entries, opts)
 
     if opts.numeric_uid_gid or opts.no_owner:
         opts.long = True
 
     if opts.long or opts.size:
-        total_blocks = calculate_total_blocks(display_entries)
+        if isinstance(display_entries, EntryTable) and can_vectorize(display_entries):
+            total_blocks = vectorized_total_blocks(display_entries)
+        else:
+            total_blocks = calculate_total_blocks(display_entries)
         if opts.human_readable:
             total_str = human_readable_size(total_blocks * 512)
         else:
             total_str = str(total_blocks)
-        print(f"total {total_str}")
+        writer.line(f"total {total_str}")
 
     if opts.long:
+        prefetch_owner_names(display_entries, opts)
+
         # 1パス目：生データ収集
-        raw_lines = [format_long_line(entry, opts) for entry in display_entries]
+        xattr_chars = extended_attribute_chars(display_entries, opts)
+        if isinstance(display_entries, EntryTable) and can_vectorize(display_entries):
+            # NumPy があれば列ごとにまとめて整形し、幅も同時に求める
+            raw_lines, widths = long_format_lines(display_entries, opts, xattr_chars)
+        else:
+            raw_lines = [format_long_line(entry, opts, xattr) for entry, xattr in zip(display_entries, xattr_chars)]
 
-        # 幅計算
-        widths = {
-            "nlink": max_width(raw_lines, lambda x: x.nlink),
-            "owner": max_width(raw_lines, lambda x: x.owner),
-            "group": max_width(raw_lines, lambda x: x.group),
-            "size": max_width(raw_lines, lambda x: x.size),
-        }
+            # 幅計算
+            widths = {
+                "nlink": max_width(raw_lines, lambda x: x.nlink),
+                "owner": max_width(raw_lines, lambda x: x.owner),
+                "group": max_width(raw_lines, lambda x: x.group),
+                "size": max_width(raw_lines, lambda x: x.size),
+            }
 
         # 2パス目：整形して出力
         for entry, line in zip(display_entries, raw_lines):
-            print(format_line_with_widths(line, widths, opts, entry))
+            writer.line(format_line_with_widths(line, widths, opts, entry))
     else:
         names = []
         for entry in display_entries:
@@ -53,90 +72,128 @@ def print_entries(entries: list[FileEntry], opts) -> None:
             names.append(prefix + format_entry_name(entry, opts))
 
         if opts.one_column:
-            for i, name in enumerate(names):
-                print(name)
+            for name in names:
+                writer.line(name)
         else:
             terminal_width = opts.width if opts.width else current_terminal_width()
             tab_size = opts.tabsize if opts.tabsize else 8
             print_columns(names, terminal_width, tab_size)
-            print()
+            writer.line()
 
 
+@buffered
 def print_files(files: list[Path], args: argparse.Namespace) -> None:
     entries: list[FileEntry] = []
 
     for f in files:
-        gobble_file(f, entries)
+        gobble_file(f, entries, opts=args)
     print_entries(entries, args)
 
 
+@buffered
 def print_directory(d: Path, args, show_header: bool) -> list[Path]:
     if show_header:
-        print(f"{d}:")
+        writer.line(f"{d}:")
 
-    dir_entries, _ = scan_dir_children(d, args, entries=[])
-    print_entries(dir_entries.entries, args)
+    dir_entries, _ = scan_dir_children(d, args, entries=EntryTable(d))
+    print_entries(dir_entries.entries, args, presorted=True)
 
     return [entry.path for entry in dir_entries.entries if entry.is_dir and entry.name not in {".", ".."}]
 
 
+@buffered
 def print_subdirs_recursively(subdirs: list[Path], args) -> None:
-    entries_list = list(collect_entries(subdirs, args))
     start_with_dot = not args.paths or args.paths == ["."]
 
-    for i, sub_entry in enumerate(entries_list):
+    # 走査が終わったディレクトリから順に出力し、木全体をメモリに載せない
+    for i, sub_entry in enumerate(collect_entries(subdirs, args)):
+        if i > 0:
+            writer.line()
         path_str = str(sub_entry.path)
         if start_with_dot:
             path_str = "./" + path_str
-        print(f"{path_str}:")
-        print_entries(sub_entry.entries, args)
-        print_newline_except_last(i, len(entries_list))
+        writer.line(f"{path_str}:")
+        print_entries(sub_entry.entries, args, presorted=True)
+
+
+# カーソルを左上に戻して画面を消す
+CLEAR_SCREEN = "\x1b[H\x1b[2J"
+
+
+@buffered
+def print_watch_frame(entries: list[FileEntry], args, first: bool) -> None:
+    """--watch で一覧を描き直す。端末なら画面を消してから、そうでなければ空行で区切って出す"""
+    if sys.stdout.isatty():
+        writer.write(CLEAR_SCREEN)
+    elif not first:
+        writer.line()
+    print_entries(entries, args, presorted=True)
 
 
 def print_newline_except_last(index: int, total: int) -> None:
-    print("\n" if index + 1 < total else "", end="")
+    if index + 1 < total:
+        writer.line()
 
 
 def current_terminal_width() -> int:
-    return shutil.get_terminal_size().columns
+    return terminal_columns()
+
 
+def column_layout(names: list[str], terminal_width: int) -> tuple[int, int, list[int]]:
+    """横並び表示の (カラム数, 行数, 各カラム幅) を求める。幅は区切りの 2 文字込み
 
+    GNU ls と同じく「各カラム幅の合計 (行の長さ) が端末幅に収まる最大のカラム数」を選ぶ。
+    カラム数を大きい方から試し、カラムごとの最大幅をスライスでまとめて求めて行の長さを積み上げ、
+    端末幅を超えた時点で次の候補に移る。最初に収まった候補が答えなので、
+    ほとんどの候補は数カラム分を見ただけで打ち切られる。
+    """
+    n = len(names)
+    lengths = [len(name) + 2 for name in names]
+    # 最大可能カラム数 (MIN_COLUMN_WIDTH = 3: 1文字 + 2スペース)
+    max_cols = min(n, max(1, terminal_width // 3))
+    # 最後のカラムの区切り 2 文字は行の長さに含めない
+    limit = terminal_width + 2
+    shortest = min(lengths)
+
+    for cols in range(max_cols, 0, -1):
+        rows = (n + cols - 1) // cols
+        used_cols = (n + rows - 1) // rows
+        # どのカラムも一番短い名前より狭くはならない
+        if used_cols * shortest > limit:
+            continue
+
+        widths: list[int] = []
+        line_len = 0
+        for start in range(0, n, rows):
+            width = max(lengths[start : start + rows])
+            line_len += width
+            if line_len > limit:
+                break
+            widths.append(width)
+        else:
+            return cols, rows, widths + [0] * (cols - used_cols)
+
+    # 1 カラムでも収まらない長い名前は 1 行に 1 つずつ出す
+    return 1, n, [max(lengths)]
+
+
+@buffered
 def print_columns(names: list[str], terminal_width: int, tab_size: int = 8) -> None:
     """ファイル名を横並びで表示"""
     if not names:
         return
 
-    # 最大可能カラム数 (MIN_COLUMN_WIDTH = 3: 1文字 + 2スペース)
-    max_cols = min(len(names), max(1, terminal_width // 3))
-
-    # 各カラム数配置の情報を初期化
-    col_widths = {cols: [0] * cols for cols in range(1, max_cols + 1)}
-    valid = {cols: True for cols in range(1, max_cols + 1)}
-
-    # 各ファイルを処理して、無効なカラム数を除外
-    for i, name in enumerate(names):
-        name_len = len(name)
-        for cols in range(1, max_cols + 1):
-            if not valid[cols]:
-                continue
-            rows = (len(names) + cols - 1) // cols
-            col = i // rows
-            col_widths[cols][col] = max(col_widths[cols][col], name_len + 2)
-            if sum(col_widths[cols]) - 2 > terminal_width:
-                valid[cols] = False
-
-    # 有効な最大カラム数を見つける
-    cols = max(c for c in range(1, max_cols + 1) if valid[c])
-    rows = (len(names) + cols - 1) // cols
-    widths = col_widths[cols]
-
-    # 表示
+    cols, rows, widths = column_layout(names, terminal_width)
+
+    # 表示 (1 行ずつまとめて書き出す)
     for row in range(rows):
+        cells = []
         for col in range(cols):
             idx = col * rows + row
             if idx < len(names):
                 if col < cols - 1:
-                    print(names[idx].ljust(widths[col]), end="")
+                    cells.append(names[idx].ljust(widths[col]))
                 else:
-                    print(names[idx], end="")
+                    cells.append(names[idx])
+        writer.write("".join(cells))
         print_newline_except_last(row, rows)
@@ -0,0 +1,244 @@
+import io
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import time
+import traceback
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from pyls.client import (
+    EXIT,
+    EXIT_STATUS,
+    MAX_REQUEST_SIZE,
+    REQUEST,
+    STDERR,
+    STDOUT,
+    decode_request,
+    recv_frame,
+    send_frame,
+)
+from pyls.format import clear_owner_name_cache, clear_xattr_support_cache
+
+# 変わったらユーザー名・グループ名のキャッシュを捨てるファイル
+NSS_FILES = ("/etc/passwd", "/etc/group", "/etc/nsswitch.conf")
+
+# LDAP など、ファイルを見ても変更が分からない名前解決のために、これより古いキャッシュも捨てる
+CACHE_TTL_SECONDS = 60.0
+
+
+class CacheValidator:
+    """リクエストの前に呼び、実行をまたいで持っているキャッシュがまだ使えるか確かめる"""
+
+    def __init__(self, paths: tuple[str, ...] = NSS_FILES, ttl: float = CACHE_TTL_SECONDS) -> None:
+        self.paths = paths
+        self.ttl = ttl
+        self.signature: tuple | None = None
+        self.loaded_at = 0.0
+
+    def refresh(self) -> bool:
+        """キャッシュを捨てたら True"""
+        signature = files_signature(self.paths)
+        now = time.monotonic()
+        if signature == self.signature and now - self.loaded_at < self.ttl:
+            return False
+        clear_owner_name_cache()
+        clear_xattr_support_cache()
+        self.signature = signature
+        self.loaded_at = now
+        return True
+
+
+def files_signature(paths: tuple[str, ...]) -> tuple:
+    signature = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            signature.append(None)
+        else:
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns))
+    return tuple(signature)
+
+
+class FrameStream(io.RawIOBase):
+    """書き込まれたバイト列を 1 つのチャンネルのフレームとしてクライアントに送る"""
+
+    def __init__(self, sock: socket.socket, channel: bytes, tty: bool) -> None:
+        self.sock = sock
+        self.channel = channel
+        self.tty = tty
+        # TextIOWrapper.name はこれを返す (sys.stdout.name と同じ値にする)
+        self.name = "<stdout>" if channel == STDOUT else "<stderr>"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if data:
+            send_frame(self.sock, self.channel, bytes(data))
+        return len(data)
+
+    def isatty(self) -> bool:
+        return self.tty
+
+
+def text_stream(sock: socket.socket, channel: bytes, tty: bool) -> io.TextIOWrapper:
+    return io.TextIOWrapper(
+        FrameStream(sock, channel, tty), encoding="utf-8", errors="surrogateescape", write_through=True
+    )
+
+
+@contextmanager
+def request_context(cwd: str, env: dict[str, str | None], stdout, stderr) -> Iterator[None]:
+    """1 リクエストの間だけ cwd・環境変数・sys.stdout / sys.stderr を差し替える"""
+    saved_cwd = os.getcwd()
+    saved_env = {name: os.environ.get(name) for name in env}
+    saved_streams = sys.stdout, sys.stderr
+    os.chdir(cwd)
+    try:
+        set_env(env)
+        sys.stdout, sys.stderr = stdout, stderr
+        yield
+    finally:
+        sys.stdout, sys.stderr = saved_streams
+        set_env(saved_env)
+        os.chdir(saved_cwd)
+
+
+def set_env(env: dict[str, str | None]) -> None:
+    for name, value in env.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    if "TZ" in env:
+        time.tzset()
+
+
+def exit_code(status) -> int:
+    if status is None:
+        return 0
+    if isinstance(status, int):
+        return status
+    return 1
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    server: "ListingServer"
+
+    def handle(self) -> None:
+        sock = self.request
+        try:
+            channel, payload = recv_frame(sock)
+            if channel != REQUEST or len(payload) > MAX_REQUEST_SIZE:
+                raise ValueError("bad request")
+            argv, cwd, tty, env = decode_request(payload)
+        except (ConnectionError, ValueError, IndexError) as e:
+            self.reply_error(f"pyls: invalid request: {e}", 2)
+            return
+
+        stdout = text_stream(sock, STDOUT, tty)
+        stderr = text_stream(sock, STDERR, False)
+        try:
+            with request_context(cwd, env, stdout, stderr):
+                status = self.server.run(argv)
+        except ConnectionError:
+            # クライアントがいなくなった (| head など)
+            return
+        except OSError as e:
+            self.reply_error(f"pyls: cannot change directory to '{cwd}': {e.strerror}", 2)
+            return
+        send_frame(sock, EXIT, EXIT_STATUS.pack(status))
+
+    def reply_error(self, message: str, status: int) -> None:
+        try:
+            send_frame(self.request, STDERR, (message + "\n").encode())
+            send_frame(self.request, EXIT, EXIT_STATUS.pack(status))
+        except OSError:
+            pass
+
+
+class ListingServer(socketserver.UnixStreamServer):
+    """pyls --server の本体。リクエストは 1 つずつ順番に処理する (キャッシュや cwd はプロセスで 1 つなので)"""
+
+    def __init__(self, socket_path: str, main: Callable[[list[str]], int | None], validator: CacheValidator) -> None:
+        self.main = main
+        self.validator = validator
+        self.socket_path = socket_path
+        remove_stale_socket(socket_path)
+        # 作った瞬間から自分以外は接続できないようにする
+        old_umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def verify_request(self, request, client_address) -> bool:
+        # 一覧はサーバーの権限で作るので、同じユーザーからの接続だけ受け付ける
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+        creds = request.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid == os.getuid()
+
+    def run(self, argv: list[str]) -> int:
+        self.validator.refresh()
+        try:
+            status = self.main(argv)
+        except SystemExit as e:
+            status = e.code
+        except ConnectionError:
+            raise
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        return exit_code(status)
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale_socket(socket_path: str) -> None:
+    """前のサーバーが残したソケットファイルを消す。まだ誰かが listen していたらエラーにする"""
+    try:
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise FileExistsError(f"{socket_path} exists and is not a socket")
+    except FileNotFoundError:
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise FileExistsError(f"another pyls server is listening on {socket_path}")
+
+
+def serve(socket_path: str, main: Callable[[list[str]], int | None], ttl: float = CACHE_TTL_SECONDS) -> int:
+    import signal
+
+    try:
+        server = ListingServer(socket_path, main, CacheValidator(ttl=ttl))
+    except (FileExistsError, OSError) as e:
+        print(f"pyls: cannot listen on '{socket_path}': {e}", file=sys.stderr)
+        return 2
+
+    # SIGTERM でもソケットファイルを消してから終わる
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with server:
+        try:
+            server.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+    return 0
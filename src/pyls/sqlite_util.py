@@ -0,0 +1,11 @@
+# --listing-cache と --index-to で共有する、SQLite に入れる値の変換。変えると既存のファイルが読めなくなる
+
+
+def sqlite_int(value: int) -> int:
+    """SQLite の整数は符号付き 64 ビットなので、2^63 以上の st_dev / st_ino は負の数にして入れる"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def python_int(value: int) -> int:
+    """sqlite_int の逆"""
+    return value + (1 << 64) if value < 0 else value
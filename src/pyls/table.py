@@ -0,0 +1,288 @@
+import stat
+from array import array
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from pyls.types import EntryView, FileEntry, FileStatus, StatResult, StatusView
+
+NS_PER_SECOND = 1_000_000_000
+
+
+def ns_to_seconds(ns: int) -> float:
+    # os.stat_result.st_mtime と同じ計算 (秒 + ナノ秒 * 1e-9) にして、float の値を一致させる
+    seconds, nanoseconds = divmod(ns, NS_PER_SECOND)
+    return seconds + nanoseconds * 1e-9
+
+
+def seconds_to_ns(seconds: float) -> int:
+    return round(seconds * NS_PER_SECOND)
+
+
+def exact_ns(ns: int | None, seconds: float) -> int:
+    """FileStatus の正確なナノ秒。持っていなければ float の時刻から求める"""
+    return seconds_to_ns(seconds) if ns is None else ns
+
+
+class EntryTable:
+    """1 ディレクトリ分のエントリを列ごとの配列で持つコンテナ (struct of arrays)
+
+    FileEntry + Path + FileStatus を 1 件ずつ持つと 1 エントリ数百バイトになるので、
+    名前はリスト、stat の各フィールドは array に詰めて持つ。パスは dir_path / name で都度作る。
+    添字やイテレーションで返るのは EntryRow (FileEntry と同じ属性を持つ軽いビュー) なので、
+    format / filter の関数はそのまま使える。
+    """
+
+    __slots__ = (
+        "dir_path",
+        "names",
+        "is_dir",
+        "mode",
+        "nlink",
+        "uid",
+        "gid",
+        "size",
+        "mtime_ns",
+        "atime_ns",
+        "ctime_ns",
+        "blocks",
+        "inode",
+        "dev",
+        "paths",
+    )
+
+    def __init__(self, dir_path: Path | None = None) -> None:
+        self.dir_path = dir_path
+        self.names: list[str] = []
+        self.is_dir = bytearray()
+        self.mode = array("I")
+        self.nlink = array("Q")
+        self.uid = array("I")
+        self.gid = array("I")
+        self.size = array("q")
+        self.mtime_ns = array("q")
+        self.atime_ns = array("q")
+        self.ctime_ns = array("q")
+        self.blocks = array("q")
+        self.inode = array("Q")
+        self.dev = array("Q")
+        # dir_path / name と異なるパスを持つ行 (. や .. など)
+        self.paths: dict[int, Path] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> "EntryRow":
+        if index < 0:
+            index += len(self.names)
+        if not 0 <= index < len(self.names):
+            raise IndexError("EntryTable index out of range")
+        return EntryRow(self, index)
+
+    def __iter__(self) -> Iterator["EntryRow"]:
+        for i in range(len(self.names)):
+            yield EntryRow(self, i)
+
+    def append_stat(self, name: str, st: StatResult) -> None:
+        self.names.append(name)
+        self.is_dir.append(stat.S_ISDIR(st.st_mode))
+        self.mode.append(st.st_mode)
+        self.nlink.append(st.st_nlink)
+        self.uid.append(st.st_uid)
+        self.gid.append(st.st_gid)
+        self.size.append(st.st_size)
+        self.mtime_ns.append(st.st_mtime_ns)
+        self.atime_ns.append(st.st_atime_ns)
+        self.ctime_ns.append(st.st_ctime_ns)
+        self.blocks.append(st.st_blocks)
+        self.inode.append(st.st_ino)
+        self.dev.append(st.st_dev)
+
+    def append_dir_entry(self, name: str, mode: int, inode: int) -> None:
+        """lstat していないエントリ (種類と inode だけ分かっている) を追加する"""
+        self.names.append(name)
+        self.is_dir.append(stat.S_ISDIR(mode))
+        self.mode.append(mode)
+        self.inode.append(inode)
+        for column in (self.nlink, self.uid, self.gid, self.size, self.mtime_ns, self.atime_ns, self.ctime_ns):
+            column.append(0)
+        self.blocks.append(0)
+        self.dev.append(0)
+
+    def append_status(self, name: str, is_dir: bool, status: StatusView, path: Path | None = None) -> None:
+        if path is not None:
+            self.paths[len(self.names)] = path
+        self.names.append(name)
+        self.is_dir.append(is_dir)
+        self.mode.append(status.mode)
+        self.nlink.append(status.nlink)
+        self.uid.append(status.uid)
+        self.gid.append(status.gid)
+        self.size.append(status.size)
+        self.mtime_ns.append(exact_ns(status.mtime_ns, status.mtime))
+        self.atime_ns.append(exact_ns(status.atime_ns, status.atime))
+        self.ctime_ns.append(exact_ns(status.ctime_ns, status.ctime))
+        self.blocks.append(status.blocks)
+        self.inode.append(status.inode)
+        self.dev.append(status.dev)
+
+    def append(self, entry: EntryView) -> None:
+        path = None
+        if self.dir_path is None or entry.path != self.dir_path / entry.name:
+            path = entry.path
+        self.append_status(entry.name, entry.is_dir, entry.file_status, path)
+
+    def extend(self, entries: Iterable[EntryView]) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    def path(self, index: int) -> Path:
+        path = self.paths.get(index)
+        if path is not None:
+            return path
+        if self.dir_path is None:
+            return Path(self.names[index])
+        return self.dir_path / self.names[index]
+
+    def take(self, indices: list[int]) -> "EntryTable":
+        """indices の順に行を並べた新しいテーブルを返す (ソート・フィルタ用)"""
+        table = EntryTable(self.dir_path)
+        names = self.names
+        table.names = [names[i] for i in indices]
+        table.is_dir = bytearray(self.is_dir[i] for i in indices)
+        for column in (
+            "mode",
+            "nlink",
+            "uid",
+            "gid",
+            "size",
+            "mtime_ns",
+            "atime_ns",
+            "ctime_ns",
+            "blocks",
+            "inode",
+            "dev",
+        ):
+            src = getattr(self, column)
+            setattr(table, column, array(src.typecode, [src[i] for i in indices]))
+        if self.paths:
+            new_index = {old: new for new, old in enumerate(indices)}
+            table.paths = {new_index[old]: path for old, path in self.paths.items() if old in new_index}
+        return table
+
+
+class EntryRow:
+    """EntryTable の 1 行を FileEntry と同じ属性で見せるビュー"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: EntryTable, index: int) -> None:
+        self.table = table
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self.table.names[self.index]
+
+    @property
+    def path(self) -> Path:
+        return self.table.path(self.index)
+
+    @property
+    def is_dir(self) -> bool:
+        return bool(self.table.is_dir[self.index])
+
+    @property
+    def file_status(self) -> "StatusRow":
+        return StatusRow(self.table, self.index)
+
+    def to_file_entry(self) -> FileEntry:
+        return FileEntry(
+            path=self.path, name=self.name, is_dir=self.is_dir, file_status=self.file_status.to_file_status()
+        )
+
+    def __repr__(self) -> str:
+        return f"EntryRow({self.name!r})"
+
+
+class StatusRow:
+    """EntryTable の 1 行を FileStatus と同じ属性で見せるビュー"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: EntryTable, index: int) -> None:
+        self.table = table
+        self.index = index
+
+    @property
+    def mode(self) -> int:
+        return self.table.mode[self.index]
+
+    @property
+    def nlink(self) -> int:
+        return self.table.nlink[self.index]
+
+    @property
+    def uid(self) -> int:
+        return self.table.uid[self.index]
+
+    @property
+    def gid(self) -> int:
+        return self.table.gid[self.index]
+
+    @property
+    def size(self) -> int:
+        return self.table.size[self.index]
+
+    @property
+    def mtime(self) -> float:
+        return ns_to_seconds(self.table.mtime_ns[self.index])
+
+    @property
+    def atime(self) -> float:
+        return ns_to_seconds(self.table.atime_ns[self.index])
+
+    @property
+    def ctime(self) -> float:
+        return ns_to_seconds(self.table.ctime_ns[self.index])
+
+    @property
+    def mtime_ns(self) -> int:
+        return self.table.mtime_ns[self.index]
+
+    @property
+    def atime_ns(self) -> int:
+        return self.table.atime_ns[self.index]
+
+    @property
+    def ctime_ns(self) -> int:
+        return self.table.ctime_ns[self.index]
+
+    @property
+    def blocks(self) -> int:
+        return self.table.blocks[self.index]
+
+    @property
+    def inode(self) -> int:
+        return self.table.inode[self.index]
+
+    @property
+    def dev(self) -> int:
+        return self.table.dev[self.index]
+
+    def to_file_status(self) -> FileStatus:
+        return FileStatus(
+            mode=self.mode,
+            nlink=self.nlink,
+            uid=self.uid,
+            gid=self.gid,
+            size=self.size,
+            mtime=self.mtime,
+            atime=self.atime,
+            ctime=self.ctime,
+            blocks=self.blocks,
+            inode=self.inode,
+            dev=self.dev,
+            mtime_ns=self.mtime_ns,
+            atime_ns=self.atime_ns,
+            ctime_ns=self.ctime_ns,
+        )
@@ -1,8 +1,9 @@
 import os
-from dataclasses import dataclass
-from enum import IntEnum
+import stat
+from collections.abc import Iterator
+from enum import IntEnum, IntFlag
 from pathlib import Path
-from typing import NamedTuple
+from typing import NamedTuple, Protocol
 
 
 class ExitStatus(IntEnum):
@@ -10,10 +11,34 @@ class ExitStatus(IntEnum):
     ERROR = 1
 
 
+class StatField(IntFlag):
+    """表示に必要な FileStatus のフィールド"""
+
+    NONE = 0
+    TYPE = 1
+    INODE = 2
+    MODE = 4
+    NLINK = 8
+    OWNER = 16
+    SIZE = 32
+    TIME = 64
+    BLOCKS = 128
+    ALL = TYPE | INODE | MODE | NLINK | OWNER | SIZE | TIME | BLOCKS
+
+
+# DirEntry の d_type / d_ino だけで埋められるフィールド
+DIRENT_FIELDS = StatField.TYPE | StatField.INODE
+
+
 class FileTypeChar:
     DIR = "d"
     LINK = "l"
     REGULAR = "-"
+    BLOCK = "b"
+    CHAR = "c"
+    FIFO = "p"
+    SOCKET = "s"
+    UNKNOWN = "?"
 
 
 class PermChar:
@@ -21,6 +46,10 @@ class PermChar:
     WRITE = "w"
     EXEC = "x"
     NONE = "-"
+    SETID_EXEC = "s"
+    SETID = "S"
+    STICKY_EXEC = "t"
+    STICKY = "T"
 
 
 class XattrChar:
@@ -57,10 +86,73 @@ class Format:
     QUOTE = '"'
     DIR_INDICATOR = "/"
     NONPRINTABLE = "?"
+    FULL_ISO = "%Y-%m-%d %H:%M:%S"
+    LONG_ISO = "%Y-%m-%d %H:%M"
+    ISO_WITH_YEAR = "%Y-%m-%d "
+    ISO_WITH_TIME = "%m-%d %H:%M"
+
+
+class SortKey:
+    NONE = "none"
+    NAMES = ("name", "size", "time", "extension", "version")
+
 
+class TimeStyle:
+    FULL_ISO = "full-iso"
+    LONG_ISO = "long-iso"
+    ISO = "iso"
+    LOCALE = "locale"
+    NAMES = (FULL_ISO, LONG_ISO, ISO, LOCALE)
+    POSIX_PREFIX = "posix-"
+    FORMAT_PREFIX = "+"
 
-@dataclass(frozen=True)
-class FileStatus:
+
+class OutputFormat:
+    JSON = "json"
+    NDJSON = "ndjson"
+    # 機械向け: 整形せずに FileStatus をそのまま出す
+    MACHINE = (JSON, NDJSON)
+    # GNU ls の --format のうち、既存のオプションで表せるもの
+    LONG = ("long", "verbose")
+    SINGLE_COLUMN = "single-column"
+    VERTICAL = "vertical"
+    NAMES = (*LONG, SINGLE_COLUMN, VERTICAL, JSON, NDJSON)
+
+
+class StatResult(Protocol):
+    """os.stat_result と pyls.index.IndexedStat (--from-index で索引から読んだ lstat) に共通の属性"""
+
+    @property
+    def st_mode(self) -> int: ...
+    @property
+    def st_nlink(self) -> int: ...
+    @property
+    def st_uid(self) -> int: ...
+    @property
+    def st_gid(self) -> int: ...
+    @property
+    def st_size(self) -> int: ...
+    @property
+    def st_mtime(self) -> float: ...
+    @property
+    def st_atime(self) -> float: ...
+    @property
+    def st_ctime(self) -> float: ...
+    @property
+    def st_mtime_ns(self) -> int: ...
+    @property
+    def st_atime_ns(self) -> int: ...
+    @property
+    def st_ctime_ns(self) -> int: ...
+    @property
+    def st_blocks(self) -> int: ...
+    @property
+    def st_ino(self) -> int: ...
+    @property
+    def st_dev(self) -> int: ...
+
+
+class FileStatus(NamedTuple):
     mode: int
     nlink: int
     uid: int
@@ -71,9 +163,14 @@ class FileStatus:
     ctime: float
     blocks: int
     inode: int
+    dev: int = 0
+    # float の時刻では表せないナノ秒単位の正確な値 (--time-style=full-iso 用)。分からなければ None
+    mtime_ns: int | None = None
+    atime_ns: int | None = None
+    ctime_ns: int | None = None
 
     @classmethod
-    def from_stat_result(cls, st: os.stat_result) -> "FileStatus":
+    def from_stat_result(cls, st: StatResult) -> "FileStatus":
         return cls(
             mode=st.st_mode,
             nlink=st.st_nlink,
@@ -85,11 +182,46 @@ class FileStatus:
             ctime=st.st_ctime,
             blocks=st.st_blocks,
             inode=st.st_ino,
+            dev=st.st_dev,
+            mtime_ns=st.st_mtime_ns,
+            atime_ns=st.st_atime_ns,
+            ctime_ns=st.st_ctime_ns,
         )
 
+    @classmethod
+    def from_dir_entry(cls, entry: os.DirEntry) -> "FileStatus":
+        """lstat せずに d_type と d_ino だけで埋めた FileStatus (その他のフィールドは 0)"""
+        mode = dir_entry_mode(entry)
+        if mode is None:
+            # FIFO やデバイスなどは d_type から区別できないので lstat する
+            return cls.from_stat_result(entry.stat(follow_symlinks=False))
 
-@dataclass(frozen=True)
-class LongFormatLine:
+        return cls(
+            mode=mode,
+            nlink=0,
+            uid=0,
+            gid=0,
+            size=0,
+            mtime=0.0,
+            atime=0.0,
+            ctime=0.0,
+            blocks=0,
+            inode=entry.inode(),
+        )
+
+
+def dir_entry_mode(entry: os.DirEntry) -> int | None:
+    """d_type から分かるファイル種別のビット。ディレクトリ・シンボリックリンク・通常ファイル以外は None"""
+    if entry.is_dir(follow_symlinks=False):
+        return stat.S_IFDIR
+    if entry.is_symlink():
+        return stat.S_IFLNK
+    if entry.is_file(follow_symlinks=False):
+        return stat.S_IFREG
+    return None
+
+
+class LongFormatLine(NamedTuple):
     mode: str
     nlink: int
     owner: str
@@ -102,22 +234,74 @@ class LongFormatLine:
         return f"{self.mode} {self.nlink} {self.owner}  {self.group} {self.size} {self.time} {self.name}"
 
 
-@dataclass(frozen=True)
-class FileEntry:
+class FileEntry(NamedTuple):
     path: Path
     name: str
     is_dir: bool
     file_status: FileStatus
 
 
-@dataclass
-class DirEntries:
+class StatusView(Protocol):
+    """FileStatus と pyls.table.StatusRow に共通の、読み取り専用の属性"""
+
+    @property
+    def mode(self) -> int: ...
+    @property
+    def nlink(self) -> int: ...
+    @property
+    def uid(self) -> int: ...
+    @property
+    def gid(self) -> int: ...
+    @property
+    def size(self) -> int: ...
+    @property
+    def mtime(self) -> float: ...
+    @property
+    def atime(self) -> float: ...
+    @property
+    def ctime(self) -> float: ...
+    @property
+    def blocks(self) -> int: ...
+    @property
+    def inode(self) -> int: ...
+    @property
+    def dev(self) -> int: ...
+    @property
+    def mtime_ns(self) -> int | None: ...
+    @property
+    def atime_ns(self) -> int | None: ...
+    @property
+    def ctime_ns(self) -> int | None: ...
+
+
+class EntryView(Protocol):
+    """FileEntry と pyls.table.EntryRow に共通の、読み取り専用の属性"""
+
+    @property
+    def path(self) -> Path: ...
+    @property
+    def name(self) -> str: ...
+    @property
+    def is_dir(self) -> bool: ...
+    @property
+    def file_status(self) -> StatusView: ...
+
+
+class EntrySequence(Protocol):
+    """list[FileEntry] と pyls.table.EntryTable に共通の、読み取り専用の Sequence[FileEntry] 相当"""
+
+    def __len__(self) -> int: ...
+    def __getitem__(self, index: int, /) -> EntryView: ...
+    def __iter__(self) -> Iterator[EntryView]: ...
+
+
+class DirEntries(NamedTuple):
     path: Path
-    entries: list[FileEntry]
+    # list[FileEntry] か、同じ属性の行を返す pyls.table.EntryTable
+    entries: EntrySequence
 
 
-@dataclass(frozen=True)
-class ScanPathsResult:
+class ScanPathsResult(NamedTuple):
     entries: list[FileEntry]
     dir_queue: list[Path]
     exit_status: ExitStatus
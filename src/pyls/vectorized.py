@@ -0,0 +1,183 @@
+from collections.abc import Callable
+from typing import TYPE_CHECKING
+
+from pyls.format import (
+    display_time_field,
+    format_entry_name,
+    group_name,
+    human_readable_size,
+    mode_string,
+    time_formatter,
+    user_name,
+)
+from pyls.table import NS_PER_SECOND, EntryTable
+from pyls.types import LongFormatLine, SizeUnit
+
+# これより少ないエントリでは配列を作るコストの方が大きいので、通常の経路を使う
+VECTORIZE_MIN = 1024
+
+# これ未満のサイズは float にしても誤差が出ないので、整数演算で human_readable_size と同じ丸めになる
+EXACT_FLOAT_MAX = 1 << 53
+
+UNIT_CHARS = ("", "K", "M", "G", "T", "P")
+
+# human_readable_sizes で (単位, 小数表示か, 数値) を 1 つの整数にまとめるときの桁
+SIZE_CODE_UNIT = 1_000_000
+SIZE_CODE_FRACTIONAL = 100_000
+
+
+# NumPy は任意 (pip install 'pyls[fast]')。import に 0.1 秒以上かかるので、
+# 大きな一覧を表示するときに初めて load_numpy() で読み込む (np を使うのは load_numpy() が True のときだけ)
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = None
+_numpy_missing = False
+
+
+def load_numpy() -> bool:
+    global np, _numpy_missing
+    if np is None and not _numpy_missing:
+        try:
+            import numpy
+        except ImportError:
+            _numpy_missing = True
+        else:
+            np = numpy
+    return np is not None
+
+
+def can_vectorize(table: EntryTable) -> bool:
+    return len(table) >= VECTORIZE_MIN and load_numpy()
+
+
+def column(table: EntryTable, name: str):
+    """EntryTable の列をコピーせずに ndarray として見る"""
+    values = getattr(table, name)
+    if not len(values):
+        return np.zeros(0, dtype=values.typecode)
+    return np.frombuffer(values, dtype=values.typecode)
+
+
+def total_blocks(table: EntryTable) -> int:
+    return int(column(table, "blocks").sum(dtype=np.int64))
+
+
+def map_unique(values, func: Callable[[int], str]):
+    """値の種類ごとに 1 回だけ func を呼び、(各要素の文字列, 種類ごとの文字列) を返す"""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    texts = [func(value) for value in uniques.tolist()]
+    return np.array(texts, dtype=object)[inverse], texts
+
+
+def round_half_even_div(numerator, divisor):
+    # printf の %.Nf と同じく、ちょうど半分のときは偶数に丸める
+    quotient, remainder = np.divmod(numerator, divisor)
+    twice = remainder * 2
+    return quotient + ((twice > divisor) | ((twice == divisor) & (quotient % 2 == 1)))
+
+
+def human_readable_sizes(sizes):
+    """human_readable_size を配列全体に適用する (結果は 1 文字も変わらない)
+
+    丸めまで整数演算で済ませて (単位, 表示する数値) を 1 つの整数にまとめ、種類ごとに 1 回だけ文字列にする。
+    表示の種類は高々数千なので、文字列を作る回数はエントリ数によらない。
+    """
+    threshold = SizeUnit.THRESHOLD
+    sizes = sizes.astype(np.int64)
+
+    # K=1 ... P=5。human_readable_size が 1024 で割り続けて止まる位置
+    unit = np.ones(len(sizes), dtype=np.int64)
+    for power in range(2, len(UNIT_CHARS)):
+        unit += sizes >= threshold**power
+    divisor = np.left_shift(1, 10 * unit)
+
+    # 10 以上は整数、未満は小数 1 桁 (tenths は 10 倍した値)
+    fractional = sizes < divisor * SizeUnit.INT_DISPLAY_MIN
+    value = np.where(fractional, round_half_even_div(sizes * 10, divisor), round_half_even_div(sizes, divisor))
+    small = sizes < threshold
+    codes = np.where(small, sizes, unit * SIZE_CODE_UNIT + fractional * SIZE_CODE_FRACTIONAL + value)
+
+    result, _ = map_unique(codes, size_code_text)
+
+    # 2^53 以上 (8 PiB 以上) は float の丸めまで合わせられないので通常の関数に任せる
+    for i in np.flatnonzero(sizes >= EXACT_FLOAT_MAX).tolist():
+        result[i] = human_readable_size(int(sizes[i]))
+    return result
+
+
+def size_code_text(code: int) -> str:
+    if code < SizeUnit.THRESHOLD:
+        return f" {code}B"
+    unit, rest = divmod(code, SIZE_CODE_UNIT)
+    fractional, value = divmod(rest, SIZE_CODE_FRACTIONAL)
+    if fractional:
+        return f" {value // 10}.{value % 10}{UNIT_CHARS[unit]}"
+    return f"{value}{UNIT_CHARS[unit]}"
+
+
+def timestamps(table: EntryTable, field: str):
+    """ns の列から FileStatus と同じ float の時刻を作る (ns_to_seconds と同じ計算)"""
+    seconds, nanoseconds = np.divmod(column(table, field + "_ns").astype(np.int64), NS_PER_SECOND)
+    return seconds.astype(np.float64) + nanoseconds * 1e-9
+
+
+def time_strings(table: EntryTable, opts):
+    formatter = time_formatter(opts.time_style)
+    field = display_time_field(opts)
+    times = timestamps(table, field)
+
+    # full-iso はエントリごとにナノ秒が違い、1970 年より前 (負の時刻) は TimeFormatter.format が
+    # キャッシュしない (オフセットが分単位とは限らない) ので、どちらも 1 件ずつ整形する
+    if formatter.full_iso or (times < 0).any():
+        nanoseconds = getattr(table, field + "_ns")
+        return np.array([formatter.format(t, ns) for t, ns in zip(times.tolist(), nanoseconds)], dtype=object)
+
+    recent = (formatter.six_months_ago <= times) & (times <= formatter.now)
+    buckets = np.floor_divide(times, formatter.bucket_seconds).astype(np.int64)
+    texts, _ = map_unique(buckets * 2 + recent, lambda key: formatter.format_bucket(key >> 1, bool(key & 1)))
+    return texts
+
+
+def long_format_lines(table: EntryTable, opts, xattr_chars: list[str]) -> tuple[list[LongFormatLine], dict[str, int]]:
+    """format_long_line と max_width を列ごとにまとめて計算する"""
+    modes, _ = map_unique(column(table, "mode"), mode_string)
+    nlinks = column(table, "nlink")
+    sizes = column(table, "size")
+
+    if opts.no_owner:
+        owners, owner_names = np.full(len(table), "", dtype=object), [""]
+    else:
+        owners, owner_names = map_unique(column(table, "uid"), lambda uid: user_name(uid, opts.numeric_uid_gid))
+    if opts.no_group:
+        groups, group_names = np.full(len(table), "", dtype=object), [""]
+    else:
+        groups, group_names = map_unique(column(table, "gid"), lambda gid: group_name(gid, opts.numeric_uid_gid))
+
+    if opts.human_readable:
+        size_texts = human_readable_sizes(sizes).tolist()
+        size_width = max(map(len, set(size_texts)))
+    else:
+        size_texts = list(map(str, sizes.tolist()))
+        size_width = len(str(int(sizes.max())))
+
+    lines = [
+        LongFormatLine(mode=mode + xattr, nlink=nlink, owner=owner, group=group, size=size, time=time, name=name)
+        for mode, xattr, nlink, owner, group, size, time, name in zip(
+            modes.tolist(),
+            xattr_chars,
+            nlinks.tolist(),
+            owners.tolist(),
+            groups.tolist(),
+            size_texts,
+            time_strings(table, opts).tolist(),
+            (format_entry_name(row, opts) for row in table),
+        )
+    ]
+    widths = {
+        "nlink": len(str(int(nlinks.max()))),
+        "owner": max(map(len, owner_names)),
+        "group": max(map(len, group_names)),
+        "size": size_width,
+    }
+    return lines, widths
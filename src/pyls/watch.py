@@ -0,0 +1,218 @@
+import ctypes
+import os
+import select
+import stat
+import struct
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import NamedTuple
+
+from pyls.core import report, required_stat_fields, scan_dir_children, should_include
+from pyls.filter import ignore_matcher, iter_display_entries
+from pyls.types import DIRENT_FIELDS, ExitStatus, FileEntry, FileStatus
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# 名前の増減だけ分かればよいとき
+NAME_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+# -l などで stat の内容も表示するときに足す
+STATUS_EVENTS = IN_ATTRIB | IN_MODIFY | IN_CLOSE_WRITE
+# ディレクトリ自体がなくなったら終わる
+SELF_EVENTS = IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT | IN_IGNORED
+
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+# 最後のイベントからこれだけ静かになったら描き直す
+DEBOUNCE_SECONDS = 0.1
+# イベントが途切れなくても、最初のイベントからこれだけ経ったら描き直す
+MAX_DELAY_SECONDS = 1.0
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+
+
+def parse_events(data: bytes) -> list[InotifyEvent]:
+    """read(2) で読んだ struct inotify_event の並びを分解する"""
+    events = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        # name は NUL で終わり、さらに NUL で埋められている
+        raw_name = data[offset : offset + length].split(b"\0", 1)[0]
+        offset += length
+        events.append(InotifyEvent(wd, mask, cookie, os.fsdecode(raw_name)))
+    return events
+
+
+class Inotify:
+    """ctypes で呼ぶ inotify(7)。Linux 以外では OSError になる"""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            init = libc.inotify_init1
+        except AttributeError:
+            raise OSError("inotify is not available on this system") from None
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: Path | str, mask: int) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), str(path))
+        return wd
+
+    def read(self, timeout: float | None = None) -> list[InotifyEvent]:
+        """イベントを待って読む。timeout 秒 (None なら無期限) 待っても来なければ空のリスト"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return events
+            events.extend(parse_events(data))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    def __enter__(self) -> "Inotify":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def watch_mask(opts) -> int:
+    mask = NAME_EVENTS | SELF_EVENTS | IN_ONLYDIR | IN_EXCL_UNLINK
+    if required_stat_fields(opts) & ~DIRENT_FIELDS:
+        mask |= STATUS_EVENTS
+    return mask
+
+
+class WatchedDir:
+    """監視しているディレクトリのエントリを名前ごとに持ち、イベントがあった名前だけ lstat し直す
+
+    ディレクトリ全体を読み直すのは最初と、イベントが溢れた (IN_Q_OVERFLOW) ときだけ。
+    """
+
+    def __init__(self, path: Path, opts) -> None:
+        self.path = path
+        self.opts = opts
+        self.matcher = ignore_matcher(opts)
+        self.entries: dict[str, FileEntry] = {}
+
+    def rescan(self) -> ExitStatus:
+        entries: list[FileEntry] = []
+        _, status = scan_dir_children(self.path, self.opts, entries)
+        self.entries = {entry.name: entry for entry in entries}
+        return status
+
+    def update(self, name: str) -> None:
+        if not should_include(name, self.opts) or (self.matcher and self.matcher.matches(name)):
+            return
+        path = self.path / name
+        try:
+            st = path.lstat()
+        except FileNotFoundError:
+            self.entries.pop(name, None)
+            return
+        except PermissionError:
+            report(f"pyls: cannot access '{path}': Permission denied")
+            self.entries.pop(name, None)
+            return
+        self.entries[name] = FileEntry(path, name, stat.S_ISDIR(st.st_mode), FileStatus.from_stat_result(st))
+
+    def apply(self, events: Iterable[InotifyEvent]) -> bool:
+        """イベントを反映する。ディレクトリ自体がなくなったら False"""
+        names: set[str] = set()
+        changed = False
+        for event in events:
+            if event.mask & SELF_EVENTS:
+                return False
+            if event.mask & IN_Q_OVERFLOW:
+                self.rescan()
+                return True
+            changed = True
+            # 名前が空なのはディレクトリ自体のイベント
+            if event.name:
+                names.add(event.name)
+
+        for name in names:
+            self.update(name)
+        if changed and self.opts.all:
+            # 中身が変わればディレクトリ自体の mtime なども変わる
+            self.update_dot()
+        return True
+
+    def update_dot(self) -> None:
+        for name, path in ((".", self.path), ("..", self.path.parent)):
+            try:
+                st = path.lstat()
+            except OSError:
+                continue
+            self.entries[name] = FileEntry(path, name, True, FileStatus.from_stat_result(st))
+
+    def display_entries(self) -> list[FileEntry]:
+        return iter_display_entries(list(self.entries.values()), self.opts)
+
+
+def collect_events(inotify: Inotify) -> list[InotifyEvent]:
+    """次のイベントを待ち、続けて来るイベントを DEBOUNCE_SECONDS 静かになるまでまとめて返す"""
+    events = inotify.read()
+    deadline = time.monotonic() + MAX_DELAY_SECONDS
+    while True:
+        timeout = min(DEBOUNCE_SECONDS, deadline - time.monotonic())
+        if timeout <= 0:
+            return events
+        more = inotify.read(timeout)
+        if not more:
+            return events
+        events.extend(more)
+
+
+def watch(path: Path, opts, render: Callable[[list[FileEntry]], None], inotify: Inotify | None = None) -> ExitStatus:
+    """path の一覧を render に渡し、変化があるたびに渡し直す。ディレクトリがなくなったら終わる"""
+    inotify = inotify or Inotify()
+    with inotify:
+        # 読み始める前に監視を始めて、その間の変更も取りこぼさない
+        inotify.add_watch(path, watch_mask(opts))
+        watched = WatchedDir(path, opts)
+        status = watched.rescan()
+        render(watched.display_entries())
+
+        while watched.apply(collect_events(inotify)):
+            render(watched.display_entries())
+
+    report(f"pyls: {path}: directory is no longer accessible")
+    return ExitStatus(status | ExitStatus.ERROR)
@@ -0,0 +1,88 @@
+import functools
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+BLOCK_SIZE = 64 * 1024
+
+
+class OutputWriter:
+    """stdout への出力を溜めて、まとめて sys.stdout.buffer に書き出す
+
+    batch() の中では、stdout が TTY なら行ごと、それ以外 (パイプやファイル) なら BLOCK_SIZE ごとに書き出す。
+    batch() の外で書いたものはすぐに書き出す。stderr に書く前には溜めた分を必ず書き出すので、
+    stdout と stderr の前後関係は print() のときと変わらない。
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE) -> None:
+        self.block_size = block_size
+        self._chunks: list[str] = []
+        self._size = 0
+        self._depth = 0
+        self._stream = None
+        self._tty = False
+
+    def write(self, text: str) -> None:
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._depth == 0 or self._size >= self.block_size or (self._is_tty() and "\n" in text):
+            self.flush()
+
+    def line(self, text: str = "") -> None:
+        self.write(text + "\n")
+
+    def error(self, text: str) -> None:
+        self.flush()
+        print(text, file=sys.stderr)
+
+    def flush(self) -> None:
+        if not self._chunks:
+            return
+        data = "".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+
+        stream = sys.stdout
+        buffer = getattr(stream, "buffer", None)
+        if buffer is None:
+            stream.write(data)
+            stream.flush()
+            return
+
+        # print() などでテキスト層に残っている分を先に出す
+        stream.flush()
+        # ファイル名のデコードできなかったバイト列は元のバイト列のまま出す (ls と同じ)
+        buffer.write(data.encode(stream.encoding or "utf-8", "surrogateescape"))
+        buffer.flush()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """この中で書いたものはブロック単位で書き出し、一番外側を抜けるときに残りを書き出す"""
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.flush()
+
+    def _is_tty(self) -> bool:
+        stream = sys.stdout
+        if stream is not self._stream:
+            self._stream = stream
+            self._tty = stream.isatty()
+        return self._tty
+
+
+writer = OutputWriter()
+
+
+def buffered(func):
+    """関数の中の出力を writer.batch() でまとめるデコレータ"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with writer.batch():
+            return func(*args, **kwargs)
+
+    return wrapper
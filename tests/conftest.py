@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from pyls.format import clear_owner_name_cache, clear_xattr_support_cache, reset_time_formatters
 from pyls.types import FileEntry, FileStatus, LongFormatLine
 
 
@@ -18,11 +19,20 @@ class MockOpts:
     directory: bool = False
 
     # ファイル表示
+    long: bool = False
+    size: bool = False
+    inode: bool = False
     numeric_uid_gid: bool = False
     human_readable: bool = False
     no_owner: bool = False
     no_group: bool = False
+    no_xattr: bool = False
     recursive: bool = False
+    jobs: int = 1
+    format: str | None = None
+    listing_cache: bool = False
+    index_to: str | None = None
+    from_index: str | None = None
 
     # インジケータ
     indicator_style: bool = False
@@ -48,11 +58,23 @@ class MockOpts:
 
     # 時間
     time: str | None = "mtime"
+    time_style: str | None = None
 
     # カラー
     colorize: bool = False
 
 
+@pytest.fixture(autouse=True)
+def reset_run_caches():
+    """実行中ずっと保持されるキャッシュをテストごとに空にする"""
+    clear_owner_name_cache()
+    clear_xattr_support_cache()
+    reset_time_formatters()
+    yield
+    clear_owner_name_cache()
+    clear_xattr_support_cache()
+
+
 @pytest.fixture(scope="session")
 def repo_root() -> Path:
     return Path(__file__).resolve().parents[1]
@@ -74,6 +96,7 @@ def make_file_status(
     ctime: float = 0.0,
     blocks: int = 512,
     inode: int = 0,
+    dev: int = 0,
 ) -> FileStatus:
     return FileStatus(
         mode=mode,
@@ -86,6 +109,7 @@ def make_file_status(
         ctime=ctime,
         blocks=blocks,
         inode=inode,
+        dev=dev,
     )
 
 
@@ -1,22 +1,40 @@
 """
-Create fixed test fixtures for pyls.
+Create test fixtures for pyls.
 
 Env vars:
   ROOT  : output root dir (default: ./test_fixture)
   SAMPLES: number of SAMPLES (default: 1)
   RESET: if "1", remove ROOT before creating (default: 0)
+  SHAPE: "fixed" (default), or one of the large trees below
 
-Fixed structure per sample:
+Fixed structure per sample (SHAPE=fixed):
   sample_000000/
     dir_a/ (5 files: a_0000..a_0004)
     dir_b/ (8 files: b_0000..b_0007)
     (10 files: file_0000..file_0009)
+
+Large trees (for benchmarks/e2e.py), written directly under ROOT:
+  SHAPE=wide     : FILES files in one directory (default: 1000000)
+  SHAPE=deep     : DEPTH nested directories, one file per level (default: 10000)
+                   (paths end up longer than PATH_MAX; the tree is built with dir fds)
+  SHAPE=balanced : FANOUT subdirectories per directory, LEVELS levels deep,
+                   FILES files in every directory (defaults: 10, 4, 10)
+  SHAPE=mixed    : FILES entries of every file type (regular, executable, setuid,
+                   empty/sparse, dir, sticky dir, symlink, dangling symlink,
+                   hard link, fifo, socket) and special-character names (default: 10000)
+  SEED : random seed for sizes and mtimes (default: 0)
 """
 
 from __future__ import annotations
 
 import os
+import random
 import shutil
+import socket
+import stat
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Final
 
@@ -25,6 +43,15 @@ TOP_FILES: Final[int] = 10
 DIR_A_FILES: Final[int] = 5
 DIR_B_FILES: Final[int] = 8
 
+SHAPES: Final[tuple[str, ...]] = ("fixed", "wide", "deep", "balanced", "mixed")
+
+# create_special_files_sample と同じ特殊文字
+SPECIAL_NAME_PARTS: Final[tuple[str, ...]] = ("\n", "\t", " ", "\\", '"', "'", "\t\n", "é", "日本語")
+
+DIR_FLAGS: Final[int] = os.O_RDONLY | os.O_DIRECTORY
+FILE_FLAGS: Final[int] = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+YEAR_SECONDS: Final[int] = 365 * 24 * 60 * 60
+
 
 def env_int(name: str, default: int) -> int:
     v = os.getenv(name)
@@ -87,16 +114,152 @@ def create_special_files_sample(base: Path) -> None:
     touch(base / 'mixed_02 "test".py')
 
 
+@contextmanager
+def open_dir(path: Path) -> Iterator[int]:
+    path.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, DIR_FLAGS)
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def touch_at(dir_fd: int, name: str, size: int = 0, mtime: float | None = None, mode: int = 0o644) -> None:
+    """dir_fd の下にファイルを作る。size はスパースに確保するのでディスクは使わない"""
+    fd = os.open(name, FILE_FLAGS, mode, dir_fd=dir_fd)
+    try:
+        if size:
+            os.ftruncate(fd, size)
+        if mtime is not None:
+            os.utime(fd, (mtime, mtime))
+    finally:
+        os.close(fd)
+
+
+def random_mtime(rng: random.Random, now: float) -> float:
+    # 大半は最近、一部は 6 か月以上前 (ls -l の表示が変わる)
+    return now - rng.expovariate(1 / (YEAR_SECONDS / 4))
+
+
+def create_wide_tree(root: Path, files: int, rng: random.Random) -> None:
+    now = time.time()
+    with open_dir(root) as fd:
+        for i in range(files):
+            touch_at(fd, f"file_{i:07d}.txt", size=int(rng.lognormvariate(8.0, 2.5)), mtime=random_mtime(rng, now))
+
+
+def create_deep_tree(root: Path, depth: int) -> None:
+    """depth 段のディレクトリ。パスが PATH_MAX を超えるので、1 段ずつ dir fd をたどって作る"""
+    with open_dir(root) as root_fd:
+        fd = os.dup(root_fd)
+        try:
+            for level in range(depth):
+                touch_at(fd, f"file_{level:05d}.txt")
+                os.mkdir("d", dir_fd=fd)
+                child = os.open("d", DIR_FLAGS, dir_fd=fd)
+                os.close(fd)
+                fd = child
+        finally:
+            os.close(fd)
+
+
+def create_balanced_tree(root: Path, fanout: int, levels: int, files: int, rng: random.Random) -> None:
+    now = time.time()
+
+    def fill(path: Path, level: int) -> None:
+        with open_dir(path) as fd:
+            for i in range(files):
+                touch_at(fd, f"file_{i:04d}.txt", size=int(rng.lognormvariate(8.0, 2.5)), mtime=random_mtime(rng, now))
+        if level < levels:
+            for i in range(fanout):
+                fill(path / f"dir_{i:03d}", level + 1)
+
+    fill(root, 1)
+
+
+def create_mixed_tree(root: Path, count: int, rng: random.Random) -> None:
+    """あらゆる種類のエントリを順番に作る"""
+    now = time.time()
+    sockets: list[socket.socket] = []
+    with open_dir(root) as fd:
+        for i in range(count):
+            kind = i % 12
+            mtime = random_mtime(rng, now)
+            if kind == 0:
+                touch_at(fd, f"regular_{i:06d}.txt", size=int(rng.lognormvariate(8.0, 3.0)), mtime=mtime)
+            elif kind == 1:
+                touch_at(fd, f"exec_{i:06d}.sh", size=128, mtime=mtime, mode=0o755)
+            elif kind == 2:
+                touch_at(fd, f"setuid_{i:06d}", size=64, mtime=mtime, mode=0o755)
+                os.chmod(f"setuid_{i:06d}", 0o4755 | 0o2000, dir_fd=fd)
+            elif kind == 3:
+                # 1 GiB 〜 1 TiB のスパースファイル (-h, -S 用)
+                touch_at(fd, f"sparse_{i:06d}.img", size=rng.randint(1 << 30, 1 << 40), mtime=mtime)
+            elif kind == 4:
+                touch_at(fd, f"empty_{i:06d}", mtime=mtime)
+            elif kind == 5:
+                os.mkdir(f"dir_{i:06d}", dir_fd=fd)
+                touch_at(fd, f"dir_{i:06d}/inner.txt")
+            elif kind == 6:
+                os.mkdir(f"sticky_{i:06d}", 0o777, dir_fd=fd)
+                os.chmod(f"sticky_{i:06d}", 0o777 | stat.S_ISVTX, dir_fd=fd)
+            elif kind == 7:
+                os.symlink(f"regular_{i - 7:06d}.txt", f"link_{i:06d}", dir_fd=fd)
+            elif kind == 8:
+                os.symlink(f"missing_{i:06d}", f"dangling_{i:06d}", dir_fd=fd)
+            elif kind == 9:
+                os.link(f"regular_{i - 9:06d}.txt", f"hardlink_{i:06d}.txt", src_dir_fd=fd, dst_dir_fd=fd)
+            elif kind == 10:
+                os.mkfifo(f"fifo_{i:06d}", dir_fd=fd)
+            else:
+                part = SPECIAL_NAME_PARTS[(i // 12) % len(SPECIAL_NAME_PARTS)]
+                touch_at(fd, f"special_{i:06d}{part}name.txt", size=i, mtime=mtime)
+
+        # ソケットは bind でしか作れず、パスの長さに制限があるので最後にまとめて作る
+        for i in range(min(count // 12, 100)):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            cwd = os.getcwd()
+            try:
+                os.chdir(root)
+                sock.bind(f"socket_{i:06d}")
+            finally:
+                os.chdir(cwd)
+            sockets.append(sock)
+    for sock in sockets:
+        sock.close()
+
+
+def create_large_tree(shape: str, root: Path) -> None:
+    rng = random.Random(env_int("SEED", 0))
+    if shape == "wide":
+        create_wide_tree(root, env_int("FILES", 1_000_000), rng)
+    elif shape == "deep":
+        create_deep_tree(root, env_int("DEPTH", 10_000))
+    elif shape == "balanced":
+        create_balanced_tree(root, env_int("FANOUT", 10), env_int("LEVELS", 4), env_int("FILES", 10), rng)
+    elif shape == "mixed":
+        create_mixed_tree(root, env_int("FILES", 10_000), rng)
+
+
 def main() -> int:
     root = Path(os.getenv("ROOT", "./test_fixture"))
     samples = env_int("SAMPLES", 1)
     reset = os.getenv("RESET", "0") == "1"
+    shape = os.getenv("SHAPE", "fixed")
+    if shape not in SHAPES:
+        raise SystemExit(f"SHAPE must be one of {', '.join(SHAPES)}, got: {shape!r}")
 
     if reset and root.exists():
         shutil.rmtree(root)
 
     root.mkdir(parents=True, exist_ok=True)
 
+    if shape != "fixed":
+        start = time.perf_counter()
+        create_large_tree(shape, root)
+        print(f"created: {root} (shape={shape}, {time.perf_counter() - start:.1f}s)")
+        return 0
+
     for s in range(samples):
         base = root / f"sample_{s:02d}"
         base.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+import pyls
+from pyls import aio
+from pyls.aio import alist, listing_options
+from pyls.core import scan_dir_children
+from pyls.table import EntryTable
+from pyls.types import FileStatus
+
+
+def collect(path, **options):
+    async def run():
+        return [entry async for entry in alist(path, **options)]
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ["b.txt", "a.py", ".hidden", "c.o", "C.txt"]:
+        (tmp_path / name).write_text(name)
+    (tmp_path / "dir").mkdir()
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"all": True}, {"almost_all": True, "ignore": ["*.o"]}, {"sort": "extension"}, {"reverse": True}],
+)
+def test_same_entries_as_cli(tree, options):
+    opts = listing_options(**options)
+    expected, _ = scan_dir_children(tree, opts, EntryTable(tree))
+
+    entries = collect(tree, **options)
+
+    assert [(e.name, e.is_dir, e.path) for e in entries] == [(e.name, e.is_dir, e.path) for e in expected.entries]
+
+
+@pytest.mark.parametrize("options", [{"unsorted": True}, {"sort": "none"}, {}])
+def test_ignore_applies_to_dot_entries(tree, options):
+    names = [e.name for e in collect(tree, all=True, ignore=[".*"], **options)]
+
+    assert sorted(names) == ["C.txt", "a.py", "b.txt", "c.o", "dir"]
+
+
+def test_long_listing_has_stat_data(tree):
+    entries = {e.name: e for e in collect(tree, long=True)}
+
+    assert entries["b.txt"].file_status == FileStatus.from_stat_result(os.lstat(tree / "b.txt"))
+    assert entries["dir"].is_dir
+
+
+def test_unsorted_listing_streams_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(aio, "BATCH_SIZE", 10)
+    for i in range(35):
+        (tmp_path / f"f{i}").touch()
+    calls = []
+    read_batch = aio.DirectoryReader.read_batch
+
+    def counting_read_batch(self):
+        calls.append(threading.current_thread().name)
+        return read_batch(self)
+
+    monkeypatch.setattr(aio.DirectoryReader, "read_batch", counting_read_batch)
+
+    async def first_entry():
+        async for entry in alist(tmp_path, unsorted=True):
+            await asyncio.sleep(0.05)
+            return entry, len(calls)
+
+    entry, calls_before_first = asyncio.run(first_entry())
+
+    assert entry.name.startswith("f")
+    # 最初のバッチと、その次の 1 バッチ分しか先読みしない
+    assert calls_before_first <= 2
+    assert all(name.startswith("pyls-aio") for name in calls)
+    assert len(collect(tmp_path, unsorted=True)) == 35
+
+
+def test_event_loop_is_not_blocked(tmp_path, monkeypatch):
+    (tmp_path / "a").touch()
+    gate = threading.Event()
+    read_batch = aio.DirectoryReader.read_batch
+
+    def slow_read_batch(self):
+        gate.wait(5)
+        return read_batch(self)
+
+    monkeypatch.setattr(aio.DirectoryReader, "read_batch", slow_read_batch)
+
+    async def run():
+        listing = asyncio.create_task(collect_async(tmp_path))
+        # 一覧が止まっている間も、ほかのコルーチンは動く
+        await asyncio.sleep(0.05)
+        assert not listing.done()
+        gate.set()
+        return await listing
+
+    assert [e.name for e in asyncio.run(run())] == ["a"]
+
+
+async def collect_async(path, **options):
+    return [entry async for entry in alist(path, **options)]
+
+
+def test_missing_directory_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        collect(tmp_path / "missing")
+
+
+def test_read_batch_after_close_is_done(tmp_path):
+    (tmp_path / "a").touch()
+    reader = aio.DirectoryReader(tmp_path, listing_options())
+    reader.open()
+    assert [e.name for e in reader.read_batch()[0]] == ["a"]
+
+    assert reader.read_batch() == ([], True)
+
+
+def test_invalid_options():
+    with pytest.raises(TypeError):
+        listing_options(no_such_option=True)
+    with pytest.raises(TypeError):
+        listing_options(watch=True)
+    with pytest.raises(ValueError):
+        listing_options(sort="colour")
+
+
+def test_lazy_attribute():
+    assert pyls.alist is alist
@@ -1,16 +1,22 @@
+import os
+import threading
+import time
 from pathlib import Path
 
 import pytest
 from conftest import MockOpts
 
+from pyls import core
 from pyls.core import (
     classify_paths,
     collect_entries,
     gobble_file,
+    iter_dir_children,
+    required_stat_fields,
     scan_dir_children,
     should_include,
 )
-from pyls.types import ExitStatus
+from pyls.types import DIRENT_FIELDS, ExitStatus, StatField
 
 
 def test_gobble_file_file_not_found(capsys):
@@ -76,7 +82,7 @@ def test_scan_dir_children_fails_for_nonexistent_dir():
 def test_scan_dir_children_fails_for_permission_error(sample_00_dir, monkeypatch, capsys, mock_permission_error):
     opts = MockOpts()
 
-    monkeypatch.setattr(Path, "iterdir", mock_permission_error)
+    monkeypatch.setattr(os, "scandir", mock_permission_error)
 
     entries = []
     dir_entries, status = scan_dir_children(sample_00_dir, opts, entries)
@@ -86,9 +92,62 @@ def test_scan_dir_children_fails_for_permission_error(sample_00_dir, monkeypatch
     assert "pyls: cannot access" in out
 
 
+@pytest.mark.parametrize(
+    "flags, expected",
+    [
+        ({}, StatField.TYPE),
+        ({"inode": True}, StatField.TYPE | StatField.INODE),
+        ({"size": True}, StatField.TYPE | StatField.BLOCKS),
+        ({"sort_time": True}, StatField.TYPE | StatField.TIME),
+        ({"sort": "size"}, StatField.TYPE | StatField.SIZE),
+        ({"sort": "size,name"}, StatField.TYPE | StatField.SIZE),
+        ({"sort": "time,name"}, StatField.TYPE | StatField.TIME),
+        ({"sort": "name,size,time"}, StatField.TYPE | StatField.SIZE | StatField.TIME),
+        ({"sort": "extension,version"}, StatField.TYPE),
+        ({"classify": True}, StatField.TYPE | StatField.MODE),
+        ({"long": True}, StatField.ALL),
+        ({"numeric_uid_gid": True}, StatField.ALL),
+    ],
+)
+def test_required_stat_fields(flags, expected):
+    assert required_stat_fields(MockOpts(**flags)) == expected
+
+
+def test_scan_dir_children_without_stat_fields_uses_dir_entry(sample_00_dir):
+    opts = MockOpts()
+    assert not required_stat_fields(opts) & ~DIRENT_FIELDS
+
+    dir_entries, _ = scan_dir_children(sample_00_dir, opts, entries=[])
+
+    by_name = {e.name: e for e in dir_entries.entries}
+    assert by_name["dir_a"].is_dir
+    assert not by_name["file_0000.txt"].is_dir
+    # lstat していないので nlink は埋まらない
+    assert by_name["file_0000.txt"].file_status.nlink == 0
+
+
+def test_scan_dir_children_inode_matches_lstat(sample_00_dir):
+    opts = MockOpts(inode=True)
+
+    dir_entries, _ = scan_dir_children(sample_00_dir, opts, entries=[])
+
+    for entry in dir_entries.entries:
+        assert entry.file_status.inode == entry.path.lstat().st_ino
+
+
+def test_scan_dir_children_long_format_fills_stat(sample_00_dir):
+    opts = MockOpts(long=True)
+
+    dir_entries, _ = scan_dir_children(sample_00_dir, opts, entries=[])
+
+    for entry in dir_entries.entries:
+        assert entry.file_status.nlink == entry.path.lstat().st_nlink
+        assert entry.file_status.mtime == entry.path.lstat().st_mtime
+
+
 def test_collect_entries_bfs_returns_scan_paths_result_for_existing_dir(sample_00_dir):
     opts = MockOpts()
-    result = collect_entries([sample_00_dir], opts)
+    result = list(collect_entries([sample_00_dir], opts))
 
     assert len(result) == 1
 
@@ -97,7 +156,7 @@ def test_collect_entries_bfs_returns_dir_entries_for_existing_file(sample_00_dir
     p = sample_00_dir
     opts = MockOpts()
 
-    result = collect_entries([p], opts)
+    result = list(collect_entries([p], opts))
 
     assert len(result) == 1
     assert result[0].path == sample_00_dir
@@ -151,3 +210,201 @@ def test_classify_paths_empty():
 
     assert files == []
     assert dirs == []
+
+
+def make_tree(root: Path, depth: int, width: int) -> None:
+    for i in range(width):
+        (root / f"f{i}.txt").touch()
+        if depth > 0:
+            sub = root / f"d{i}"
+            sub.mkdir()
+            make_tree(sub, depth - 1, width)
+
+
+@pytest.mark.parametrize("jobs", [2, 8])
+def test_collect_entries_parallel_keeps_dfs_order(tmp_path, jobs):
+    make_tree(tmp_path, depth=3, width=3)
+
+    sequential = list(collect_entries([tmp_path], MockOpts(recursive=True)))
+    parallel = list(collect_entries([tmp_path], MockOpts(recursive=True, jobs=jobs)))
+
+    assert [d.path for d in parallel] == [d.path for d in sequential]
+    assert [[e.name for e in d.entries] for d in parallel] == [[e.name for e in d.entries] for d in sequential]
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_collect_entries_skips_already_listed_directory(sample_00_dir, capsys, jobs):
+    opts = MockOpts(recursive=True, jobs=jobs)
+
+    result = list(collect_entries([sample_00_dir / "dir_a", sample_00_dir / "dir_a"], opts))
+
+    assert len(result) == 1
+    assert "not listing already-listed directory" in capsys.readouterr().err
+
+
+def test_collect_entries_does_not_rescan_already_listed_directory(sample_00_dir, monkeypatch):
+    scanned = []
+    scan_dir_children = core.scan_dir_children
+
+    def counting_scan(dir_path, *args, **kwargs):
+        scanned.append(dir_path)
+        return scan_dir_children(dir_path, *args, **kwargs)
+
+    monkeypatch.setattr(core, "scan_dir_children", counting_scan)
+
+    list(collect_entries([sample_00_dir / "dir_a", sample_00_dir / "dir_a"], MockOpts(recursive=True)))
+
+    assert scanned == [sample_00_dir / "dir_a"]
+
+
+def test_collect_entries_parallel_read_ahead_is_bounded(tmp_path, monkeypatch):
+    for i in range(60):
+        (tmp_path / f"d{i:02}").mkdir()
+    scanned = []
+    scan_dir = core.scan_dir
+
+    def counting_scan(d, *args):
+        scanned.append(d)
+        return scan_dir(d, *args)
+
+    monkeypatch.setattr(core, "scan_dir", counting_scan)
+    jobs = 2
+
+    walker = collect_entries([tmp_path], MockOpts(recursive=True, jobs=jobs))
+    next(walker)
+    next(walker)
+    # 呼び出し側が止まっている間に、ワーカーが読めるだけ読んでしまわない
+    time.sleep(0.1)
+
+    assert len(scanned) <= 2 + jobs * core.READ_AHEAD_PER_JOB
+    assert len(list(walker)) == 59
+
+
+def test_collect_entries_yields_before_walking_whole_tree(tmp_path):
+    make_tree(tmp_path, depth=2, width=2)
+    opts = MockOpts(recursive=True)
+
+    walker = collect_entries([tmp_path], opts)
+    first = next(walker)
+
+    assert first.path == tmp_path
+    # 最初のディレクトリを返した後に木を変更しても、以降の走査に反映される
+    (tmp_path / "d0" / "late.txt").touch()
+    second = next(walker)
+    assert second.path == tmp_path / "d0"
+    assert "late.txt" in [e.name for e in second.entries]
+
+
+def test_scan_dir_children_skips_ignored_entries(sample_00_dir):
+    opts = MockOpts(long=True, ignore=["file_000[0-4].txt", "dir_a"])
+
+    dir_entries, status = scan_dir_children(sample_00_dir, opts, entries=[])
+
+    names = [e.name for e in dir_entries.entries]
+    assert status == 0
+    assert names == ["dir_b", "file_0005.txt", "file_0006.txt", "file_0007.txt", "file_0008.txt", "file_0009.txt"]
+
+
+@pytest.fixture
+def slow_lstat(monkeypatch):
+    """どのファイルシステムでも lstat が遅いとみなして、スレッドで lstat させる"""
+    monkeypatch.setattr(core, "SLOW_LSTAT_SECONDS", 0)
+    monkeypatch.setattr(core, "STAT_PROBE_SIZE", 4)
+    monkeypatch.setattr(core, "STAT_BATCH_SIZE", 3)
+    threads = set()
+    warm_lstat = core.warm_lstat
+
+    def recording_warm_lstat(children):
+        threads.add(threading.current_thread().name)
+        warm_lstat(children)
+
+    monkeypatch.setattr(core, "warm_lstat", recording_warm_lstat)
+    return threads
+
+
+def scan_rows(path, opts):
+    dir_entries, status = scan_dir_children(path, opts, entries=[])
+    return [(e.name, e.file_status) for e in dir_entries.entries], status
+
+
+def test_scan_dir_children_concurrent_lstat_keeps_order(tmp_path, slow_lstat):
+    for i in range(50):
+        (tmp_path / f"f{i:02d}").write_text("x" * i)
+    opts = MockOpts(long=True, unsorted=True)
+
+    concurrent_rows, status = scan_rows(tmp_path, opts)
+
+    assert status == ExitStatus.OK
+    assert [name for name, _ in concurrent_rows] == [e.name for e in os.scandir(tmp_path)]
+    assert sorted((name, st.size) for name, st in concurrent_rows) == [(f"f{i:02d}", i) for i in range(50)]
+    assert any(name.startswith("pyls-lstat") for name in slow_lstat)
+
+
+class ListedChildren(list):
+    """読み終わった DirEntry のリストを os.scandir() の戻り値のように使う"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def test_scan_dir_children_concurrent_lstat_reports_vanished_entries(tmp_path, slow_lstat, monkeypatch, capsys):
+    for i in range(20):
+        (tmp_path / f"f{i:02d}").touch()
+    scandir = os.scandir
+
+    def scandir_then_unlink(path):
+        children = scandir(path)
+        # readdir で読んだ後、lstat する前に消える
+        entries = list(children)
+        (tmp_path / "f10").unlink()
+        children.close()
+        return ListedChildren(entries)
+
+    monkeypatch.setattr(core.os, "scandir", scandir_then_unlink)
+
+    rows, status = scan_rows(tmp_path, MockOpts(long=True))
+
+    assert status == ExitStatus.ERROR
+    assert [name for name, _ in rows] == [f"f{i:02d}" for i in range(20) if i != 10]
+    assert f"cannot access '{tmp_path / 'f10'}': No such file or directory" in capsys.readouterr().out
+
+
+def test_scan_dir_children_fast_lstat_stays_sequential(tmp_path, monkeypatch):
+    for i in range(100):
+        (tmp_path / f"f{i}").touch()
+    monkeypatch.setattr(core, "SLOW_LSTAT_SECONDS", float("inf"))
+    started = threading.active_count()
+
+    rows, _ = scan_rows(tmp_path, MockOpts(long=True))
+
+    assert len(rows) == 100
+    assert threading.active_count() == started
+
+
+@pytest.mark.parametrize("opts", [MockOpts(), MockOpts(all=True, long=True), MockOpts(ignore=["file_000[0-4].txt"])])
+def test_iter_dir_children_yields_same_entries_unsorted(sample_00_dir, opts):
+    expected, _ = scan_dir_children(sample_00_dir, opts, entries=[])
+
+    entries = list(iter_dir_children(sample_00_dir, opts))
+
+    assert sorted(entries) == sorted(expected.entries)
+
+
+def test_iter_dir_children_reports_missing_directory(tmp_path):
+    messages: list[str] = []
+
+    assert list(iter_dir_children(tmp_path / "missing", MockOpts(), messages)) == []
+    assert messages == [f"pyls: cannot access '{tmp_path / 'missing'}': No such file or directory"]
+
+
+@pytest.mark.parametrize("sort", ["size", "size,name"])
+def test_scan_dir_children_multi_key_sort_without_long(tmp_path, sort):
+    for name, size in [("a", 30), ("b", 10), ("c", 20)]:
+        (tmp_path / name).write_bytes(b"x" * size)
+
+    dir_entries, _ = scan_dir_children(tmp_path, MockOpts(sort=sort), entries=[])
+
+    assert [e.name for e in dir_entries.entries] == ["a", "c", "b"]
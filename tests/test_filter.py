@@ -1,8 +1,11 @@
+import fnmatch
 from pathlib import Path
 
+import pytest
 from conftest import MockOpts, make_file_entry, make_file_status
 
-from pyls.filter import filter_ignored, iter_display_entries
+from pyls.cli import build_parser
+from pyls.filter import IgnoreMatcher, filter_ignored, ignore_matcher, iter_display_entries, sort_key_names
 
 
 def test_ignore_filters_matching_names():
@@ -49,6 +52,71 @@ def test_hide_disabled_by_almost_all():
     assert [e.name for e in filtered] == ["a.py", "b1.txt"]
 
 
+def test_filter_ignored_does_not_print_debug(capsys):
+    filter_ignored([make_file_entry(Path("a.py"))], MockOpts(ignore=["*.py"]))
+
+    assert capsys.readouterr().err == ""
+
+
+def test_ignore_matcher_splits_patterns_by_kind():
+    matcher = IgnoreMatcher(["Makefile", "*.o", "*.so", "build*", "file_[0-9]?.txt"])
+
+    assert matcher.literals == {"Makefile"}
+    assert matcher.suffixes == {2: {".o"}, 3: {".so"}}
+    assert matcher.prefixes == {5: {"build"}}
+    assert matcher.regex is not None
+
+
+def test_ignore_matcher_empty():
+    assert not IgnoreMatcher([])
+    assert not ignore_matcher(MockOpts())
+
+
+NAMES = [
+    "Makefile",
+    "main.o",
+    ".o",
+    "o",
+    "lib.so.1",
+    "build",
+    "builder.log",
+    "file_01.txt",
+    "file_1.txt",
+    ".hidden",
+    "a*b",
+    "[x]",
+    "newline\nfile.txt",
+]
+
+
+@pytest.mark.parametrize(
+    "patterns",
+    [
+        ["Makefile"],
+        ["*.o"],
+        ["*"],
+        ["build*"],
+        ["*.so*"],
+        ["file_[0-9]?.txt"],
+        [".*"],
+        ["a[*]b", "[[]x]"],
+        ["*.txt", "Makefile", "b*", "?"],
+    ],
+)
+def test_ignore_matcher_agrees_with_fnmatch(patterns):
+    matcher = IgnoreMatcher(patterns)
+
+    for name in NAMES:
+        expected = any(fnmatch.fnmatch(name, pat) for pat in patterns)
+        assert matcher.matches(name) is expected, name
+
+
+def test_ignore_matcher_is_compiled_once_per_pattern_set():
+    opts = MockOpts(ignore=["*.o"], hide=["*.py"])
+
+    assert ignore_matcher(opts) is ignore_matcher(MockOpts(ignore=["*.o"], hide=["*.py"]))
+
+
 def test_iter_display_entries_sort_by_name():
     opts = MockOpts()
     entries = [
@@ -139,3 +207,60 @@ def test_iter_display_entries_sort_by_version():
     result = iter_display_entries(entries, opts)
     # 自然順: 1 → 2 → 10 → 20
     assert [e.name for e in result] == ["file1.txt", "file2.txt", "file10.txt", "file20.txt"]
+
+
+def test_iter_display_entries_multi_key_size_then_name():
+    opts = MockOpts(sort="size,name")
+    entries = [
+        make_file_entry(Path("b.txt"), file_status=make_file_status(size=100)),
+        make_file_entry(Path("c.txt"), file_status=make_file_status(size=500)),
+        make_file_entry(Path("a.txt"), file_status=make_file_status(size=100)),
+        make_file_entry(Path("D.txt"), file_status=make_file_status(size=500)),
+    ]
+    result = iter_display_entries(entries, opts)
+    assert [e.name for e in result] == ["c.txt", "D.txt", "a.txt", "b.txt"]
+
+
+def test_iter_display_entries_multi_key_reverse():
+    opts = MockOpts(sort="extension,time", reverse=True)
+    entries = [
+        make_file_entry(Path("old.py"), file_status=make_file_status(mtime=1000.0)),
+        make_file_entry(Path("new.py"), file_status=make_file_status(mtime=3000.0)),
+        make_file_entry(Path("a.md"), file_status=make_file_status(mtime=2000.0)),
+    ]
+    result = iter_display_entries(entries, opts)
+    assert [e.name for e in result] == ["old.py", "new.py", "a.md"]
+
+
+def test_iter_display_entries_computes_each_key_once(monkeypatch):
+    import pyls.filter
+
+    calls = []
+    monkeypatch.setitem(pyls.filter.SORT_KEYS, "name", lambda e: calls.append(e.name) or e.name)
+    entries = [make_file_entry(Path(name)) for name in ("c", "a", "d", "b", "e")]
+
+    iter_display_entries(entries, MockOpts())
+
+    assert sorted(calls) == ["a", "b", "c", "d", "e"]
+
+
+@pytest.mark.parametrize(
+    "flags, expected",
+    [
+        ({}, ["name"]),
+        ({"unsorted": True, "sort_time": True}, []),
+        ({"sort": "none"}, []),
+        ({"sort_time": True, "sort": "size"}, ["time"]),
+        ({"sort_size": True, "sort": "time"}, ["time"]),
+        ({"sort": "size,name"}, ["size", "name"]),
+        ({"sort": "version"}, ["version"]),
+    ],
+)
+def test_sort_key_names(flags, expected):
+    assert sort_key_names(MockOpts(**flags)) == expected
+
+
+@pytest.mark.parametrize("value", ["bogus", "size,bogus", "none,size"])
+def test_sort_option_rejects_unknown_keys(value):
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["--sort", value])
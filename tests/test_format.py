@@ -1,17 +1,26 @@
+import errno
+import grp
 import os
+import pwd
 import stat
 from datetime import datetime
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
+import xattr
 from conftest import MockOpts, make_file_entry, make_file_status
 from freezegun import freeze_time
 
+import pyls.format
 from pyls.cli import build_parser
 from pyls.core import gobble_file
 from pyls.format import (
+    TimeFormatter,
     c_escape,
     calculate_total_blocks,
+    extended_attribute_char,
+    extended_attribute_chars,
     file_type_indicator,
     filetype_char,
     format_entry_name,
@@ -22,12 +31,15 @@ from pyls.format import (
     group_name,
     human_readable_size,
     max_width,
+    mode_string,
     pad_value,
     permission_string,
+    prefetch_owner_names,
     quote_double,
     replace_nonprintable,
     user_name,
 )
+from pyls.table import EntryTable
 from pyls.types import LongFormatLine
 
 
@@ -43,6 +55,45 @@ def test_filetype_char_regular_file():
     assert filetype_char(stat.S_IFREG | 0o644) == "-"
 
 
+@pytest.mark.parametrize(
+    "mode, expected",
+    [
+        (stat.S_IFBLK, "b"),
+        (stat.S_IFCHR, "c"),
+        (stat.S_IFIFO, "p"),
+        (stat.S_IFSOCK, "s"),
+        (0, "?"),
+    ],
+)
+def test_filetype_char_special_files(mode, expected):
+    assert filetype_char(mode | 0o644) == expected
+
+
+@pytest.mark.parametrize(
+    "mode, expected",
+    [
+        (0o4755, "rwsr-xr-x"),
+        (0o4644, "rwSr--r--"),
+        (0o2755, "rwxr-sr-x"),
+        (0o2745, "rwxr-Sr-x"),
+        (0o1777, "rwxrwxrwt"),
+        (0o1776, "rwxrwxrwT"),
+        (0o7000, "--S--S--T"),
+    ],
+)
+def test_permission_string_special_bits(mode, expected):
+    assert permission_string(mode) == expected
+
+
+def test_permission_string_matches_stat_filemode_for_all_bits():
+    for bits in range(0o10000):
+        assert permission_string(bits) == stat.filemode(stat.S_IFREG | bits)[1:]
+
+
+def test_mode_string_directory():
+    assert mode_string(stat.S_IFDIR | 0o1777) == "drwxrwxrwt"
+
+
 def test_permission_string_rwx_all():
     assert permission_string(0o777) == "rwxrwxrwx"
 
@@ -73,6 +124,49 @@ def test_user_name_unknown_uid_falls_back_to_number():
     assert user_name(99999, numeric=False) == "99999"
 
 
+def test_user_name_caches_unknown_uid(monkeypatch):
+    calls = []
+
+    def fake_getpwuid(uid):
+        calls.append(uid)
+        raise KeyError(uid)
+
+    monkeypatch.setattr(pwd, "getpwuid", fake_getpwuid)
+
+    assert user_name(99999, numeric=False) == "99999"
+    assert user_name(99999, numeric=False) == "99999"
+    assert calls == [99999]
+
+
+def test_prefetch_owner_names_resolves_each_id_once(monkeypatch):
+    user_calls = []
+    group_calls = []
+    monkeypatch.setattr(pwd, "getpwuid", lambda uid: user_calls.append(uid) or SimpleNamespace(pw_name=f"u{uid}"))
+    monkeypatch.setattr(grp, "getgrgid", lambda gid: group_calls.append(gid) or SimpleNamespace(gr_name=f"g{gid}"))
+    entries = [
+        make_file_entry(Path(f"f{i}"), file_status=make_file_status(uid=1000 + i % 2, gid=2000)) for i in range(10)
+    ]
+
+    prefetch_owner_names(entries, MockOpts())
+    names = [user_name(e.file_status.uid, numeric=False) for e in entries]
+
+    assert sorted(user_calls) == [1000, 1001]
+    assert group_calls == [2000]
+    assert names[:2] == ["u1000", "u1001"]
+
+
+def test_prefetch_owner_names_skips_hidden_columns(monkeypatch):
+    calls = []
+    monkeypatch.setattr(pwd, "getpwuid", lambda uid: calls.append(uid))
+    monkeypatch.setattr(grp, "getgrgid", lambda gid: calls.append(gid))
+    entries = [make_file_entry(Path("a"))]
+
+    prefetch_owner_names(entries, MockOpts(no_owner=True, no_group=True))
+    prefetch_owner_names(entries, MockOpts(numeric_uid_gid=True))
+
+    assert calls == []
+
+
 def test_group_name_resolves_current_group():
     gid = os.getgid()
     result = group_name(gid, numeric=False)
@@ -500,3 +594,167 @@ def test_format_prefix_inode_and_size(sample_00_dir):
     result = format_prefix(entry, args)
 
     assert str(entry.file_status.inode) in result
+
+
+def test_extended_attribute_char_remembers_unsupported_device(monkeypatch):
+    calls = []
+
+    def fake_listxattr(path):
+        calls.append(path)
+        raise OSError(errno.ENOTSUP, "Operation not supported")
+
+    monkeypatch.setattr(xattr, "listxattr", fake_listxattr)
+
+    assert extended_attribute_char(Path("a"), dev=7) == ""
+    assert extended_attribute_char(Path("b"), dev=7) == ""
+    assert calls == ["a"]
+
+
+def test_extended_attribute_char_keeps_probing_after_other_errors(monkeypatch):
+    calls = []
+
+    def fake_listxattr(path):
+        calls.append(path)
+        raise FileNotFoundError(errno.ENOENT, "No such file or directory")
+
+    monkeypatch.setattr(xattr, "listxattr", fake_listxattr)
+
+    extended_attribute_char(Path("a"), dev=7)
+    extended_attribute_char(Path("b"), dev=7)
+    assert calls == ["a", "b"]
+
+
+@pytest.mark.parametrize("batch_min", [1, 1000])
+def test_extended_attribute_chars_keeps_entry_order(monkeypatch, batch_min):
+    monkeypatch.setattr(pyls.format, "XATTR_BATCH_MIN", batch_min)
+    monkeypatch.setattr(xattr, "listxattr", lambda path: ["user.x"] if path.endswith("3") else [])
+    entries = [make_file_entry(Path(f"f{i}"), file_status=make_file_status(dev=1)) for i in range(20)]
+
+    chars = extended_attribute_chars(entries, MockOpts())
+
+    assert chars == ["@" if i in (3, 13) else "" for i in range(20)]
+
+
+def test_extended_attribute_chars_skips_unsupported_device(monkeypatch):
+    calls = []
+
+    def fake_listxattr(path):
+        calls.append(path)
+        if path.startswith("nfs"):
+            raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+        return ["user.x"]
+
+    monkeypatch.setattr(xattr, "listxattr", fake_listxattr)
+    entries = [make_file_entry(Path(f"nfs{i}"), file_status=make_file_status(dev=1)) for i in range(5)]
+    entries += [make_file_entry(Path(f"ext{i}"), file_status=make_file_status(dev=2)) for i in range(2)]
+
+    chars = extended_attribute_chars(entries, MockOpts())
+
+    assert chars == ["", "", "", "", "", "@", "@"]
+    assert calls == ["nfs0", "ext0", "ext1"]
+
+
+def test_extended_attribute_chars_disabled_by_no_xattr(monkeypatch):
+    calls = []
+    monkeypatch.setattr(xattr, "listxattr", lambda path: calls.append(path) or [])
+    entries = [make_file_entry(Path("a")), make_file_entry(Path("b"))]
+
+    assert extended_attribute_chars(entries, MockOpts(no_xattr=True)) == ["", ""]
+    assert format_long_line(entries[0], MockOpts(no_xattr=True, numeric_uid_gid=True)).mode == "-rw-r--r--"
+    assert calls == []
+
+
+@freeze_time("2025-01-01 12:00:00")
+@pytest.mark.parametrize(
+    "style, when, expected",
+    [
+        (None, datetime(2024, 12, 29, 15, 17, 42), "Dec 29 15:17"),
+        (None, datetime(2023, 3, 5, 15, 17, 42), "Mar  5  2023"),
+        ("locale", datetime(2024, 12, 29, 15, 17, 42), "Dec 29 15:17"),
+        ("posix-long-iso", datetime(2024, 12, 29, 15, 17, 42), "Dec 29 15:17"),
+        ("long-iso", datetime(2023, 3, 5, 15, 17, 42), "2023-03-05 15:17"),
+        ("iso", datetime(2024, 12, 29, 15, 17, 42), "12-29 15:17"),
+        ("iso", datetime(2023, 3, 5, 15, 17, 42), "2023-03-05 "),
+        ("+%Y/%m/%d", datetime(2024, 12, 29, 15, 17, 42), "2024/12/29"),
+        ("+%Y\n%H:%M:%S", datetime(2024, 12, 29, 15, 17, 42), "15:17:42"),
+        ("+%Y\n%H:%M:%S", datetime(2023, 3, 5, 15, 17, 42), "2023"),
+    ],
+)
+def test_time_formatter_styles(style, when, expected):
+    assert TimeFormatter(style).format(when.timestamp()) == expected
+
+
+@freeze_time("2025-01-01 12:00:00")
+def test_time_formatter_full_iso():
+    timestamp = datetime(2024, 12, 29, 15, 17, 42).timestamp() + 0.25
+
+    text = TimeFormatter("full-iso").format(timestamp)
+
+    date, clock, offset = text.split(" ")
+    assert date == "2024-12-29"
+    assert clock == "15:17:42.250000000"
+    assert offset[0] in "+-" and len(offset) == 5
+
+
+def test_time_formatter_full_iso_uses_exact_nanoseconds():
+    seconds = int(datetime(2024, 12, 29, 15, 17, 42).timestamp())
+    formatter = TimeFormatter("full-iso")
+
+    # float にすると下位桁が丸められる値
+    exact = formatter.format(seconds + 0.858401742, seconds * 1_000_000_000 + 858_401_742)
+    # float では次の秒に繰り上がってしまう値
+    last = formatter.format(seconds + 1.0, seconds * 1_000_000_000 + 999_999_999)
+
+    assert exact.split(" ")[1] == "15:17:42.858401742"
+    assert last.split(" ")[1] == "15:17:42.999999999"
+
+
+def test_time_formatter_full_iso_negative_timestamp():
+    text = TimeFormatter("full-iso").format(-0.5, -500_000_000)
+
+    assert "\0" not in text
+    assert text.split(" ")[1].endswith(":59.500000000")
+
+
+@pytest.mark.parametrize("table", [False, True])
+def test_format_long_line_full_iso_nanoseconds(tmp_path, table):
+    path = tmp_path / "f"
+    path.touch()
+    mtime_ns = int(datetime(2024, 12, 29, 15, 17, 42).timestamp()) * 1_000_000_000 + 858_401_742
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    if table:
+        entries = EntryTable(tmp_path)
+        entries.append_stat("f", os.lstat(path))
+    else:
+        entries = []
+        gobble_file(path, entries)
+    entry = entries[0]
+
+    line = format_long_line(entry, MockOpts(long=True, no_xattr=True, time_style="full-iso"))
+
+    assert line.time.split(" ")[1] == "15:17:42.858401742"
+
+
+@freeze_time("2025-01-01 12:00:00")
+def test_time_formatter_caches_per_minute():
+    formatter = TimeFormatter()
+    base = datetime(2024, 12, 29, 15, 17, 0).timestamp()
+
+    texts = {formatter.format(base + second) for second in range(60)}
+
+    assert texts == {"Dec 29 15:17"}
+    assert len(formatter._cache) == 1
+
+
+@freeze_time("2025-01-01 12:00:00")
+def test_time_formatter_future_timestamp_shows_year():
+    assert TimeFormatter().format(datetime(2025, 1, 1, 12, 1, 0).timestamp()) == "Jan  1  2025"
+
+
+def test_format_time_with_style():
+    assert format_time(datetime(2020, 2, 3, 4, 5, 6).timestamp(), "long-iso") == "2020-02-03 04:05"
+
+
+def test_time_style_option_rejects_unknown_style():
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["--time-style", "bogus"])
@@ -0,0 +1,114 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+from pyls import index
+from pyls.main import main
+
+
+@pytest.fixture
+def tree(tmp_path):
+    # 索引を書くと親ディレクトリの mtime が変わるので、.. とは別のディレクトリに置く
+    d = tmp_path / "src" / "d"
+    (d / "sub" / "deep").mkdir(parents=True)
+    (d / "big").write_bytes(b"x" * 5000)
+    (d / "small").write_text("x")
+    (d / ".hidden").touch()
+    (d / "sub" / "c.o").touch()
+    (d / "sub" / "deep" / "e").touch()
+    os.symlink("big", d / "link")
+    (tmp_path / "out").mkdir()
+    return d
+
+
+def index_tree(tree, *args):
+    db = tree.parent.parent / "out" / "tree.db"
+    assert main(["-R", "--index-to", str(db), *args, str(tree)]) == 0
+    return db
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["-lR"], ["-laR"], ["-1", "-S"], ["-lt", "-r"], ["-A", "--sort=size,name"], ["-RU", "-1"], ["-d", "-l"]],
+)
+def test_from_index_matches_live_listing(tree, capsys, args):
+    db = index_tree(tree)
+    main([*args, str(tree)])
+    expected = capsys.readouterr().out
+
+    # ファイルシステムには触らない
+    shutil.rmtree(tree)
+    main(["--from-index", str(db), *args, str(tree)])
+
+    assert capsys.readouterr().out == expected
+
+
+def test_from_index_file_operand_and_missing_path(tree, capsys):
+    db = index_tree(tree)
+
+    main(["--from-index", str(db), "-1", str(tree / "big"), str(tree / "missing")])
+
+    captured = capsys.readouterr().out
+    assert f"cannot access '{tree / 'missing'}': No such file or directory" in captured
+    assert captured.endswith("\nbig\n")
+
+
+def test_index_is_queryable_with_sql(tree):
+    db = index_tree(tree, "-I", "*.o")
+
+    with sqlite3.connect(db) as conn:
+        rows = conn.execute("SELECT path, size FROM entries WHERE NOT is_dir ORDER BY size DESC LIMIT 1").fetchall()
+        names = {name for (name,) in conn.execute("SELECT name FROM entries")}
+
+    assert rows == [(str(tree / "big"), 5000)]
+    # 隠しファイルは記録し、-I で無視したものは記録しない
+    assert ".hidden" in names
+    assert "c.o" not in names
+
+
+def test_undecodable_name_round_trips(tree, capsys):
+    os.close(os.open(os.fsencode(tree) + b"/\xff", os.O_CREAT | os.O_WRONLY))
+    db = index_tree(tree)
+    main(["-1", "-b", str(tree)])
+    expected = capsys.readouterr().out
+
+    main(["--from-index", str(db), "-1", "-b", str(tree)])
+
+    assert capsys.readouterr().out == expected
+
+
+def test_rewritten_index_is_reopened(tree, capsys):
+    db = index_tree(tree)
+    main(["--from-index", str(db), "-1", str(tree)])
+    capsys.readouterr()
+
+    (tree / "new").touch()
+    index_tree(tree)
+    main(["--from-index", str(db), "-1", str(tree)])
+
+    assert "new" in capsys.readouterr().out.split()
+
+
+def test_writes_in_batches(tree, monkeypatch):
+    monkeypatch.setattr(index, "BATCH_ROWS", 2)
+
+    db = index_tree(tree)
+
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM entries").fetchone() == (8,)
+
+
+def test_unwritable_index(tree, capsys):
+    db = tree.parent.parent / "missing-dir" / "tree.db"
+
+    assert main(["--index-to", str(db), str(tree)]) == 2
+    assert "cannot write index" in capsys.readouterr().err
+
+
+def test_unopenable_index(tmp_path, capsys):
+    (tmp_path / "not-an-index").write_text("hello")
+
+    assert main(["--from-index", str(tmp_path / "not-an-index"), str(tmp_path)]) == 2
+    assert "cannot open index" in capsys.readouterr().err
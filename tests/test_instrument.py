@@ -0,0 +1,103 @@
+import json
+import time
+
+import pytest
+
+from pyls import core, output
+from pyls.instrument import Profile
+from pyls.main import main
+from pyls.writer import writer
+
+
+@pytest.fixture
+def listing_dir(tmp_path):
+    for name in ["a.txt", "b.txt", "c.py"]:
+        (tmp_path / name).write_text(name)
+    (tmp_path / "sub").mkdir()
+    return tmp_path
+
+
+def phase_calls(report: str) -> dict[str, int]:
+    calls = {}
+    for line in report.splitlines()[2:]:
+        fields = line.split()
+        if len(fields) == 5:
+            calls[fields[0]] = int(fields[1])
+    return calls
+
+
+def test_profile_reports_phases(listing_dir, capsys):
+    main(["-l", str(listing_dir)])
+    expected = capsys.readouterr().out
+
+    main(["--profile", "-l", str(listing_dir)])
+
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert captured.err.startswith("pyls profile: ")
+    assert "4 entries" in captured.err
+    calls = phase_calls(captured.err)
+    assert calls["opendir"] == 1
+    assert calls["readdir"] == 4
+    assert calls["lstat"] == 4
+    assert calls["sort"] >= 1
+    assert "filesystem and NSS calls: opendir 1, lstat 4" in captured.err
+
+
+def test_profile_from_environment(listing_dir, capsys, monkeypatch):
+    monkeypatch.setenv("PYLS_PROFILE", "1")
+    main(["-1", str(listing_dir)])
+    assert "pyls profile:" in capsys.readouterr().err
+
+    monkeypatch.setenv("PYLS_PROFILE", "0")
+    main(["-1", str(listing_dir)])
+    assert capsys.readouterr().err == ""
+
+
+def test_profile_restores_functions(listing_dir, capsys):
+    names = [(core, "open_children"), (core, "scan_dir"), (output, "print_entries"), (output, "iter_display_entries")]
+    originals = [getattr(module, name) for module, name in names]
+
+    main(["--profile", "--trace-file", str(listing_dir / "trace.json"), "-1", str(listing_dir)])
+
+    assert [getattr(module, name) for module, name in names] == originals
+    assert "flush" not in vars(writer)
+
+
+def test_nested_phases_are_not_counted_twice():
+    profile = Profile()
+
+    profile.call("format", profile.call, "lstat", time.sleep, 0.05)
+
+    assert profile.phases["format"].calls == profile.phases["lstat"].calls == 1
+    assert profile.phases["lstat"].seconds >= 0.05
+    # 外側のフェーズには内側の時間を含めない
+    assert profile.phases["format"].seconds < 0.01
+
+
+def test_trace_file_has_spans_per_directory(listing_dir, tmp_path_factory, capsys):
+    (listing_dir / "sub" / "inner.txt").touch()
+    trace_path = tmp_path_factory.mktemp("trace") / "trace.json"
+
+    main(["--trace-file", str(trace_path), "-lR", "--jobs", "2", str(listing_dir)])
+
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    scanned = {e["args"]["path"]: e["args"]["entries"] for e in spans if e["name"] == "scan"}
+    assert scanned == {str(listing_dir): 4, str(listing_dir / "sub"): 1}
+    assert {"scan", "stat batch", "sort", "render", "walk"} <= {e["name"] for e in spans}
+    assert all({"ts", "dur", "pid", "tid"} <= e.keys() for e in spans)
+    thread_names = {e["args"]["name"] for e in events if e["ph"] == "M"}
+    assert "MainThread" in thread_names
+    assert any(name.startswith("pyls-scan") for name in thread_names)
+    assert capsys.readouterr().err == ""
+
+
+def test_unwritable_trace_file_is_reported(listing_dir, tmp_path_factory, capsys):
+    trace_path = tmp_path_factory.mktemp("trace") / "missing" / "trace.json"
+
+    main(["--trace-file", str(trace_path), "-1", str(listing_dir)])
+
+    captured = capsys.readouterr()
+    assert captured.out == "a.txt\nb.txt\nc.py\nsub\n"
+    assert "cannot write trace file" in captured.err
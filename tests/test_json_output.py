@@ -0,0 +1,100 @@
+import json
+import os
+
+import pytest
+
+from pyls.main import main
+from pyls.types import FileStatus
+
+
+@pytest.fixture
+def tree(tmp_path):
+    d = tmp_path / "d"
+    (d / "sub").mkdir(parents=True)
+    (d / "b.txt").write_text("hello")
+    (d / "a\nnewline").touch()
+    (d / "sub" / "c").touch()
+    os.symlink("b.txt", d / "link")
+    return d
+
+
+def ndjson(capsys, *args):
+    main(["--format=ndjson", *args])
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_ndjson_has_raw_stat_fields(tree, capsys):
+    records = {r["name"]: r for r in ndjson(capsys, str(tree))}
+
+    assert set(records) == {"a\nnewline", "b.txt", "link", "sub"}
+    b = records["b.txt"]
+    assert [b[field] for field in FileStatus._fields] == list(FileStatus.from_stat_result(os.lstat(tree / "b.txt")))
+    assert (b["path"], b["directory"], b["type"]) == (str(tree / "b.txt"), str(tree), "file")
+    assert records["link"]["type"] == "symlink"
+    assert records["sub"]["type"] == "directory"
+
+
+def test_ndjson_keeps_listing_order(tree, capsys):
+    main(["-1", "-t", str(tree)])
+    expected = capsys.readouterr().out
+
+    names = [r["name"] for r in ndjson(capsys, "-t", str(tree))]
+
+    # -1 は改行をそのまま出すので、名前をつなげると同じになる
+    assert "\n".join(names) + "\n" == expected
+
+
+@pytest.mark.parametrize("unsorted", [[], ["-U"]])
+def test_recursive_listing(tree, capsys, unsorted):
+    records = ndjson(capsys, "-R", *unsorted, str(tree))
+
+    assert sorted(r["path"] for r in records) == sorted(
+        str(p) for p in [tree / "a\nnewline", tree / "b.txt", tree / "link", tree / "sub", tree / "sub" / "c"]
+    )
+    # DFS 順: 親ディレクトリの分が先
+    assert records[-1]["directory"] == str(tree / "sub")
+
+
+def test_json_is_one_array(tree, capsys):
+    main(["--format=json", str(tree / "b.txt"), str(tree / "sub")])
+
+    records = json.loads(capsys.readouterr().out)
+    assert [(r["name"], r["directory"]) for r in records] == [("b.txt", None), ("c", str(tree / "sub"))]
+
+
+def test_empty_json_listing(tmp_path, capsys):
+    main(["--format=json", str(tmp_path)])
+
+    assert json.loads(capsys.readouterr().out) == []
+
+
+def test_undecodable_name_round_trips(tmp_path, capsys):
+    os.close(os.open(os.fsencode(tmp_path) + b"/\xff", os.O_CREAT | os.O_WRONLY))
+
+    (record,) = ndjson(capsys, str(tmp_path))
+
+    assert os.fsencode(record["name"]) == b"\xff"
+
+
+def test_errors_go_to_stderr(tree, capsys):
+    main(["--format=json", str(tree / "missing"), str(tree / "sub")])
+
+    captured = capsys.readouterr()
+    assert [r["name"] for r in json.loads(captured.out)] == ["c"]
+    assert "cannot access" in captured.err
+
+
+@pytest.mark.parametrize(("word", "flag"), [("long", "-l"), ("verbose", "-l"), ("single-column", "-1")])
+def test_gnu_format_words(tree, capsys, word, flag):
+    main([flag, str(tree)])
+    expected = capsys.readouterr().out
+
+    main([f"--format={word}", str(tree)])
+
+    assert capsys.readouterr().out == expected
+
+
+def test_invalid_format(capsys):
+    with pytest.raises(SystemExit):
+        main(["--format=xml"])
+    assert "invalid argument 'xml'" in capsys.readouterr().err
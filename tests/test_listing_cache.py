@@ -0,0 +1,162 @@
+import os
+import stat
+
+import pytest
+from conftest import MockOpts
+
+from pyls import listing_cache
+from pyls.core import scan_dir_children
+from pyls.listing_cache import CachedDirEntry, ListingCache
+from pyls.main import main
+from pyls.table import EntryTable
+from pyls.types import FileStatus
+
+
+@pytest.fixture(autouse=True)
+def no_racy_window(monkeypatch):
+    # ctime は古くできないので、作ったばかりのディレクトリも保存するようにする
+    monkeypatch.setattr(listing_cache, "RACY_WINDOW_NS", 0)
+
+
+def make_dir(path, names):
+    path.mkdir()
+    for name in names:
+        if name.endswith("/"):
+            (path / name).mkdir()
+        else:
+            (path / name).touch()
+    return path
+
+
+def listing(children):
+    with children:
+        return sorted((e.name, e.is_dir(follow_symlinks=False), e.is_symlink(), e.inode()) for e in children)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ListingCache(str(tmp_path / "cache" / "listing.sqlite"))
+    yield cache
+    cache.close()
+
+
+def forbid_scandir(monkeypatch):
+    def fail(path):
+        raise AssertionError(f"scandir({path}) should not be called")
+
+    monkeypatch.setattr(listing_cache.os, "scandir", fail)
+
+
+def test_unchanged_directory_is_served_from_cache(tmp_path, cache, monkeypatch):
+    d = make_dir(tmp_path / "d", ["a", "b.txt", "sub/"])
+    os.symlink("a", d / "link")
+    expected = listing(os.scandir(d))
+
+    assert listing(cache.scandir(d)) == expected
+
+    forbid_scandir(monkeypatch)
+    assert listing(cache.scandir(d)) == expected
+
+
+def test_changed_directory_is_scanned_again(tmp_path, cache):
+    d = make_dir(tmp_path / "d", ["a"])
+    listing(cache.scandir(d))
+
+    (d / "b").touch()
+
+    assert [name for name, *_ in listing(cache.scandir(d))] == ["a", "b"]
+
+
+def test_recently_modified_directory_is_not_stored(tmp_path, cache, monkeypatch):
+    monkeypatch.setattr(listing_cache, "RACY_WINDOW_NS", 2_000_000_000)
+    d = make_dir(tmp_path / "d", ["a"])
+    listing(cache.scandir(d))
+
+    assert cache.lookup(str(d), os.stat(d)) is None
+
+
+def test_partially_read_directory_is_not_stored(tmp_path, cache):
+    d = make_dir(tmp_path / "d", ["a", "b"])
+
+    with cache.scandir(d) as children:
+        next(iter(children))
+
+    assert cache.lookup(str(d), os.stat(d)) is None
+
+
+def test_least_recently_used_listing_is_evicted(tmp_path, cache):
+    dirs = [make_dir(tmp_path / f"d{i}", [f"file{j}" for j in range(10)]) for i in range(3)]
+    listing(cache.scandir(dirs[0]))
+    (size,) = cache._db.execute("SELECT size FROM listings").fetchone()
+    cache.max_bytes = size * 2
+
+    listing(cache.scandir(dirs[1]))
+    # d0 を使ったので、次に消えるのは d1
+    listing(cache.scandir(dirs[0]))
+    listing(cache.scandir(dirs[2]))
+
+    cached = [cache.lookup(str(d), os.stat(d)) is not None for d in dirs]
+    assert cached == [True, False, True]
+
+
+def test_cached_dir_entry_stats_lazily(tmp_path):
+    (tmp_path / "f").write_text("hello")
+    os.symlink("f", tmp_path / "link")
+
+    entry = CachedDirEntry(str(tmp_path), "link", stat.S_IFLNK, 1)
+    unknown = CachedDirEntry(str(tmp_path), "f", 0, 2)
+
+    assert entry.is_symlink()
+    assert not entry.is_file(follow_symlinks=False)
+    assert entry.is_file()
+    assert entry.stat().st_size == 5
+    assert unknown.is_file(follow_symlinks=False)
+    assert not CachedDirEntry(str(tmp_path), "gone", 0, 3).is_dir()
+
+
+@pytest.mark.parametrize("long", [False, True])
+def test_scan_dir_children_gives_same_entries(tmp_path, monkeypatch, long):
+    monkeypatch.setenv("PYLS_LISTING_CACHE", str(tmp_path / "listing.sqlite"))
+    # キャッシュのファイルを作ると親の mtime が変わるので、.. とは別のディレクトリに置く
+    (tmp_path / "tree").mkdir()
+    d = make_dir(tmp_path / "tree" / "d", ["b", "a", ".hidden", "sub/"])
+    opts = MockOpts(long=long, all=True)
+
+    def scan(cached):
+        opts.listing_cache = cached
+        dir_entries, status = scan_dir_children(d, opts, EntryTable(d))
+        # readdir しないとディレクトリの atime は変わらないので、atime は比べない
+        fields = [name for name in FileStatus._fields if name not in ("atime", "atime_ns")]
+        rows = [(e.name, e.is_dir, *(getattr(e.file_status, f) for f in fields)) for e in dir_entries.entries]
+        return rows, status
+
+    expected = scan(False)
+    assert scan(True) == expected
+
+    forbid_scandir(monkeypatch)
+    assert scan(True) == expected
+
+
+def test_main_with_listing_cache(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("PYLS_LISTING_CACHE", str(tmp_path / "listing.sqlite"))
+    d = make_dir(tmp_path / "d", ["a", "b", "sub/"])
+
+    main(["-1", str(d)])
+    expected = capsys.readouterr().out
+    main(["--listing-cache", "-1", str(d)])
+    main(["--listing-cache", "-1", str(d)])
+
+    assert capsys.readouterr().out == expected * 2
+    assert (tmp_path / "listing.sqlite").exists()
+
+
+def test_unopenable_cache_falls_back_to_scandir(tmp_path, monkeypatch, capsys):
+    (tmp_path / "not-a-dir").touch()
+    monkeypatch.setenv("PYLS_LISTING_CACHE", str(tmp_path / "not-a-dir" / "listing.sqlite"))
+    d = make_dir(tmp_path / "d", ["a"])
+
+    main(["--listing-cache", "-1", str(d)])
+
+    captured = capsys.readouterr()
+    assert captured.out == "a\n"
+    assert "cannot open listing cache" in captured.err
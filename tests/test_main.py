@@ -0,0 +1,62 @@
+import subprocess
+import sys
+
+import pytest
+
+# 普通の一覧表示 (-l なし) では読み込まないモジュール
+HEAVY_MODULES = [
+    "xattr",
+    "cffi",
+    "datetime",
+    "concurrent.futures",
+    "shutil",
+    "numpy",
+    "dataclasses",
+    "inspect",
+    "pyls.instrument",
+    "pyls.json_output",
+    "json",
+    "pyls.index",
+    "sqlite3",
+]
+
+
+def loaded_modules(code: str) -> set[str]:
+    result = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint('\\n'.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.splitlines())
+
+
+def test_import_does_not_load_heavy_modules():
+    modules = loaded_modules("import pyls.main")
+
+    assert [m for m in HEAVY_MODULES if m in modules] == []
+
+
+@pytest.mark.parametrize("args", [["-1"], ["-a", "-w", "80"], ["-R", "-1"], ["-1", "-I", "*.o"]])
+def test_plain_listing_does_not_load_heavy_modules(tmp_path, args):
+    (tmp_path / "a.txt").touch()
+    (tmp_path / "sub").mkdir()
+
+    modules = loaded_modules(f"from pyls.main import main\nmain({args + [str(tmp_path)]!r})")
+
+    assert [m for m in HEAVY_MODULES if m in modules] == []
+
+
+def test_long_listing_loads_what_it_needs(tmp_path):
+    (tmp_path / "a.txt").touch()
+
+    modules = loaded_modules(f"from pyls.main import main\nmain(['-l', {str(tmp_path)!r}])")
+
+    assert {"xattr", "datetime"} <= modules
+
+
+def test_client_does_not_load_listing_code():
+    modules = loaded_modules("import pyls.client")
+
+    assert "pyls.main" not in modules
+    assert "json" not in modules
@@ -1,6 +1,11 @@
-from pyls.cli import build_parser
+import random
+
+import pytest
+
+from pyls.cli import DEFAULT_COLUMNS, build_parser, terminal_columns
 from pyls.core import scan_dir_children
 from pyls.output import (
+    column_layout,
     print_columns,
     print_directory,
     print_entries,
@@ -24,6 +29,17 @@ def test_print_entries_one_column(sample_00_dir, capsys):
     assert "dir_b" in lines
 
 
+def test_print_entries_presorted_keeps_order(sample_00_dir, capsys):
+    args = build_parser().parse_args(["-1"])
+    dir_entries, _ = scan_dir_children(sample_00_dir, args, entries=[])
+    reversed_entries = list(reversed(dir_entries.entries))
+
+    print_entries(reversed_entries, args, presorted=True)
+
+    lines = capsys.readouterr().out.strip().split("\n")
+    assert lines == [e.name for e in reversed_entries]
+
+
 def test_print_files_single_file(sample_00_dir, capsys):
     args = build_parser().parse_args([])
     files = [sample_00_dir / "file_0000.txt"]
@@ -173,3 +189,58 @@ def test_print_columns_empty_list(capsys):
 
     out = capsys.readouterr().out
     assert out == ""
+
+
+def reference_column_layout(names, terminal_width):
+    """以前の総当たり実装。1 カラムにも収まらない場合は None"""
+    max_cols = min(len(names), max(1, terminal_width // 3))
+    col_widths = {cols: [0] * cols for cols in range(1, max_cols + 1)}
+    valid = {cols: True for cols in range(1, max_cols + 1)}
+    for i, name in enumerate(names):
+        for cols in range(1, max_cols + 1):
+            if not valid[cols]:
+                continue
+            rows = (len(names) + cols - 1) // cols
+            col = i // rows
+            col_widths[cols][col] = max(col_widths[cols][col], len(name) + 2)
+            if sum(col_widths[cols]) - 2 > terminal_width:
+                valid[cols] = False
+    if not any(valid.values()):
+        return None
+    cols = max(c for c in range(1, max_cols + 1) if valid[c])
+    rows = (len(names) + cols - 1) // cols
+    return cols, rows, col_widths[cols]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_column_layout_matches_reference(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 300)
+    names = ["x" * rng.choice([1, 2, 3, 5, 8, 13, 21, 40]) for _ in range(n)]
+    terminal_width = rng.choice([20, 40, 80, 120, 250])
+
+    expected = reference_column_layout(names, terminal_width)
+    if expected is None:
+        expected = (1, n, [max(len(name) for name in names) + 2])
+
+    assert column_layout(names, terminal_width) == expected
+
+
+def test_column_layout_name_wider_than_terminal():
+    cols, rows, widths = column_layout(["a" * 100, "b"], terminal_width=80)
+
+    assert (cols, rows) == (1, 2)
+
+
+def test_print_columns_fills_columns_top_to_bottom(capsys):
+    print_columns(["a", "b", "c", "d", "e"], terminal_width=12)
+
+    # 4 カラム (2 行) で収まるので、3 列目も最終カラム扱いにはならない
+    assert capsys.readouterr().out == "a  c  e  \nb  d  "
+
+
+def test_terminal_columns_without_stdout(monkeypatch):
+    monkeypatch.delenv("COLUMNS", raising=False)
+    monkeypatch.setattr("sys.__stdout__", None)
+
+    assert terminal_columns() == DEFAULT_COLUMNS
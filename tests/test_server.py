@@ -0,0 +1,172 @@
+import io
+import os
+import threading
+
+import pytest
+
+from pyls import server
+from pyls.client import decode_request, encode_request, run_remote
+from pyls.main import handle_request, main
+
+
+@pytest.fixture
+def listing_server(tmp_path):
+    socket_path = str(tmp_path / "s.sock")
+    srv = server.ListingServer(socket_path, handle_request, server.CacheValidator())
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield socket_path
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+def remote(socket_path, argv):
+    stdout, stderr = io.BytesIO(), io.BytesIO()
+    status = run_remote(argv, socket_path, stdout, stderr)
+    return status, stdout.getvalue().decode(), stderr.getvalue().decode()
+
+
+def test_request_round_trip():
+    payload = encode_request(["-l", "", "caf\udce9"], "/tmp", True, {"COLUMNS": "80", "TZ": None})
+
+    assert decode_request(payload) == (["-l", "", "caf\udce9"], "/tmp", True, {"COLUMNS": "80", "TZ": None})
+    assert decode_request(encode_request([], "/", False, {}))[0] == []
+
+
+def test_remote_output_matches_local(listing_server, tmp_path, capsys):
+    (tmp_path / "a.txt").write_text("hello")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "b").touch()
+
+    main(["-laR", str(tmp_path)])
+    expected = capsys.readouterr().out
+
+    status, out, err = remote(listing_server, ["-laR", str(tmp_path)])
+
+    assert (status, err) == (0, "")
+    assert out == expected
+
+
+def test_remote_uses_client_cwd(listing_server, tmp_path, monkeypatch):
+    (tmp_path / "here").touch()
+    monkeypatch.chdir(tmp_path)
+
+    status, out, _ = remote(listing_server, ["-1", "here"])
+
+    assert (status, out) == (0, "here\n")
+    assert os.getcwd() == str(tmp_path)
+
+
+def test_remote_exit_status(listing_server, tmp_path):
+    status, out, err = remote(listing_server, ["--no-such-option"])
+    assert status == 2
+    assert "usage:" in err
+
+    status, _, err = remote(listing_server, ["--server"])
+    assert status == 2
+    assert "--server" in err
+
+    # pyls はアクセスできないパスのメッセージを stdout に出す
+    _, out, _ = remote(listing_server, ["-1", str(tmp_path / "missing")])
+    assert "cannot access" in out
+
+    # サーバーは前のリクエストのあとも動き続ける
+    assert remote(listing_server, ["-1", str(tmp_path)])[0] == 0
+
+
+@pytest.mark.parametrize("argv", [["--profile"], ["--trace-file", "trace.json"]])
+def test_remote_refuses_instrumentation(listing_server, tmp_path, monkeypatch, argv):
+    monkeypatch.chdir(tmp_path)
+    status, _, err = remote(listing_server, [*argv, "-1"])
+
+    assert status == 2
+    assert argv[0] in err
+    assert not (tmp_path / "trace.json").exists()
+
+
+def test_remote_ignores_server_profile_env(listing_server, tmp_path, monkeypatch):
+    monkeypatch.setenv("PYLS_PROFILE", "1")
+    (tmp_path / "d").mkdir()
+    (tmp_path / "d" / "a").touch()
+
+    status, out, err = remote(listing_server, ["-1", str(tmp_path / "d")])
+
+    assert (status, out, err) == (0, "a\n", "")
+
+
+@pytest.mark.parametrize("argv", [["--profile"], ["--trace-file", "trace.json"]])
+def test_server_refuses_instrumentation(tmp_path, capsys, argv):
+    assert main(["--server", "--socket", str(tmp_path / "s.sock"), *argv]) == 2
+
+    assert argv[0] in capsys.readouterr().err
+    assert not (tmp_path / "s.sock").exists()
+
+
+def test_cache_validator_clears_on_change(tmp_path, monkeypatch):
+    passwd = tmp_path / "passwd"
+    passwd.write_text("root:x:0:0::/root:/bin/sh\n")
+    cleared = []
+    monkeypatch.setattr(server, "clear_owner_name_cache", lambda: cleared.append("owner"))
+    monkeypatch.setattr(server, "clear_xattr_support_cache", lambda: cleared.append("xattr"))
+    validator = server.CacheValidator(paths=(str(passwd),), ttl=3600)
+
+    assert validator.refresh() is True
+    assert validator.refresh() is False
+
+    passwd.write_text("root:x:0:0::/root:/bin/sh\nalice:x:1000:1000::/home/alice:/bin/sh\n")
+
+    assert validator.refresh() is True
+    assert cleared == ["owner", "xattr", "owner", "xattr"]
+
+
+def test_cache_validator_expires(tmp_path):
+    validator = server.CacheValidator(paths=(str(tmp_path / "missing"),), ttl=0)
+
+    assert validator.refresh() is True
+    assert validator.refresh() is True
+
+
+def test_remove_stale_socket(tmp_path):
+    import socket
+
+    path = str(tmp_path / "stale.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+
+    server.remove_stale_socket(path)
+
+    assert not os.path.exists(path)
+
+
+def test_remove_stale_socket_refuses_regular_file(tmp_path):
+    path = tmp_path / "file"
+    path.touch()
+
+    with pytest.raises(FileExistsError):
+        server.remove_stale_socket(str(path))
+
+
+def test_listening_socket_is_private(listing_server):
+    assert os.stat(listing_server).st_mode & 0o777 == 0o700
+
+
+def test_server_close_removes_socket(tmp_path):
+    socket_path = str(tmp_path / "s.sock")
+    srv = server.ListingServer(socket_path, handle_request, server.CacheValidator())
+
+    srv.server_close()
+
+    assert not os.path.exists(socket_path)
+
+
+def test_text_stream_names_like_std_streams():
+    import socket
+
+    from pyls.client import STDERR, STDOUT
+
+    a, b = socket.socketpair()
+    with a, b:
+        assert server.text_stream(a, STDOUT, False).name == "<stdout>"
+        assert server.text_stream(a, STDERR, False).name == "<stderr>"
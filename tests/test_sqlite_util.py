@@ -0,0 +1,11 @@
+import pytest
+
+from pyls.sqlite_util import python_int, sqlite_int
+
+
+@pytest.mark.parametrize("value", [0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1])
+def test_round_trip(value):
+    stored = sqlite_int(value)
+
+    assert -(1 << 63) <= stored < 1 << 63
+    assert python_int(stored) == value
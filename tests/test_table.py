@@ -0,0 +1,87 @@
+import os
+from pathlib import Path
+
+from conftest import MockOpts, make_file_entry, make_file_status
+
+from pyls.core import scan_dir_children
+from pyls.filter import filter_ignored, iter_display_entries
+from pyls.format import calculate_total_blocks
+from pyls.table import EntryTable
+from pyls.types import FileStatus
+
+
+def test_append_stat_matches_file_status_from_lstat(tmp_path):
+    target = tmp_path / "a.txt"
+    target.write_text("hello")
+    os.utime(target, ns=(1_700_000_000_123_456_789, 1_700_000_000_987_654_321))
+    st = target.lstat()
+
+    table = EntryTable(tmp_path)
+    table.append_stat("a.txt", st)
+
+    row = table[0]
+    assert row.name == "a.txt"
+    assert row.path == target
+    assert row.is_dir is False
+    # float の mtime まで FileStatus.from_stat_result と一致する
+    assert row.file_status.to_file_status() == FileStatus.from_stat_result(st)
+    assert row.file_status.mtime == st.st_mtime
+
+
+def test_append_keeps_paths_that_differ_from_dir_path(tmp_path):
+    table = EntryTable(tmp_path)
+    table.append(make_file_entry(tmp_path, name=".", is_dir=True))
+    table.append(make_file_entry(tmp_path.parent, name="..", is_dir=True))
+    table.append(make_file_entry(tmp_path / "b", name="b"))
+
+    # dir_path / "." は dir_path と等しいので、上書きが要るのは .. だけ
+    assert table.paths == {1: tmp_path.parent}
+    assert [row.path for row in table] == [tmp_path, tmp_path.parent, tmp_path / "b"]
+
+
+def test_take_reorders_every_column_and_path_override(tmp_path):
+    table = EntryTable(tmp_path)
+    table.append(make_file_entry(Path("/elsewhere/x"), name="x", file_status=make_file_status(size=1)))
+    table.append(make_file_entry(tmp_path / "y", name="y", file_status=make_file_status(size=2)))
+
+    taken = table.take([1, 0])
+
+    assert taken.names == ["y", "x"]
+    assert list(taken.size) == [2, 1]
+    assert taken[1].path == Path("/elsewhere/x")
+    assert taken[-1].to_file_entry() == table[0].to_file_entry()
+
+
+def test_sort_and_filter_on_table_match_list_of_entries(tmp_path):
+    entries = [
+        make_file_entry(tmp_path / name, file_status=make_file_status(size=size, mtime=mtime, blocks=blocks))
+        for name, size, mtime, blocks in [
+            ("b.py", 30, 3.0, 8),
+            ("A.txt", 10, 1.5, 0),
+            ("c.o", 20, 2.0, 16),
+            ("file10", 20, 2.0, 8),
+            ("file9", 0, 5.0, 8),
+        ]
+    ]
+    table = EntryTable(tmp_path)
+    table.extend(entries)
+
+    for sort in (None, "time", "size", "extension", "version", "size,name"):
+        for reverse in (False, True):
+            opts = MockOpts(sort=sort, reverse=reverse, ignore=["*.o"])
+            expected = [e.name for e in iter_display_entries(filter_ignored(entries, opts), opts)]
+            actual = iter_display_entries(filter_ignored(table, opts), opts)
+            assert isinstance(actual, EntryTable)
+            assert actual.names == expected
+
+    assert calculate_total_blocks(table) == calculate_total_blocks(entries)
+
+
+def test_scan_dir_children_into_table(sample_00_dir):
+    opts = MockOpts(long=True)
+
+    listed, _ = scan_dir_children(sample_00_dir, opts, entries=[])
+    tabled, _ = scan_dir_children(sample_00_dir, opts, entries=EntryTable(sample_00_dir))
+
+    assert isinstance(tabled.entries, EntryTable)
+    assert [row.to_file_entry() for row in tabled.entries] == listed.entries
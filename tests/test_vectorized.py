@@ -0,0 +1,126 @@
+import random
+import time
+from pathlib import Path
+
+import pytest
+from conftest import MockOpts, make_file_entry, make_file_status
+
+from pyls.format import format_long_line, human_readable_size, max_width
+from pyls.output import print_entries
+from pyls.table import EntryTable
+
+np = pytest.importorskip("numpy")
+
+from pyls import vectorized  # noqa: E402
+from pyls.vectorized import human_readable_sizes, load_numpy, long_format_lines  # noqa: E402
+
+load_numpy()
+
+EDGE_SIZES = [
+    0,
+    1,
+    1023,
+    1024,
+    1025,
+    10 * 1024 - 1,
+    10 * 1024,
+    10 * 1024 + 51,
+    10 * 1024 + 52,
+    # .1f / .0f のちょうど半分 (偶数丸め)
+    1024 + 51 * 1024 // 1024,
+    3 * 1024 // 2 * 1024 // 10 + 1024,
+    1024 * 1024 - 1,
+    1024 * 1024 - 512,
+    1024**2,
+    1024**3 * 5 + 1024**2 * 25 // 10,
+    1024**4 * 999,
+    1024**5 * 7,
+    1 << 53,
+    (1 << 62) + 12345,
+]
+
+
+def make_table(count: int, seed: int = 0) -> EntryTable:
+    rng = random.Random(seed)
+    now = time.time()
+    table = EntryTable(Path("/virtual"))
+    for i in range(count):
+        status = make_file_status(
+            mode=rng.choice([0o100644, 0o040755, 0o120777, 0o104755, 0o020600]),
+            nlink=rng.randint(1, 3000),
+            uid=rng.choice([0, 1000, 4242424]),
+            gid=rng.choice([0, 1000, 4242424]),
+            size=EDGE_SIZES[i] if i < len(EDGE_SIZES) else rng.randint(0, 1 << 40),
+            # 最近 / 6 か月以上前 / 未来が混ざるようにする
+            mtime=now + rng.uniform(-3e8, 1e6),
+            atime=now - rng.uniform(0, 1e8),
+            ctime=rng.uniform(0, now),
+            blocks=rng.randint(0, 1 << 20),
+        )
+        table.append(make_file_entry(Path(f"/virtual/f{i}"), file_status=status))
+    return table
+
+
+def python_long_format_lines(table: EntryTable, opts):
+    lines = [format_long_line(entry, opts, "") for entry in table]
+    widths = {
+        "nlink": max_width(lines, lambda x: x.nlink),
+        "owner": max_width(lines, lambda x: x.owner),
+        "group": max_width(lines, lambda x: x.group),
+        "size": max_width(lines, lambda x: x.size),
+    }
+    return lines, widths
+
+
+def test_human_readable_sizes_match_python():
+    rng = random.Random(1)
+    sizes = EDGE_SIZES + [rng.randint(0, 1 << rng.randint(1, 62)) for _ in range(20000)]
+
+    actual = human_readable_sizes(np.array(sizes, dtype=np.int64)).tolist()
+
+    assert actual == [human_readable_size(size) for size in sizes]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"human_readable": True},
+        {"numeric_uid_gid": True, "time": "atime"},
+        {"no_owner": True, "no_group": True, "time": "ctime"},
+        {"time_style": "long-iso"},
+        {"time_style": "full-iso"},
+        {"time_style": "+%Y %H:%M:%S"},
+    ],
+)
+def test_long_format_lines_match_python(options):
+    opts = MockOpts(long=True, **options)
+    table = make_table(3000)
+
+    lines, widths = long_format_lines(table, opts, [""] * len(table))
+
+    assert (lines, widths) == python_long_format_lines(table, opts)
+
+
+def test_negative_timestamps_fall_back_to_per_entry_formatting():
+    opts = MockOpts(long=True)
+    table = EntryTable(Path("/virtual"))
+    for mtime in (-1.5, 0.0, 60.25, -86400 * 365 * 80.0):
+        table.append(make_file_entry(Path(f"/virtual/{mtime}"), file_status=make_file_status(mtime=mtime)))
+
+    lines, _ = long_format_lines(table, opts, [""] * len(table))
+
+    assert [line.time for line in lines] == [line.time for line in python_long_format_lines(table, opts)[0]]
+
+
+def test_print_entries_output_is_identical_with_and_without_numpy(monkeypatch, capsys):
+    opts = MockOpts(long=True, human_readable=True, no_xattr=True)
+    table = make_table(2000)
+
+    print_entries(table, opts, presorted=True)
+    vectorized_output = capsys.readouterr().out
+
+    monkeypatch.setattr(vectorized, "load_numpy", lambda: False)
+    print_entries(table, opts, presorted=True)
+
+    assert capsys.readouterr().out == vectorized_output
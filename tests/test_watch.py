@@ -0,0 +1,99 @@
+import os
+import struct
+import sys
+import threading
+import time
+
+import pytest
+from conftest import MockOpts
+
+from pyls import watch
+from pyls.main import main
+from pyls.watch import IN_CREATE, IN_DELETE_SELF, IN_Q_OVERFLOW, InotifyEvent, WatchedDir, parse_events
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+
+def names(entries):
+    return [entry.name for entry in entries]
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_parse_events():
+    data = struct.pack("iIII", 1, IN_CREATE, 0, 16) + b"new.txt".ljust(16, b"\0")
+    data += struct.pack("iIII", 1, IN_DELETE_SELF, 0, 0)
+
+    assert parse_events(data) == [InotifyEvent(1, IN_CREATE, 0, "new.txt"), InotifyEvent(1, IN_DELETE_SELF, 0, "")]
+
+
+def test_watched_dir_updates_only_changed_names(tmp_path, monkeypatch):
+    (tmp_path / "a").touch()
+    (tmp_path / "b").touch()
+    watched = WatchedDir(tmp_path, MockOpts(ignore=["*.o"]))
+    watched.rescan()
+    monkeypatch.setattr(watch, "scan_dir_children", None)
+
+    (tmp_path / "a").unlink()
+    (tmp_path / "c").mkdir()
+    (tmp_path / "x.o").touch()
+    (tmp_path / ".hidden").touch()
+    events = [InotifyEvent(1, IN_CREATE, 0, name) for name in ["a", "c", "x.o", ".hidden"]]
+
+    assert watched.apply(events) is True
+    assert names(watched.display_entries()) == ["b", "c"]
+    assert watched.entries["c"].is_dir
+
+
+def test_watched_dir_rescans_on_overflow(tmp_path):
+    watched = WatchedDir(tmp_path, MockOpts())
+    watched.rescan()
+    (tmp_path / "missed").touch()
+
+    assert watched.apply([InotifyEvent(-1, IN_Q_OVERFLOW, 0, "")]) is True
+    assert names(watched.display_entries()) == ["missed"]
+
+
+def test_watched_dir_stops_when_directory_is_removed(tmp_path):
+    watched = WatchedDir(tmp_path, MockOpts())
+
+    assert watched.apply([InotifyEvent(1, IN_DELETE_SELF, 0, "")]) is False
+
+
+def test_watch_renders_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, "DEBOUNCE_SECONDS", 0.01)
+    d = tmp_path / "d"
+    d.mkdir()
+    (d / "old").touch()
+    frames = []
+    result = []
+    thread = threading.Thread(
+        target=lambda: result.append(watch.watch(d, MockOpts(long=True), lambda e: frames.append(names(e)))),
+        daemon=True,
+    )
+    thread.start()
+    wait_for(lambda: frames)
+
+    (d / "new").write_text("x")
+    wait_for(lambda: "new" in frames[-1])
+    os.rename(d / "old", d / "renamed")
+    wait_for(lambda: frames[-1] == ["new", "renamed"])
+    for name in ["new", "renamed"]:
+        (d / name).unlink()
+    d.rmdir()
+    thread.join(5)
+
+    assert frames[0] == ["old"]
+    assert not thread.is_alive()
+    assert result == [1]
+
+
+def test_watch_rejects_multiple_paths(tmp_path, capsys):
+    assert main(["--watch", str(tmp_path), str(tmp_path)]) == 2
+    assert "--watch" in capsys.readouterr().err
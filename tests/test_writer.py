@@ -0,0 +1,114 @@
+import io
+import sys
+
+from pyls.writer import OutputWriter
+
+
+class RecordingStream(io.TextIOWrapper):
+    """書き込みを (ストリーム名, バイト列) として共有のログに記録する"""
+
+    def __init__(self, name: str, log: list, tty: bool = False) -> None:
+        # write_through なので write() のたびにそのまま buffer.write (= _record) が呼ばれる
+        super().__init__(io.BytesIO(), encoding="utf-8", write_through=True)
+        self.name_ = name
+        self.log = log
+        self.tty = tty
+        self.buffer.write = self._record  # type: ignore[method-assign]
+
+    def _record(self, data: bytes) -> int:
+        self.log.append((self.name_, bytes(data)))
+        return len(data)
+
+    def isatty(self) -> bool:
+        return self.tty
+
+
+def install_streams(monkeypatch, tty: bool = False) -> list:
+    log: list = []
+    monkeypatch.setattr(sys, "stdout", RecordingStream("out", log, tty=tty))
+    monkeypatch.setattr(sys, "stderr", RecordingStream("err", log))
+    return log
+
+
+def test_write_outside_batch_is_flushed_immediately(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter()
+
+    writer.line("a")
+    writer.line("b")
+
+    assert log == [("out", b"a\n"), ("out", b"b\n")]
+
+
+def test_batch_writes_one_block_when_not_a_tty(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter()
+
+    with writer.batch():
+        for name in ("a", "b", "c"):
+            writer.line(name)
+        assert log == []
+
+    assert log == [("out", b"a\nb\nc\n")]
+
+
+def test_batch_is_line_buffered_on_a_tty(monkeypatch):
+    log = install_streams(monkeypatch, tty=True)
+    writer = OutputWriter()
+
+    with writer.batch():
+        writer.write("a  ")
+        writer.write("b")
+        writer.line()
+        writer.write("c")
+        assert log == [("out", b"a  b\n")]
+
+    assert log == [("out", b"a  b\n"), ("out", b"c")]
+
+
+def test_batch_flushes_when_block_is_full(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter(block_size=8)
+
+    with writer.batch():
+        writer.line("1234")
+        writer.line("5678")
+        assert log == [("out", b"1234\n5678\n")]
+        writer.line("9")
+
+    assert log == [("out", b"1234\n5678\n"), ("out", b"9\n")]
+
+
+def test_nested_batches_flush_at_the_outermost(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter()
+
+    with writer.batch():
+        with writer.batch():
+            writer.line("a")
+        assert log == []
+
+    assert log == [("out", b"a\n")]
+
+
+def test_error_flushes_stdout_first(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter()
+
+    with writer.batch():
+        writer.line("before")
+        writer.error("pyls: oops")
+        writer.line("after")
+
+    assert [name for name, _ in log] == ["out", "err", "err", "out"]
+    assert log[0] == ("out", b"before\n")
+    assert log[-1] == ("out", b"after\n")
+
+
+def test_undecodable_names_are_written_as_raw_bytes(monkeypatch):
+    log = install_streams(monkeypatch)
+    writer = OutputWriter()
+
+    writer.line(b"caf\xe9".decode("utf-8", "surrogateescape"))
+
+    assert log == [("out", b"caf\xe9\n")]